@@ -146,6 +146,26 @@ class AtlasDataUploader:
                 (':' in value) and
                 (value.endswith('Z') or '+' in value[-6:] or value.count('-') >= 2))
     
+    def add_facility_locations(self):
+        """Derive the GeoJSON location field from latitude/longitude for 2dsphere queries"""
+        print("Adding GeoJSON locations to facilities...")
+        
+        try:
+            result = self.db['facilities'].update_many(
+                {
+                    'location': {'$exists': False},
+                    'latitude': {'$type': 'number'},
+                    'longitude': {'$type': 'number'}
+                },
+                [{'$set': {'location': {
+                    'type': 'Point',
+                    'coordinates': ['$longitude', '$latitude']  # GeoJSON order is [lng, lat]
+                }}}]
+            )
+            print(f"Added locations to {result.modified_count} facilities")
+        except Exception as e:
+            print(f"Error adding facility locations: {e}")
+    
     def create_hospital_indexes(self):
         """Create optimized indexes for hospital/facility data"""
         print("Creating hospital facility indexes...")
@@ -158,7 +178,8 @@ class AtlasDataUploader:
             ('facilities', [('Ownership_type', 1)]),
             ('facilities', [('Facility_type', 1)]),
             ('facilities', [('Level_of_care', 1)]),
-            ('facilities', [('latitude', 1), ('longitude', 1)]),  # Geospatial queries
+            ('facilities', [('latitude', 1), ('longitude', 1)]),
+            ('facilities', [('location', '2dsphere'), ('has_emergency', 1)]),  # $geoNear queries
             ('facilities', [('has_emergency', 1)]),
             ('facilities', [('specialties', 1)]),
             ('facilities', [('rating', -1)]),
@@ -291,6 +312,7 @@ class AtlasDataUploader:
                 print(f"Warning: {collection_name} not found in data")
         
         # Create hospital-specific indexes
+        self.add_facility_locations()
         self.create_hospital_indexes()
         
         total_time = time.time() - overall_start
@@ -346,6 +368,7 @@ class AtlasDataUploader:
         
         # Also create hospital indexes if hospital data is present
         if any(col in data for col in ['facilities', 'departments', 'staff', 'equipment']):
+            self.add_facility_locations()
             self.create_hospital_indexes()
         
         total_time = time.time() - overall_start
@@ -0,0 +1,349 @@
+"""
+Priority Admission Control and Load Shedding
+Bounds how many requests of each route class run at once, admits emergency
+routing and triage ahead of everything else, and answers dashboard, listing
+and analytics requests with 503 + Retry-After once their queue wait would
+exceed its latency target
+
+A waiting request still holds its worker thread under gunicorn's gthread
+workers, so the classes that can be shed may occupy (run or wait in) at most
+capacity - reserved slots between them. The reserved slots, and the threads
+behind them, are always left free for the critical class, which is never shed.
+Long-lived requests that bypass the route classes (SSE streams) take a held
+slot out of that same shared budget for as long as they stay open.
+
+Configuration (environment):
+    ADMISSION_CONTROL                 on | off (default on)
+    ADMISSION_CAPACITY                requests admitted at once (default: the server's)
+    ADMISSION_RESERVED                slots only critical routes may use (default 2)
+    ADMISSION_<CLASS>_CONCURRENCY     requests of the class admitted at once
+    ADMISSION_<CLASS>_MAX_WAIT_MS     the class's queue latency target
+"""
+
+import asyncio
+import bisect
+import itertools
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence
+
+from metrics import ADMISSION_QUEUE_WAIT
+
+CRITICAL = 'critical'
+STANDARD = 'standard'
+LISTING = 'listing'
+ANALYTICS = 'analytics'
+
+DEFAULT_RESERVED = 2
+
+# Routes that pay for themselves in a surge; everything else is classed by method
+CRITICAL_ROUTES = frozenset({
+    ('POST', '/api/emergency-hospitals'),
+    ('POST', '/api/triage/assess'),
+})
+ANALYTICS_ROUTES = frozenset({
+    ('GET', '/api/stats'),
+    ('GET', '/api/export/<dataset>'),
+})
+# Probes and scrapes must answer during a surge, and an SSE stream would hold a slot for hours
+EXEMPT_ROUTES = frozenset({
+    ('GET', '/api/health'),
+    ('GET', '/api/health/live'),
+    ('GET', '/api/health/ready'),
+    ('GET', '/api/metrics'),
+    ('GET', '/api/cache/stats'),
+    ('GET', '/api/capacity/stream'),
+})
+
+# Weight of the latest request in the per-class service time average
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+def route_class(method: str, rule: Optional[str]) -> Optional[str]:
+    """Admission class of a matched route; None when the request is not admission-controlled"""
+    if rule is None or method in ('OPTIONS', 'HEAD'):
+        return None
+    key = (method, rule)
+    if key in EXEMPT_ROUTES:
+        return None
+    if key in CRITICAL_ROUTES:
+        return CRITICAL
+    if key in ANALYTICS_ROUTES:
+        return ANALYTICS
+    return LISTING if method == 'GET' else STANDARD
+
+
+@dataclass(frozen=True)
+class AdmissionClass:
+    name: str
+    priority: int  # lower is admitted first
+    max_concurrency: int
+    max_wait: Optional[float] = None  # seconds; None waits for a slot however long it takes
+    critical: bool = False  # never shed, and may use the reserved slots
+
+
+def admission_classes(capacity: int, reserved: int = DEFAULT_RESERVED) -> Sequence[AdmissionClass]:
+    """The four route classes, with defaults scaled to capacity and ADMISSION_<CLASS>_* overrides"""
+    shared = max(1, capacity - reserved)
+    defaults = (
+        (CRITICAL, 0, capacity, None),
+        (STANDARD, 1, shared, 1000),
+        (LISTING, 2, max(1, shared // 2), 250),
+        (ANALYTICS, 3, max(1, shared // 4), 100),
+    )
+    classes = []
+    for name, priority, concurrency, max_wait_ms in defaults:
+        prefix = f'ADMISSION_{name.upper()}_'
+        concurrency = int(os.environ.get(prefix + 'CONCURRENCY', concurrency))
+        if max_wait_ms is not None:
+            max_wait_ms = float(os.environ.get(prefix + 'MAX_WAIT_MS', max_wait_ms))
+        classes.append(AdmissionClass(
+            name, priority, max(1, concurrency),
+            None if max_wait_ms is None else max_wait_ms / 1000,
+            critical=name == CRITICAL
+        ))
+    return classes
+
+
+def admission_enabled() -> bool:
+    return os.environ.get('ADMISSION_CONTROL', 'on').lower() not in ('off', '0', 'false')
+
+
+class AdmissionRejected(Exception):
+    """The request was shed; answer 503 with Retry-After"""
+
+    def __init__(self, route_class: str, reason: str, retry_after: int):
+        super().__init__(f'{route_class} request shed ({reason})')
+        self.route_class = route_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class AdmissionTicket:
+    route_class: str
+    admitted_at: float
+
+
+class _Waiter:
+    __slots__ = ('route_class', 'wakeup', 'granted')
+
+    def __init__(self, route_class: AdmissionClass, wakeup):
+        self.route_class = route_class
+        self.wakeup = wakeup
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    Per-class concurrency limits over one shared pool of slots. A freed slot
+    goes to the waiting request of the highest priority class that fits;
+    within a class, requests are admitted in arrival order.
+    """
+
+    def __init__(self, classes: Sequence[AdmissionClass], capacity: int, reserved: int = DEFAULT_RESERVED):
+        self.classes: Dict[str, AdmissionClass] = {route_class.name: route_class for route_class in classes}
+        self.capacity = capacity
+        self.reserved = min(reserved, capacity - 1)
+        self.shared_limit = capacity - self.reserved
+
+        self._lock = threading.Lock()
+        self._running = {name: 0 for name in self.classes}
+        self._held = 0  # long-lived requests outside the classes, e.g. SSE streams
+        self._queued = {name: 0 for name in self.classes}
+        self._waiters = []  # (priority, seq, waiter), kept sorted
+        self._seq = itertools.count()
+        self._service_time = {name: 0.0 for name in self.classes}
+
+        # Metrics
+        self.admitted = {name: 0 for name in self.classes}
+        self.shed: Dict[str, Dict[str, int]] = {name: {} for name in self.classes}
+
+    # Policy (callers hold the lock)
+
+    def _occupied(self) -> int:
+        return sum(self._running.values()) + self._held
+
+    def _shared_occupancy(self, include_queued: bool) -> int:
+        return self._held + sum(
+            self._running[name] + (self._queued[name] if include_queued else 0)
+            for name, route_class in self.classes.items() if not route_class.critical
+        )
+
+    def _fits(self, route_class: AdmissionClass) -> bool:
+        if self._occupied() >= self.capacity:
+            return False
+        if self._running[route_class.name] >= route_class.max_concurrency:
+            return False
+        return route_class.critical or self._shared_occupancy(False) < self.shared_limit
+
+    def _waiting_ahead(self, route_class: AdmissionClass) -> int:
+        return sum(1 for priority, _, _ in self._waiters if priority <= route_class.priority)
+
+    def _estimated_wait(self, route_class: AdmissionClass) -> float:
+        position = self._waiting_ahead(route_class) + 1
+        return position * self._service_time[route_class.name] / route_class.max_concurrency
+
+    def _ticket(self, route_class: AdmissionClass) -> AdmissionTicket:
+        self.admitted[route_class.name] += 1
+        return AdmissionTicket(route_class.name, time.monotonic())
+
+    def _reject(self, route_class: AdmissionClass, reason: str) -> AdmissionRejected:
+        counts = self.shed[route_class.name]
+        counts[reason] = counts.get(reason, 0) + 1
+        retry_after = max(1, math.ceil(self._estimated_wait(route_class)))
+        return AdmissionRejected(route_class.name, reason, retry_after)
+
+    def _try_admit(self, name: str):
+        """A ticket if the request runs now, a queued waiter if it may wait, or AdmissionRejected"""
+        route_class = self.classes[name]
+        if not self._waiting_ahead(route_class) and self._fits(route_class):
+            self._running[name] += 1
+            return self._ticket(route_class), None
+
+        if not route_class.critical:
+            if self._shared_occupancy(True) >= self.shared_limit:
+                raise self._reject(route_class, 'queue_full')
+            if self._estimated_wait(route_class) > route_class.max_wait:
+                raise self._reject(route_class, 'latency')
+
+        waiter = _Waiter(route_class, self._new_wakeup())
+        bisect.insort(self._waiters, (route_class.priority, next(self._seq), waiter))
+        self._queued[name] += 1
+        # The waiters ahead may be held back only by their own class limit
+        self._dispatch()
+        if waiter.granted:
+            return self._ticket(route_class), None
+        return None, waiter
+
+    def _dequeue(self, waiter: _Waiter):
+        self._waiters = [entry for entry in self._waiters if entry[2] is not waiter]
+        self._queued[waiter.route_class.name] -= 1
+
+    def _dispatch(self):
+        """Hand free slots to waiters, highest priority first"""
+        for entry in list(self._waiters):
+            if self._occupied() >= self.capacity:
+                break
+            waiter = entry[2]
+            if self._fits(waiter.route_class):
+                self._dequeue(waiter)
+                self._running[waiter.route_class.name] += 1
+                waiter.granted = True
+                self._wake(waiter)
+
+    def _finish_wait(self, waiter: _Waiter, started: float) -> AdmissionTicket:
+        """After the wait, with the lock held: the ticket, or AdmissionRejected when the wait ran out"""
+        route_class = waiter.route_class
+        ADMISSION_QUEUE_WAIT.observe(time.monotonic() - started, route_class=route_class.name)
+        if waiter.granted:
+            return self._ticket(route_class)
+        self._dequeue(waiter)
+        raise self._reject(route_class, 'timeout')
+
+    # Waiting (threads)
+
+    def _new_wakeup(self):
+        return threading.Event()
+
+    def _wake(self, waiter: _Waiter):
+        waiter.wakeup.set()
+
+    def acquire(self, name: str) -> AdmissionTicket:
+        """Block until the request may run; raises AdmissionRejected when it is shed"""
+        with self._lock:
+            ticket, waiter = self._try_admit(name)
+        if ticket is not None:
+            return ticket
+
+        started = time.monotonic()
+        waiter.wakeup.wait(waiter.route_class.max_wait)
+        with self._lock:
+            return self._finish_wait(waiter, started)
+
+    def release(self, ticket: Optional[AdmissionTicket]):
+        if ticket is None:
+            return
+        held = time.monotonic() - ticket.admitted_at
+        with self._lock:
+            self._running[ticket.route_class] -= 1
+            average = self._service_time[ticket.route_class]
+            self._service_time[ticket.route_class] = held if not average else (
+                average + SERVICE_TIME_SMOOTHING * (held - average))
+            self._dispatch()
+
+    def hold(self) -> bool:
+        """
+        Take a shared slot for a long-lived request outside the route classes
+        (an SSE stream) until unhold(); False when the shared budget is full.
+        Never waits and never touches the reserved slots.
+        """
+        with self._lock:
+            if self._shared_occupancy(True) >= self.shared_limit:
+                return False
+            self._held += 1
+            return True
+
+    def unhold(self):
+        with self._lock:
+            self._held -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'capacity': self.capacity,
+                'reserved': self.reserved,
+                'held': self._held,
+                'classes': {
+                    name: {
+                        'running': self._running[name],
+                        'queued': self._queued[name],
+                        'max_concurrency': route_class.max_concurrency,
+                        'max_wait_ms': None if route_class.max_wait is None else route_class.max_wait * 1000,
+                        'service_time_ms': round(self._service_time[name] * 1000, 2),
+                        'admitted': self.admitted[name],
+                        'shed': dict(self.shed[name])
+                    }
+                    for name, route_class in self.classes.items()
+                }
+            }
+
+
+class AsyncAdmissionController(AdmissionController):
+    """The same admission policy for the ASGI server; waiters park on futures instead of threads"""
+
+    def _new_wakeup(self):
+        return asyncio.get_running_loop().create_future()
+
+    def _wake(self, waiter: _Waiter):
+        # release() always runs on the serving loop, as do the waiters
+        if not waiter.wakeup.done():
+            waiter.wakeup.set_result(True)
+
+    async def acquire(self, name: str) -> AdmissionTicket:
+        with self._lock:
+            ticket, waiter = self._try_admit(name)
+        if ticket is not None:
+            return ticket
+
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.wakeup), waiter.route_class.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # Client went away while queued: give back whatever it was granted
+            with self._lock:
+                if waiter.granted:
+                    self._running[waiter.route_class.name] -= 1
+                    self._dispatch()
+                else:
+                    self._dequeue(waiter)
+            raise
+
+        with self._lock:
+            return self._finish_wait(waiter, started)
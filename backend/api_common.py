@@ -0,0 +1,926 @@
+"""
+Shared Request Parsing and Response Formatting for the MedRoute API
+Pure helpers used by both the Flask server and its ASGI variant, so the
+two builds answer with the same JSON for the same URLs
+"""
+
+from bson import ObjectId
+from datetime import datetime
+import uuid
+import re
+import json
+import base64
+import csv
+import io
+import zlib
+
+from json_provider import dumps
+from spatial_index import haversine_km
+
+# Helper functions
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """Haversine distance in kilometers; NumPy array arguments are measured element-wise"""
+    return haversine_km(lat1, lon1, lat2, lon2)
+
+def get_city_coordinates(city):
+    """Get coordinates for South African cities"""
+    city_coords = {
+        'Johannesburg': {'lat': -26.2041, 'lng': 28.0473},
+        'Cape Town': {'lat': -33.9249, 'lng': 18.4241},
+        'Durban': {'lat': -29.8587, 'lng': 31.0218},
+        'Pretoria': {'lat': -25.7461, 'lng': 28.1881},
+        'Port Elizabeth': {'lat': -33.9608, 'lng': 25.6022},
+        'Bloemfontein': {'lat': -29.0852, 'lng': 26.1596},
+        'Polokwane': {'lat': -23.9045, 'lng': 29.4689},
+        'Nelspruit': {'lat': -25.4753, 'lng': 30.9700},
+        'Kimberley': {'lat': -28.7282, 'lng': 24.7499},
+        'Rustenburg': {'lat': -25.6672, 'lng': 27.2424}
+    }
+    return city_coords.get(city, city_coords['Johannesburg'])
+
+def map_facility_type_to_emergency_level(facility_type, level_of_care):
+    """Map facility type to emergency level"""
+    if facility_type == 'Emergency Center':
+        return 'Level 2 Trauma Center'
+    elif level_of_care == 'Tertiary':
+        return 'Level 1 Trauma Center'
+    elif level_of_care == 'Secondary':
+        return 'Level 2 Trauma Center'
+    elif facility_type == 'Hospital':
+        return 'Level 3 Trauma Center'
+    else:
+        return 'Basic Emergency Care'
+
+def get_facility_coordinates(facility):
+    """Use the facility's own coordinates, falling back to its city centre"""
+    if facility.get('latitude') is not None and facility.get('longitude') is not None:
+        return {'lat': facility['latitude'], 'lng': facility['longitude']}
+    return get_city_coordinates(facility.get('City', 'Johannesburg'))
+
+def facility_location(facility):
+    """GeoJSON point for $geoNear: the stored location, or one built from numeric latitude/longitude"""
+    if facility.get('location'):
+        return facility['location']
+    latitude, longitude = facility.get('latitude'), facility.get('longitude')
+    if isinstance(latitude, (int, float)) and isinstance(longitude, (int, float)) \
+            and not isinstance(latitude, bool) and not isinstance(longitude, bool):
+        return {'type': 'Point', 'coordinates': [longitude, latitude]}  # GeoJSON order is [lng, lat]
+    return None
+
+def specialties_from_departments(departments):
+    """Derive frontend specialty keys from a list of department documents"""
+    specialty_mapping = {
+        'Emergency': 'emergency',
+        'Cardiology': 'cardiology',
+        'General Medicine': 'general',
+        'Pediatrics': 'pediatrics',
+        'Neurology': 'neurology',
+        'Orthopedics': 'orthopedics',
+        'Oncology': 'oncology',
+        'Surgery': 'surgery'
+    }
+
+    specialties = []
+    for dept in departments:
+        dept_name = dept.get('Name', '')
+        for key, value in specialty_mapping.items():
+            if key in dept_name:
+                specialties.append(value)
+                break
+        else:
+            specialties.append('general')
+
+    # Always include general if not emergency-only
+    if 'emergency' not in specialties and 'general' not in specialties:
+        specialties.append('general')
+
+    return list(set(specialties))  # Remove duplicates
+
+# Appointments
+
+APPOINTMENT_PAGE_SIZE = 200
+MAX_APPOINTMENT_PAGE_SIZE = 1000
+PROJECTABLE_FIELD = re.compile(r'^[A-Za-z][A-Za-z0-9_]*$')
+
+APPOINTMENT_REQUIRED_FIELDS = ['patientName', 'phone', 'department', 'doctor', 'dateTime', 'condition']
+
+# Fields that can be updated
+APPOINTMENT_UPDATABLE_FIELDS = [
+    'patientName', 'patientId', 'phone', 'department', 'departmentName',
+    'departmentColor', 'doctor', 'doctorId', 'duration', 'condition',
+    'status', 'priority', 'notes', 'insuranceProvider'
+]
+
+# Fields that move an appointment in the doctor's schedule
+APPOINTMENT_SCHEDULE_FIELDS = ('doctorId', 'dateTime', 'duration')
+
+# Longest bookable appointment; also bounds the double-booking range scan
+APPOINTMENT_MAX_DURATION = 480  # minutes
+
+# Statuses that no longer hold the doctor's time
+INACTIVE_APPOINTMENT_STATUSES = ('cancelled',)
+
+def parse_duration(value):
+    """Appointment length in minutes; raises ValueError outside 1..APPOINTMENT_MAX_DURATION"""
+    duration = int(value)
+    if not 1 <= duration <= APPOINTMENT_MAX_DURATION:
+        raise ValueError(f'duration must be between 1 and {APPOINTMENT_MAX_DURATION} minutes')
+    return duration
+
+def build_appointment_query(args):
+    """Build the Mongo filter shared by the appointment listing routes"""
+    department = args.get('department')
+    doctor = args.get('doctor')
+    date_from = args.get('date_from')
+    date_to = args.get('date_to')
+    status = args.get('status')
+
+    query = {}
+    if department and department != 'all':
+        query['department'] = department
+    if doctor and doctor != 'all':
+        query['doctorId'] = doctor
+    if status and status != 'all':
+        query['status'] = status
+    if date_from or date_to:
+        date_query = {}
+        if date_from:
+            date_query['$gte'] = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
+        if date_to:
+            date_query['$lte'] = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
+        query['dateTime'] = date_query
+
+    return query
+
+def encode_appointment_cursor(appointment):
+    """
+    Opaque keyset cursor for the (dateTime, _id) sort order. Legacy documents
+    whose dateTime is missing or a string sort before every date (MongoDB
+    orders null < strings < dates), so their cursors carry the bracket too.
+    """
+    date_time = appointment.get('dateTime')
+    if isinstance(date_time, datetime):
+        position = {'d': date_time.isoformat()}
+    elif isinstance(date_time, str):
+        position = {'t': 's', 'd': date_time}
+    else:
+        position = {'t': 'n'}
+    position['i'] = str(appointment['_id'])
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+def decode_appointment_cursor(cursor):
+    """Turn a cursor back into a filter matching everything after it"""
+    position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    last_id = ObjectId(position['i']) if ObjectId.is_valid(position['i']) else position['i']
+    kind = position.get('t')
+
+    if kind == 'n':
+        return {'$or': [
+            {'dateTime': None, '_id': {'$gt': last_id}},
+            {'dateTime': {'$ne': None}}
+        ]}
+    if kind == 's':
+        # $gt on a string only matches strings, so the dates after them are added explicitly
+        return {'$or': [
+            {'dateTime': {'$gt': position['d']}},
+            {'dateTime': position['d'], '_id': {'$gt': last_id}},
+            {'dateTime': {'$type': 'date'}}
+        ]}
+
+    last_date = datetime.fromisoformat(position['d'])
+    return {'$or': [
+        {'dateTime': {'$gt': last_date}},
+        {'dateTime': last_date, '_id': {'$gt': last_id}}
+    ]}
+
+def parse_projection(fields_param):
+    """Turn ?fields=a,b into a projection; the sort keys are always kept"""
+    if not fields_param:
+        return None
+
+    fields = [field.strip() for field in fields_param.split(',') if field.strip()]
+    for field in fields:
+        if not PROJECTABLE_FIELD.match(field):
+            raise ValueError(f'Invalid field: {field}')
+
+    projection = {field: 1 for field in fields}
+    projection['dateTime'] = 1
+    return projection
+
+def parse_appointment_page(args):
+    """(query, projection, limit, cursor) for one page of GET /api/appointments"""
+    limit = min(max(int(args.get('limit', APPOINTMENT_PAGE_SIZE)), 1), MAX_APPOINTMENT_PAGE_SIZE)
+    cursor = args.get('cursor')
+    projection = parse_projection(args.get('fields'))
+    query = build_appointment_query(args)
+    if cursor:
+        query = {'$and': [query, decode_appointment_cursor(cursor)]}
+    return query, projection, limit, cursor
+
+def finish_appointment_page(appointments, limit):
+    """Trim the look-ahead row from a fetched page; returns (page, next_cursor)"""
+    next_cursor = None
+    if len(appointments) > limit:
+        appointments = appointments[:limit]
+        next_cursor = encode_appointment_cursor(appointments[-1])
+
+    return appointments, next_cursor
+
+def build_appointment_document(data):
+    """New appointment document from a validated request body"""
+    return {
+        'id': str(uuid.uuid4()),
+        'patientName': data['patientName'],
+        'patientId': data.get('patientId', ''),
+        'phone': data['phone'],
+        'department': data['department'],
+        'departmentName': data.get('departmentName', ''),
+        'departmentColor': data.get('departmentColor', 'blue'),
+        'doctor': data['doctor'],
+        'doctorId': data.get('doctorId', data['doctor']),
+        'dateTime': datetime.fromisoformat(data['dateTime'].replace('Z', '+00:00')),
+        'duration': parse_duration(data.get('duration', 30)),
+        'condition': data['condition'],
+        'status': data.get('status', 'pending'),
+        'priority': data.get('priority', 'medium'),
+        'notes': data.get('notes', ''),
+        'insuranceProvider': data.get('insuranceProvider', 'None'),
+        'createdAt': datetime.utcnow(),
+        'updatedAt': datetime.utcnow()
+    }
+
+def build_appointment_update(data):
+    """$set document for an appointment update request"""
+    update_data = {}
+
+    for field in APPOINTMENT_UPDATABLE_FIELDS:
+        if field in data:
+            update_data[field] = data[field]
+
+    if 'duration' in data:
+        update_data['duration'] = parse_duration(data['duration'])
+
+    # Handle dateTime separately
+    if 'dateTime' in data:
+        if isinstance(data['dateTime'], str):
+            update_data['dateTime'] = datetime.fromisoformat(data['dateTime'].replace('Z', '+00:00'))
+        else:
+            update_data['dateTime'] = data['dateTime']
+
+    update_data['updatedAt'] = datetime.utcnow()
+    return update_data
+
+# Bulk appointment import and update
+
+APPOINTMENT_BULK_MAX = 1000
+
+def parse_appointment_batch(data):
+    """Items of a bulk request: a JSON list, or {"appointments": [...]}; raises ValueError"""
+    items = data.get('appointments') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise ValueError('Body must be a non-empty list of appointments')
+    if len(items) > APPOINTMENT_BULK_MAX:
+        raise ValueError(f'At most {APPOINTMENT_BULK_MAX} appointments per batch')
+    return items
+
+def prepare_appointment_batch(items):
+    """
+    Validate and build every document of a bulk create before anything is written.
+    Returns (documents, errors); errors are {'index', 'error'} per rejected item.
+    """
+    documents, errors = [], []
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'error': 'Appointment must be an object'})
+            continue
+
+        missing = [field for field in APPOINTMENT_REQUIRED_FIELDS if field not in item]
+        if missing:
+            errors.append({'index': index, 'error': f'Missing required field: {missing[0]}'})
+            continue
+
+        try:
+            documents.append(build_appointment_document(item))
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append({'index': index, 'error': f'Invalid appointment: {e}'})
+
+    return documents, errors
+
+def prepare_appointment_updates(items):
+    """
+    Validate every item of a bulk update ({"id": ..., <fields>}) before anything is written.
+    Returns ([(appointment id, $set document)], errors).
+    """
+    updates, errors, seen = [], [], set()
+
+    for index, item in enumerate(items):
+        appointment_id = item.get('id') if isinstance(item, dict) else None
+        if not isinstance(appointment_id, str) or not appointment_id:
+            errors.append({'index': index, 'error': 'Missing required field: id'})
+            continue
+        if appointment_id in seen:
+            errors.append({'index': index, 'id': appointment_id, 'error': 'Appointment appears twice in batch'})
+            continue
+        seen.add(appointment_id)
+
+        try:
+            update_data = build_appointment_update(item)
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append({'index': index, 'id': appointment_id, 'error': f'Invalid update: {e}'})
+            continue
+
+        if len(update_data) == 1:  # only updatedAt
+            errors.append({'index': index, 'id': appointment_id, 'error': 'No updatable fields'})
+            continue
+
+        # Moving a booking needs the per-appointment double-booking check
+        rescheduled = [field for field in APPOINTMENT_SCHEDULE_FIELDS if field in update_data]
+        if rescheduled:
+            errors.append({'index': index, 'id': appointment_id,
+                           'error': f'Reschedule ({rescheduled[0]}) with PUT /api/appointments/<id>'})
+            continue
+
+        updates.append((appointment_id, update_data))
+
+    return updates, errors
+
+def bulk_write_errors(details):
+    """{operation index: message} from a BulkWriteError's details"""
+    return {
+        error['index']: error.get('errmsg', 'Write failed')
+        for error in (details or {}).get('writeErrors', [])
+    }
+
+def bulk_create_results(appointments, conflicts, write_errors):
+    """
+    Per-item results for a bulk create, plus the documents that were written.
+    conflicts maps item index to the bookings it clashed with (those items were
+    not inserted); write_errors is keyed by position among the inserted items.
+    """
+    results, created = [], []
+    position = 0
+
+    for index, appointment in enumerate(appointments):
+        if index in conflicts:
+            results.append({'index': index, 'status': 'conflict', 'conflicts': conflicts[index]})
+            continue
+
+        if position in write_errors:
+            results.append({'index': index, 'status': 'error', 'error': write_errors[position]})
+        else:
+            created.append(appointment)
+            results.append({'index': index, 'status': 'created', 'appointment': appointment})
+        position += 1
+
+    return results, created
+
+def reactivated_appointments(updates, previous_status):
+    """
+    IDs a bulk update would move from a cancelled status back to an active one;
+    that claims the doctor's time again, which only PUT checks for conflicts
+    """
+    return {
+        appointment_id: 'Reactivate cancelled appointments with PUT /api/appointments/<id>'
+        for appointment_id, update_data in updates
+        if appointment_id in previous_status
+        and previous_status[appointment_id] in INACTIVE_APPOINTMENT_STATUSES
+        and update_data.get('status', previous_status[appointment_id]) not in INACTIVE_APPOINTMENT_STATUSES
+    }
+
+def bulk_update_results(updates, previous_status, rejected, write_errors):
+    """
+    Per-item results for a bulk update, plus the (old, new) status pairs that
+    were applied. previous_status maps existing IDs to their status before the
+    write; rejected maps IDs that were not written to the reason; write_errors
+    is keyed by position among the updates that were sent.
+    """
+    results, status_changes = [], []
+    position = 0
+
+    for index, (appointment_id, update_data) in enumerate(updates):
+        if appointment_id not in previous_status:
+            results.append({'index': index, 'id': appointment_id, 'status': 'not_found'})
+            continue
+
+        if appointment_id in rejected:
+            results.append({'index': index, 'id': appointment_id, 'status': 'error', 'error': rejected[appointment_id]})
+            continue
+
+        if position in write_errors:
+            results.append({'index': index, 'id': appointment_id, 'status': 'error', 'error': write_errors[position]})
+        else:
+            results.append({'index': index, 'id': appointment_id, 'status': 'updated'})
+            if 'status' in update_data:
+                status_changes.append((previous_status[appointment_id], update_data['status']))
+        position += 1
+
+    return results, status_changes
+
+# Streaming export
+
+EXPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# Columns written by the CSV export; dotted names reach into sub-documents
+EXPORT_CSV_COLUMNS = {
+    'appointments': [
+        '_id', 'id', 'patientName', 'patientId', 'phone', 'department', 'departmentName',
+        'doctor', 'doctorId', 'dateTime', 'duration', 'condition', 'status', 'priority',
+        'notes', 'insuranceProvider', 'createdAt', 'updatedAt'
+    ],
+    'triage_assessments': [
+        '_id', 'id', 'urgency', 'priorityScore', 'department.id', 'department.name',
+        'estimatedWait', 'condition', 'patientData.age', 'patientData.gender',
+        'patientData.severity', 'createdAt'
+    ]
+}
+
+def export_value(value):
+    """JSON/CSV friendly form of a Mongo value"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+def export_json_default(value):
+    converted = export_value(value)
+    return str(value) if converted is value else converted
+
+def build_export_query(dataset, args):
+    """Filters for an export; appointments accept the same filters as GET /api/appointments"""
+    if dataset == 'appointments':
+        return build_appointment_query(args)
+
+    query = {}
+    date_from = args.get('date_from')
+    date_to = args.get('date_to')
+    if date_from or date_to:
+        date_query = {}
+        if date_from:
+            date_query['$gte'] = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
+        if date_to:
+            date_query['$lte'] = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
+        query['createdAt'] = date_query
+    return query
+
+def export_ndjson_line(doc):
+    return dumps(doc, default=export_json_default) + '\n'
+
+class CsvLineWriter:
+    """Formats documents as CSV lines for the configured columns"""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def header(self):
+        return self._write(self.columns)
+
+    def line(self, doc):
+        row = []
+        for column in self.columns:
+            value = doc
+            for part in column.split('.'):
+                value = value.get(part) if isinstance(value, dict) else None
+            row.append(export_value(value) if value is not None else '')
+        return self._write(row)
+
+    def _write(self, row):
+        self._writer.writerow(row)
+        line = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate(0)
+        return line
+
+def export_ndjson_lines(cursor):
+    for doc in cursor:
+        yield export_ndjson_line(doc)
+
+def export_csv_lines(cursor, columns):
+    writer = CsvLineWriter(columns)
+    yield writer.header()
+    for doc in cursor:
+        yield writer.line(doc)
+
+class ExportChunker:
+    """Groups lines into ~64KB chunks, gzip-compressing them on the fly if asked"""
+
+    def __init__(self, compress):
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31 -> gzip
+        self.pending = []
+        self.pending_bytes = 0
+
+    def feed(self, line):
+        """Add a line; returns a chunk once enough output is pending, else b''"""
+        encoded = line.encode('utf-8')
+        self.pending.append(encoded)
+        self.pending_bytes += len(encoded)
+
+        if self.pending_bytes < EXPORT_CHUNK_BYTES:
+            return b''
+
+        chunk = b''.join(self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+        return self.compressor.compress(chunk) if self.compressor else chunk
+
+    def finish(self):
+        chunk = b''.join(self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+        if self.compressor:
+            chunk = self.compressor.compress(chunk) + self.compressor.flush()
+        return chunk
+
+def chunk_export(lines, compress):
+    """Group lines into ~64KB chunks, gzip-compressing them on the fly if asked"""
+    chunker = ExportChunker(compress)
+    for line in lines:
+        chunk = chunker.feed(line)
+        if chunk:
+            yield chunk
+
+    chunk = chunker.finish()
+    if chunk:
+        yield chunk
+
+def export_headers(dataset, export_format, compress):
+    filename = f"{dataset}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    return headers
+
+# Triage
+
+TRIAGE_REQUIRED_FIELDS = ['symptoms', 'severity', 'age', 'gender']
+
+def build_triage_assessment(data, decision):
+    """Assessment document for a triage request and the rule engine's decision"""
+    urgency = decision.urgency
+    priority_score = decision.priority_score
+    department = decision.department
+    estimated_wait = decision.estimated_wait
+
+    return {
+        'id': str(uuid.uuid4()),
+        'urgency': urgency,
+        'priorityScore': priority_score,
+        'department': {
+            **department,
+            'description': f'Recommended based on your symptoms and medical history.'
+        },
+        'estimatedWait': estimated_wait,
+        'condition': data['symptoms'],
+        'summary': f'Based on your assessment, you have been assigned a {urgency.lower()} priority level. Your symptoms suggest you should be seen in the {department["name"]} department.',
+        'recommendations': [
+            'Seek immediate medical attention' if urgency == 'Critical' else 'Schedule an appointment with the recommended department',
+            'Bring a list of current medications',
+            'Arrive 15 minutes early for check-in',
+            'Do not delay seeking care' if urgency == 'Critical' else 'Continue monitoring symptoms'
+        ],
+        'patientData': data,
+        'createdAt': datetime.utcnow()
+    }
+
+# Departments and doctors
+
+DEPARTMENTS = [
+    {'id': 'emergency', 'name': 'Emergency', 'color': 'red'},
+    {'id': 'general', 'name': 'General Medicine', 'color': 'blue'},
+    {'id': 'cardiology', 'name': 'Cardiology', 'color': 'purple'},
+    {'id': 'pediatrics', 'name': 'Pediatrics', 'color': 'green'},
+    {'id': 'orthopedics', 'name': 'Orthopedics', 'color': 'orange'}
+]
+
+DOCTORS = [
+    {'id': 'all', 'name': 'All Doctors', 'department': 'all'},
+    {'id': 'dr_smith', 'name': 'Dr. Smith', 'department': 'emergency'},
+    {'id': 'dr_johnson', 'name': 'Dr. Johnson', 'department': 'general'},
+    {'id': 'dr_williams', 'name': 'Dr. Williams', 'department': 'cardiology'},
+    {'id': 'dr_brown', 'name': 'Dr. Brown', 'department': 'pediatrics'},
+    {'id': 'dr_davis', 'name': 'Dr. Davis', 'department': 'orthopedics'}
+]
+
+# Facilities
+
+FACILITY_CACHE_CONTROL = 'public, max-age=60, stale-while-revalidate=300'
+
+def format_facility(read_model):
+    """Frontend listing entry for a facility read model document"""
+    return {
+        'id': str(read_model['_id']),
+        'name': read_model['name'],
+        'location': dict(read_model['coordinates']),
+        'address': read_model['address'],
+        'phone': read_model['phone'],
+        'specialties': list(read_model['specialties']),
+        'emergencyLevel': read_model['emergencyLevel'],
+        'rating': read_model['rating'],
+        'capacity': read_model['capacityBeds'],
+        'facilityType': read_model['facilityType'],
+        'ownership': read_model['ownership'],
+        'city': read_model['city'],
+        'province': read_model['province']
+    }
+
+def format_facilities(snapshot):
+    return [format_facility(snapshot.get_read_model(facility['_id'])) for facility in snapshot.facilities]
+
+# Capacity
+
+# Status of a department with no capacity document: its live figures are null, never guessed
+UNKNOWN_CAPACITY_STATUS = 'UNKNOWN'
+
+def parse_facility_id(facility_id):
+    """Facility IDs are stored as ints; fall back to the raw string otherwise"""
+    try:
+        return int(facility_id)
+    except (TypeError, ValueError):
+        return facility_id
+
+def parse_facility_ids(facility_ids_param):
+    """Comma separated facility IDs, or None when the parameter is absent"""
+    if not facility_ids_param:
+        return None
+    return [parse_facility_id(fid.strip()) for fid in facility_ids_param.split(',') if fid.strip()]
+
+def map_department_to_specialty(dept_name):
+    """Map a department name to the specialty key used by the frontend"""
+    if 'Emergency' in dept_name:
+        return 'emergency'
+    elif 'Cardiology' in dept_name:
+        return 'cardiology'
+    elif 'Pediatrics' in dept_name or 'Children' in dept_name:
+        return 'pediatrics'
+    elif 'Neurology' in dept_name:
+        return 'neurology'
+    elif 'Orthopedics' in dept_name:
+        return 'orthopedics'
+    return 'general'
+
+def unknown_department_capacity(dept_name='General Department', total_beds=None):
+    """Row for a department (or a facility without departments) that has no capacity on record"""
+    return {
+        'Department_name': dept_name,
+        'Specialty': map_department_to_specialty(dept_name),
+        'Current_patients': None,
+        'Current_beds_available': None,
+        'Total_beds': total_beds,
+        'Current_doctors_on_duty': None,
+        'Wait_time_minutes': None,
+        'Status': UNKNOWN_CAPACITY_STATUS,
+        'Utilization_rate': None
+    }
+
+def format_department_capacity(dept, capacity):
+    """Build the capacity row for one department from its capacity document"""
+    dept_name = dept.get('Name', 'General Department')
+    total_beds = dept.get('Capacity_beds', 20)
+
+    if not capacity:
+        return unknown_department_capacity(dept_name, total_beds)
+
+    current_patients = capacity.get('Current_patients', 0)
+    doctors_on_duty = capacity.get('Current_doctors_on_duty', 1)
+    wait_time = min(max(current_patients * 15 // doctors_on_duty, 15), 180)
+    available_beds = capacity.get('Current_beds_available', total_beds // 2)
+
+    # Calculate utilization and status
+    utilization = ((total_beds - available_beds) / total_beds * 100) if total_beds > 0 else 0
+
+    if utilization >= 95:
+        status = 'CRITICAL'
+    elif utilization >= 85:
+        status = 'HIGH'
+    elif utilization >= 65:
+        status = 'MODERATE'
+    else:
+        status = 'LOW'
+
+    return {
+        'Department_name': dept_name,
+        'Specialty': map_department_to_specialty(dept_name),
+        'Current_patients': current_patients,
+        'Current_beds_available': available_beds,
+        'Total_beds': total_beds,
+        'Current_doctors_on_duty': doctors_on_duty,
+        'Wait_time_minutes': wait_time,
+        'Status': status,
+        'Utilization_rate': round(utilization, 1)
+    }
+
+def facility_capacity_pipeline(facility_ids=None):
+    """
+    Joins departments to department_capacity with $lookup so capacity for
+    many facilities takes a single round trip. None covers every facility.
+    """
+    pipeline = []
+    if facility_ids is not None:
+        pipeline.append({'$match': {'Facility_ID': {'$in': list(facility_ids)}}})
+    pipeline.extend([
+        {'$lookup': {
+            'from': 'department_capacity',
+            'localField': '_id',
+            'foreignField': 'Department_ID',
+            'as': 'capacity'
+        }},
+        {'$project': {
+            'Facility_ID': 1,
+            'Name': 1,
+            'Capacity_beds': 1,
+            'capacity': {'$arrayElemAt': ['$capacity', 0]}
+        }},
+        {'$sort': {'Facility_ID': 1, '_id': 1}}
+    ])
+    return pipeline
+
+def group_facility_capacity(departments, facility_ids=None):
+    """Capacity rows from facility_capacity_pipeline() grouped by facility"""
+    capacity_by_facility = {}
+    for dept in departments:
+        row = format_department_capacity(dept, dept.get('capacity'))
+        capacity_by_facility.setdefault(dept['Facility_ID'], []).append(row)
+
+    # Requested facilities without departments still get a row
+    for facility_id in facility_ids or []:
+        capacity_by_facility.setdefault(facility_id, [unknown_department_capacity()])
+
+    return capacity_by_facility
+
+# Live capacity stream
+
+CAPACITY_STREAM_HEARTBEAT_SECONDS = 15
+CAPACITY_STREAM_RETRY_MS = 5000
+
+def format_sse(data, event=None, event_id=None):
+    """Serialize one Server-Sent Events message"""
+    message = ''
+    if event_id:
+        message += f"id: {event_id}\n"
+    if event:
+        message += f"event: {event}\n"
+    return message + f"data: {dumps(data)}\n\n"
+
+def capacity_event_row(snapshot, event):
+    """(facility_id, capacity row) for a change event; (None, None) if the department is unknown"""
+    dept = snapshot.get_department(event.department_id)
+    if dept is None:
+        return None, None
+
+    row = format_department_capacity(dept, event.capacity)
+    row['Department_ID'] = event.department_id
+    return dept.get('Facility_ID'), row
+
+# Emergency hospitals
+
+def emergency_search_pipeline(user_lat, user_lng, max_distance, is_pediatric, rank_by_eta=False):
+    """
+    One indexed read for emergency routing: $geoNear over the facility read
+    model's 2dsphere index, pre-filtered to emergency-capable facilities within
+    max_distance, with each emergency department's live capacity joined in
+    """
+    pipeline = [
+        {'$geoNear': {
+            'near': {'type': 'Point', 'coordinates': [float(user_lng), float(user_lat)]},
+            'key': 'location',
+            'distanceField': 'distance_m',
+            'maxDistance': float(max_distance) * 1000,  # metres
+            'spherical': True,
+            'query': {'acceptsEmergencies': True}
+        }}
+    ]
+
+    # Pediatric and drive-time ranking can promote a farther facility, so they need every candidate
+    if not is_pediatric and not rank_by_eta:
+        pipeline.append({'$limit': 5})
+
+    pipeline.extend([
+        {'$lookup': {
+            'from': 'department_capacity',
+            'localField': 'emergencyDepartmentId',
+            'foreignField': 'Department_ID',
+            'as': 'capacity'
+        }},
+        {'$set': {'capacity': {'$arrayElemAt': ['$capacity', 0]}}},
+        {'$project': {'departmentIds': 0}}
+    ])
+    return pipeline
+
+def emergency_fallback_matches(read_models, emergency_index, user_lat, user_lng, max_distance, is_pediatric,
+                               recall_capacity, rank_by_eta=False):
+    """
+    emergency_search_pipeline() evaluated in process over the facility
+    snapshot's read models and emergency spatial index, for routing while
+    Atlas is unreachable. recall_capacity(department_id) returns
+    (capacity, age_seconds) for the last capacity document seen for the
+    department, or None. Returns the matches and the age of the oldest
+    capacity used.
+    """
+    # Pediatric and drive-time ranking reorder every match in range; otherwise only the nearest 5 are returned
+    if is_pediatric or rank_by_eta:
+        nearest = emergency_index.within(user_lat, user_lng, max_distance)
+    else:
+        nearest = emergency_index.nearest(user_lat, user_lng, 5, max_distance)
+
+    matches = []
+    oldest = 0.0
+    for facility_id, distance in nearest:
+        read_model = read_models[facility_id]
+        match = {key: value for key, value in read_model.items() if key != 'departmentIds'}
+        match['distance_m'] = distance * 1000
+        department_id = read_model['emergencyDepartmentId']
+        known = recall_capacity(department_id) if department_id is not None else None
+        match['capacity'] = known[0] if known else None
+        if known:
+            oldest = max(oldest, known[1])
+        matches.append(match)
+    return matches, oldest
+
+def estimated_arrival_minutes(distance_km):
+    """Straight-line drive estimate, for locations the travel-time matrix does not cover"""
+    return max(15, int(distance_km * 2.5))  # Factor in traffic
+
+def format_emergency_hospital(match, is_pediatric, eta_minutes=None):
+    """
+    Response entry for one emergency_search_pipeline() match; eta_minutes
+    is the travel-time matrix's drive time, when it has one
+    """
+    coords = match['coordinates']
+    distance = match['distance_m'] / 1000
+
+    # A facility without an emergency department would join on a null ID
+    capacity = match.get('capacity') if match.get('emergencyDepartmentId') is not None else None
+
+    # Calculate current status
+    total_beds = match['emergencyDepartmentBeds']
+    if capacity:
+        current_patients = capacity.get('Current_patients', 0)
+        available_beds = capacity.get('Current_beds_available', 10)
+        doctors_on_duty = capacity.get('Current_doctors_on_duty', 2)
+        wait_time = min(max(current_patients * 15 // doctors_on_duty, 15), 180)
+        status = 'CRITICAL' if available_beds <= 2 else 'HIGH' if available_beds <= 5 else 'MODERATE'
+    else:
+        available_beds = None
+        wait_time = None
+        status = UNKNOWN_CAPACITY_STATUS
+
+    return {
+        'id': str(match['_id']),
+        'name': match['name'],
+        'location': dict(coords),
+        'address': match['address'],
+        'phone': match['phone'],
+        'distance': round(distance, 1),
+        'estimatedArrival': eta_minutes if eta_minutes is not None else estimated_arrival_minutes(distance),
+        'emergencyLevel': match['emergencyLevel'],
+        'specialties': list(match['specialties']),
+        'currentCapacity': {
+            'emergency': {
+                'available': available_beds,
+                'total': total_beds,
+                'waitTime': wait_time,
+                'status': status
+            }
+        },
+        'isLevel1Trauma': match['isLevel1Trauma'],
+        'hasAmbulance': match['hasAmbulance'],
+        'directionsUrl': f"https://maps.google.com/maps?daddr={coords['lat']},{coords['lng']}",
+        # Prefer pediatric facilities for children, but don't exclude others
+        'pediatricPreference': is_pediatric and match['pediatric']
+    }
+
+def rank_emergency_hospitals(emergency_hospitals, is_pediatric):
+    """Quickest to reach first (ETA, then distance); prioritize pediatric facilities for children"""
+    emergency_hospitals.sort(key=lambda h: (is_pediatric and not h['pediatricPreference'],
+                                            h['estimatedArrival'], h['distance']))
+
+    # Return the top 5
+    return emergency_hospitals[:5]
+
+# Health
+
+def health_payload(snapshot_loaded, database_connected, schema_version, latest_schema_version):
+    """
+    (payload, ready) for the health routes. Ready means this process can
+    serve traffic: its facility snapshot is loaded and the database schema
+    has been migrated. Atlas reachability is reported but does not gate
+    readiness, since a warmed process keeps serving last-known-good data
+    while Atlas is down.
+    """
+    ready = bool(snapshot_loaded) and schema_version is not None and schema_version >= latest_schema_version
+    return {
+        'status': 'healthy' if ready else 'unhealthy',
+        'live': True,
+        'ready': ready,
+        'database': 'connected' if database_connected else 'disconnected',
+        'checks': {
+            'facility_snapshot': 'loaded' if snapshot_loaded else 'not_loaded',
+            'schema_version': schema_version,
+            'latest_schema_version': latest_schema_version
+        },
+        'timestamp': datetime.utcnow().isoformat()
+    }, ready
@@ -0,0 +1,137 @@
+"""
+Maintained Appointment Counters
+Keeps total and per-status appointment counts in a single stats_counters
+document, updated incrementally by the appointment write routes
+"""
+
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Tuple
+
+COUNTERS_COLLECTION = 'stats_counters'
+COUNTERS_ID = 'appointments'
+COUNT_PIPELINE = [
+    {'$facet': {
+        'total': [{'$count': 'count'}],
+        'by_status': [{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]
+    }}
+]
+STATUS_KEY = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def status_key(status) -> str:
+    """Status values are user input; keep them safe to use as a field name"""
+    if isinstance(status, str) and STATUS_KEY.match(status):
+        return status
+    return 'other'
+
+
+class AppointmentCounters:
+    """
+    O(1) appointment totals for the stats endpoint.
+    Increments never upsert: until the counters document has been seeded by
+    rebuild() they are no-ops, so a partial document can never look complete.
+    The scheduler also writes appointments without going through the API, so
+    counters older than max_age_seconds are recounted to bound any drift.
+    """
+
+    def __init__(self, db, max_age_seconds: int = 3600):
+        self.db = db
+        self.max_age = timedelta(seconds=max_age_seconds)
+
+    @property
+    def collection(self):
+        return self.db.get_collection(COUNTERS_COLLECTION)
+
+    def get(self) -> Dict:
+        """Current counters, seeding (or reconciling) them with one aggregation when needed"""
+        counters = self.collection.find_one({'_id': COUNTERS_ID})
+        if self._is_stale(counters):
+            counters = self.rebuild()
+        return counters
+
+    def rebuild(self) -> Dict:
+        """Recount total and per-status appointments in a single $facet pass"""
+        result = next(self.db.get_collection('appointments').aggregate(COUNT_PIPELINE), None)
+        counters = self._counters_from_facet(result)
+        self.collection.replace_one({'_id': COUNTERS_ID}, counters, upsert=True)
+        return counters
+
+    def _is_stale(self, counters) -> bool:
+        return counters is None or counters.get('rebuilt_at', datetime.min) < datetime.utcnow() - self.max_age
+
+    @staticmethod
+    def _counters_from_facet(result) -> Dict:
+        result = result or {'total': [], 'by_status': []}
+        by_status: Dict[str, int] = {}
+        for row in result['by_status']:
+            key = status_key(row['_id'])
+            by_status[key] = by_status.get(key, 0) + row['count']
+
+        return {
+            '_id': COUNTERS_ID,
+            'total': result['total'][0]['count'] if result['total'] else 0,
+            'by_status': by_status,
+            'rebuilt_at': datetime.utcnow()
+        }
+
+    def record_inserts(self, appointments: Iterable[Dict]):
+        increments: Dict[str, int] = {}
+        for appointment in appointments:
+            increments['total'] = increments.get('total', 0) + 1
+            key = f"by_status.{status_key(appointment.get('status'))}"
+            increments[key] = increments.get(key, 0) + 1
+        return self._apply(increments)
+
+    def record_status_change(self, old_status, new_status):
+        return self.record_status_changes([(old_status, new_status)])
+
+    def record_status_changes(self, changes: Iterable[Tuple]):
+        """Apply any number of (old, new) status changes with a single $inc"""
+        increments: Dict[str, int] = {}
+        for old_status, new_status in changes:
+            old_key, new_key = status_key(old_status), status_key(new_status)
+            if old_key != new_key:
+                increments[f'by_status.{old_key}'] = increments.get(f'by_status.{old_key}', 0) - 1
+                increments[f'by_status.{new_key}'] = increments.get(f'by_status.{new_key}', 0) + 1
+        return self._apply({key: value for key, value in increments.items() if value})
+
+    def record_delete(self, appointment: Dict):
+        return self._apply({'total': -1, f"by_status.{status_key(appointment.get('status'))}": -1})
+
+    def _apply(self, increments: Dict[str, int]):
+        if not increments:
+            return
+        try:
+            self.collection.update_one({'_id': COUNTERS_ID}, {'$inc': increments})
+        except Exception as e:
+            # Counters are advisory; rebuild() reconciles them
+            print(f"Error updating appointment counters: {e}")
+
+
+class AsyncAppointmentCounters(AppointmentCounters):
+    """
+    The same counters on a Motor database for the ASGI server.
+    get(), rebuild() and every record_*() call return awaitables.
+    """
+
+    async def get(self) -> Dict:
+        counters = await self.collection.find_one({'_id': COUNTERS_ID})
+        if self._is_stale(counters):
+            counters = await self.rebuild()
+        return counters
+
+    async def rebuild(self) -> Dict:
+        results = await self.db.get_collection('appointments').aggregate(COUNT_PIPELINE).to_list(1)
+        counters = self._counters_from_facet(results[0] if results else None)
+        await self.collection.replace_one({'_id': COUNTERS_ID}, counters, upsert=True)
+        return counters
+
+    async def _apply(self, increments: Dict[str, int]):
+        if not increments:
+            return
+        try:
+            await self.collection.update_one({'_id': COUNTERS_ID}, {'$inc': increments})
+        except Exception as e:
+            # Counters are advisory; rebuild() reconciles them
+            print(f"Error updating appointment counters: {e}")
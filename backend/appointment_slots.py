@@ -0,0 +1,235 @@
+"""
+Doctor Slot Reservations
+Double-booking guard for appointments: an overlap check that is a bounded
+range scan on the (doctorId, dateTime) index, plus an atomic claim of the
+doctor's time in the appointment_slots collection
+
+The overlap check gives the exact answer (and the clashing bookings) for
+appointments already written. Two requests checking at the same moment would
+both pass it, so each booking also inserts one document per SLOT_MINUTES of
+its interval, keyed by doctor and slot start; the unique _id lets only one of
+them win. Slots are rounded out to SLOT_MINUTES, so bookings that do not sit
+on that grid can be refused when they come within a few minutes of each other.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from api_common import APPOINTMENT_MAX_DURATION, INACTIVE_APPOINTMENT_STATUSES
+
+SLOTS_COLLECTION = 'appointment_slots'
+SLOT_MINUTES = 5
+
+# Slot documents expire this long after the slot has passed (TTL index on 'end')
+SLOT_RETENTION_SECONDS = 24 * 3600
+
+CONFLICT_PROJECTION = {'_id': 0, 'id': 1, 'doctorId': 1, 'dateTime': 1, 'duration': 1, 'status': 1}
+
+
+def utc_naive(value: datetime) -> datetime:
+    """Stored datetimes come back naive UTC; normalise request values to match"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def holds_slots(appointment: Dict) -> bool:
+    return (
+        appointment.get('status') not in INACTIVE_APPOINTMENT_STATUSES
+        and bool(appointment.get('doctorId'))
+        and isinstance(appointment.get('dateTime'), datetime)
+    )
+
+
+def appointment_interval(appointment: Dict) -> Tuple[datetime, datetime]:
+    start = utc_naive(appointment['dateTime'])
+    return start, start + timedelta(minutes=int(appointment.get('duration') or 30))
+
+
+def slot_documents(appointment: Dict) -> List[Dict]:
+    """One reservation per SLOT_MINUTES the appointment touches"""
+    if not holds_slots(appointment):
+        return []
+
+    start, end = appointment_interval(appointment)
+    slot = start.replace(minute=start.minute - start.minute % SLOT_MINUTES, second=0, microsecond=0)
+    documents = []
+    while slot < end:
+        slot_end = slot + timedelta(minutes=SLOT_MINUTES)
+        documents.append({
+            '_id': f"{appointment['doctorId']}|{slot.isoformat()}",
+            'doctorId': appointment['doctorId'],
+            'appointmentId': appointment['id'],
+            'start': slot,
+            'end': slot_end
+        })
+        slot = slot_end
+    return documents
+
+
+def slot_ids(appointment: Dict) -> Set[str]:
+    return {document['_id'] for document in slot_documents(appointment)}
+
+
+def overlap_query(appointments: Sequence[Dict], exclude_ids: Iterable[str] = ()) -> Dict:
+    """
+    Every active booking that could overlap any of the appointments.
+    A booking overlaps [start, end) when it starts before end and ends after
+    start; since no booking is longer than APPOINTMENT_MAX_DURATION, the
+    second condition is bounded by start - APPOINTMENT_MAX_DURATION, which
+    keeps this a range scan on (doctorId, dateTime).
+    """
+    intervals = [appointment_interval(appointment) for appointment in appointments]
+    query = {
+        'doctorId': {'$in': sorted({appointment['doctorId'] for appointment in appointments})},
+        'dateTime': {
+            '$gt': min(start for start, _ in intervals) - timedelta(minutes=APPOINTMENT_MAX_DURATION),
+            '$lt': max(end for _, end in intervals)
+        },
+        'status': {'$nin': list(INACTIVE_APPOINTMENT_STATUSES)}
+    }
+    exclude_ids = list(exclude_ids)
+    if exclude_ids:
+        query['id'] = {'$nin': exclude_ids}
+    return query
+
+
+def overlaps(first: Dict, second: Dict) -> bool:
+    first_start, first_end = appointment_interval(first)
+    second_start, second_end = appointment_interval(second)
+    return first['doctorId'] == second['doctorId'] and first_start < second_end and second_start < first_end
+
+
+def format_conflict(booking: Dict) -> Dict:
+    start, _ = appointment_interval(booking)
+    return {'id': booking['id'], 'dateTime': start.isoformat(), 'duration': booking.get('duration')}
+
+
+def find_conflicts(appointments: Sequence[Dict], existing: Iterable[Dict]) -> Dict[int, List[Dict]]:
+    """
+    Index -> clashing bookings for each appointment that holds slots. Items of
+    the same batch are checked against each other too; the later one loses.
+    """
+    existing = list(existing)
+    conflicts: Dict[int, List[Dict]] = {}
+    accepted: List[Dict] = []
+
+    for index, appointment in enumerate(appointments):
+        if not holds_slots(appointment):
+            continue
+        clashes = [
+            booking for booking in existing + accepted
+            if booking['id'] != appointment['id'] and overlaps(appointment, booking)
+        ]
+        if clashes:
+            conflicts[index] = [format_conflict(booking) for booking in clashes]
+        else:
+            accepted.append(appointment)
+
+    return conflicts
+
+
+def claim_batch(appointments: Sequence[Dict], held: Iterable[str] = ()) -> Tuple[List[Dict], List[int]]:
+    """Slot documents to insert for the appointments (minus slots already held) and each one's owner index"""
+    held = set(held)
+    documents, owners = [], []
+    for index, appointment in enumerate(appointments):
+        for document in slot_documents(appointment):
+            if document['_id'] not in held:
+                documents.append(document)
+                owners.append(index)
+    return documents, owners
+
+
+def failed_claims(error: BulkWriteError, documents: List[Dict], owners: List[int]) -> Tuple[Set[int], List[str]]:
+    """Owners that lost at least one slot, and every slot those owners did insert (to hand back)"""
+    failed_positions = {write_error['index'] for write_error in error.details.get('writeErrors', [])}
+    failed = {owners[position] for position in failed_positions}
+    inserted = [
+        document['_id'] for position, document in enumerate(documents)
+        if owners[position] in failed and position not in failed_positions
+    ]
+    return failed, inserted
+
+
+class SlotReservations:
+    """Overlap checks and slot claims for the appointment write routes"""
+
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def collection(self):
+        return self.db.get_collection(SLOTS_COLLECTION)
+
+    def conflicts(self, appointments: Sequence[Dict], exclude_ids: Iterable[str] = ()) -> Dict[int, List[Dict]]:
+        """One range query for the whole batch"""
+        active = [appointment for appointment in appointments if holds_slots(appointment)]
+        if not active:
+            return {}
+        existing = self.db.get_collection('appointments').find(overlap_query(active, exclude_ids), CONFLICT_PROJECTION)
+        return find_conflicts(appointments, existing)
+
+    def reserve(self, appointments: Sequence[Dict], held: Iterable[str] = ()) -> Set[int]:
+        """
+        Atomically claim the appointments' slots (skipping slot IDs in held);
+        returns the indexes that lost a slot to another booking, whose other
+        slots are released again.
+        """
+        documents, owners = claim_batch(appointments, held)
+        if not documents:
+            return set()
+        try:
+            self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            failed, inserted = failed_claims(e, documents, owners)
+            if inserted:
+                self.collection.delete_many({'_id': {'$in': inserted}})
+            return failed
+        return set()
+
+    def release(self, appointment_ids: Iterable[str], slot_ids: Iterable[str] = None):
+        """Hand back every slot of the appointments, or only the given slot IDs of them"""
+        query = {'appointmentId': {'$in': list(appointment_ids)}}
+        if slot_ids is not None:
+            query['_id'] = {'$in': list(slot_ids)}
+        try:
+            self.collection.delete_many(query)
+        except Exception as e:
+            # A stale slot only blocks its own time and expires with the TTL index
+            print(f"Error releasing appointment slots: {e}")
+
+
+class AsyncSlotReservations(SlotReservations):
+    """The same reservations on a Motor database for the ASGI server"""
+
+    async def conflicts(self, appointments, exclude_ids=()):
+        active = [appointment for appointment in appointments if holds_slots(appointment)]
+        if not active:
+            return {}
+        cursor = self.db.get_collection('appointments').find(overlap_query(active, exclude_ids), CONFLICT_PROJECTION)
+        return find_conflicts(appointments, await cursor.to_list(None))
+
+    async def reserve(self, appointments, held=()):
+        documents, owners = claim_batch(appointments, held)
+        if not documents:
+            return set()
+        try:
+            await self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            failed, inserted = failed_claims(e, documents, owners)
+            if inserted:
+                await self.collection.delete_many({'_id': {'$in': inserted}})
+            return failed
+        return set()
+
+    async def release(self, appointment_ids, slot_ids=None):
+        query = {'appointmentId': {'$in': list(appointment_ids)}}
+        if slot_ids is not None:
+            query['_id'] = {'$in': list(slot_ids)}
+        try:
+            await self.collection.delete_many(query)
+        except Exception as e:
+            print(f"Error releasing appointment slots: {e}")
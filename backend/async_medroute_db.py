@@ -0,0 +1,44 @@
+"""
+Non-blocking MongoDB Atlas Client for the ASGI API Server
+Motor counterpart of CloudMedRouteDB with the same connection settings
+"""
+
+import os
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from cloud_medroute_db import DATABASE_NAME, mongo_client_options
+from metrics import MONGO_COMMAND_LISTENER
+
+load_dotenv()
+
+class AsyncMedRouteDB:
+    """
+    Motor client bound to the running event loop.
+    Indexes are owned by migrations.py; this wrapper only serves queries,
+    so construct it inside the loop (e.g. in a startup hook).
+    """
+
+    def __init__(self):
+        self.connection_string = os.getenv('MONGODB_ATLAS_URI')
+
+        if not self.connection_string:
+            raise ValueError("MONGODB_ATLAS_URI environment variable not set")
+
+        self.database_name = DATABASE_NAME
+        self.client = AsyncIOMotorClient(
+            self.connection_string,
+            event_listeners=[MONGO_COMMAND_LISTENER],
+            **mongo_client_options(self.connection_string)
+        )
+        self.db = self.client[self.database_name]
+
+    async def ping(self):
+        return await self.client.admin.command('ping')
+
+    def get_collection(self, collection_name):
+        return self.db[collection_name]
+
+    def close_connection(self):
+        if self.client:
+            self.client.close()
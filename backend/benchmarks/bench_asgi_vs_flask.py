@@ -0,0 +1,315 @@
+"""
+Flask vs ASGI API Server Load Benchmark
+Runs medroute_api_server (gunicorn, one sync worker as in railway.toml) and
+medroute_asgi_server (hypercorn, one worker) side by side against a local
+mongod, then drives both with 50/200/1000 concurrent keep-alive clients
+
+A TCP proxy in front of mongod adds --latency-ms per round trip, standing in
+for the network hop to Atlas; without it a local mongod hides the stalls the
+async build is meant to remove.
+
+Usage: python benchmarks/bench_asgi_vs_flask.py [--mongo-uri mongodb://localhost:27017]
+       [--clients 50,200,1000] [--duration 15] [--latency-ms 10]
+
+Requires: a local mongod, gunicorn and hypercorn on PATH. The database named
+in cloud_medroute_db.DATABASE_NAME is seeded with synthetic data if empty.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from pymongo import MongoClient
+
+from cloud_medroute_db import DATABASE_NAME
+
+FACILITY_COUNT = 44
+APPOINTMENT_COUNT = 5000
+REQUEST_TIMEOUT = 30
+
+SERVERS = {
+    'flask': ['gunicorn', '--workers', '1', '--timeout', '120', 'medroute_api_server:app'],
+    'asgi': ['hypercorn', '--workers', '1', 'medroute_asgi_server:app'],
+}
+
+
+def seed_database(mongo_uri):
+    """Synthetic facilities, departments, capacity and appointments around Gauteng"""
+    client = MongoClient(mongo_uri)
+    db = client[DATABASE_NAME]
+    if db.facilities.estimated_document_count() and db.appointments.estimated_document_count():
+        return
+
+    rng = random.Random(7)
+    facilities, departments, capacity = [], [], []
+    dept_names = ['Emergency', 'General Medicine', 'Cardiology', 'Pediatrics', 'Orthopedics']
+
+    for facility_id in range(1, FACILITY_COUNT + 1):
+        lat = -26.2 + rng.uniform(-0.6, 0.6)
+        lng = 28.0 + rng.uniform(-0.6, 0.6)
+        facilities.append({
+            '_id': facility_id,
+            'Name': f'Bench Hospital {facility_id}',
+            'City': 'Johannesburg',
+            'Province': 'Gauteng',
+            'Facility_type': rng.choice(['Hospital', 'Emergency Center', 'Clinic']),
+            'Level_of_care': rng.choice(['Primary', 'Secondary', 'Tertiary']),
+            'latitude': lat,
+            'longitude': lng,
+            'location': {'type': 'Point', 'coordinates': [lng, lat]},
+            'has_emergency': True
+        })
+        for index, name in enumerate(dept_names):
+            dept_id = facility_id * 100 + index
+            departments.append({'_id': dept_id, 'Facility_ID': facility_id, 'Name': name,
+                                'Capacity_beds': rng.randint(10, 40)})
+            capacity.append({'Department_ID': dept_id, 'Current_patients': rng.randint(0, 30),
+                             'Current_beds_available': rng.randint(0, 20),
+                             'Current_doctors_on_duty': rng.randint(1, 6),
+                             'Last_updated': datetime.utcnow()})
+
+    start = datetime.utcnow().replace(hour=8, minute=0, second=0, microsecond=0)
+    appointments = [{
+        'id': f'bench-{i}',
+        'patientName': f'Patient {i}',
+        'phone': '+27 000000000',
+        'department': rng.choice(['emergency', 'general', 'cardiology']),
+        'doctor': 'Dr. Smith',
+        'doctorId': rng.choice(['dr_smith', 'dr_johnson', 'dr_williams']),
+        'dateTime': start + timedelta(minutes=30 * i),
+        'duration': 30,
+        'condition': 'Follow-up',
+        'status': rng.choice(['pending', 'confirmed', 'completed'])
+    } for i in range(APPOINTMENT_COUNT)]
+
+    for name, docs in (('facilities', facilities), ('departments', departments),
+                       ('department_capacity', capacity), ('appointments', appointments)):
+        db[name].delete_many({})
+        db[name].insert_many(docs)
+    client.close()
+
+
+def run_latency_proxy(listen_port, target_host, target_port, latency_ms):
+    """Forward TCP to mongod, delaying every read by latency_ms/2 in each direction"""
+    delay = latency_ms / 2000
+
+    async def pump(reader, writer):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                await asyncio.sleep(delay)
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(target_host, target_port)
+        await asyncio.gather(pump(client_reader, server_writer), pump(server_reader, client_writer))
+
+    async def main():
+        server = await asyncio.start_server(handle, '127.0.0.1', listen_port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+
+async def http_request(reader, writer, method, path, body=None):
+    """Minimal HTTP/1.1 exchange; returns (status, keep_alive)"""
+    payload = json.dumps(body).encode('utf-8') if body is not None else b''
+    head = f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Length: {len(payload)}\r\n"
+    if body is not None:
+        head += "Content-Type: application/json\r\n"
+    writer.write(head.encode('ascii') + b"\r\n" + payload)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+
+    length, chunked, keep_alive = None, False, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value:
+            chunked = True
+        elif name == 'connection' and value == 'close':
+            keep_alive = False
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        keep_alive = False
+
+    return status, keep_alive
+
+
+def request_mix(rng):
+    """One request drawn from a dashboard-like route mix"""
+    choice = rng.random()
+    if choice < 0.35:
+        return 'GET', '/api/appointments?limit=50', None
+    if choice < 0.55:
+        ids = ','.join(str(rng.randint(1, FACILITY_COUNT)) for _ in range(5))
+        return 'GET', f'/api/capacity?facility_ids={ids}', None
+    if choice < 0.75:
+        return 'POST', '/api/emergency-hospitals', {
+            'latitude': -26.2 + rng.uniform(-0.3, 0.3),
+            'longitude': 28.0 + rng.uniform(-0.3, 0.3),
+            'max_distance': 50
+        }
+    if choice < 0.90:
+        return 'GET', '/api/facilities', None
+    return 'GET', '/api/stats', None
+
+
+async def client_loop(port, deadline, latencies, errors, seed):
+    rng = random.Random(seed)
+    reader = writer = None
+
+    while time.monotonic() < deadline:
+        method, path, body = request_mix(rng)
+        started = time.monotonic()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            status, keep_alive = await asyncio.wait_for(
+                http_request(reader, writer, method, path, body), REQUEST_TIMEOUT
+            )
+            if status >= 500:
+                errors.append(status)
+            else:
+                latencies.append(time.monotonic() - started)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.TimeoutError, ValueError, asyncio.IncompleteReadError) as e:
+            errors.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+            writer = None
+
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(port, clients, duration):
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(
+        client_loop(port, deadline, latencies, errors, seed) for seed in range(clients)
+    ))
+    return latencies, errors
+
+
+def wait_until_healthy(port, timeout=60):
+    async def probe():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            status, _ = await http_request(reader, writer, 'GET', '/api/health')
+            return status == 200
+        finally:
+            writer.close()
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if asyncio.run(probe()):
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'server on port {port} did not become healthy')
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017')
+    parser.add_argument('--clients', default='50,200,1000')
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--latency-ms', type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.mongo_uri.startswith('mongodb+srv://'):
+        sys.exit('Refusing to seed and load-test a remote cluster; point --mongo-uri at a local mongod')
+
+    seed_database(args.mongo_uri)
+
+    mongo_uri = args.mongo_uri
+    proxy = None
+    if args.latency_ms > 0:
+        host, _, port = args.mongo_uri.split('://', 1)[1].split('/')[0].partition(':')
+        proxy = multiprocessing.Process(
+            target=run_latency_proxy, args=(27999, host, int(port or 27017), args.latency_ms), daemon=True
+        )
+        proxy.start()
+        # directConnection stops the driver from following mongod's advertised host past the proxy
+        mongo_uri = 'mongodb://127.0.0.1:27999/?directConnection=true'
+
+    env = dict(os.environ, MONGODB_ATLAS_URI=mongo_uri, FLASK_ENV='production')
+    client_counts = [int(count) for count in args.clients.split(',')]
+
+    print(f"mongod latency +{args.latency_ms:.0f}ms per round trip, {args.duration:.0f}s per run")
+    print(f"{'server':>7} {'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+
+    try:
+        for name, command in SERVERS.items():
+            port = 8100 if name == 'flask' else 8200
+            server = subprocess.Popen(
+                command + ['--bind', f'127.0.0.1:{port}'], cwd=BACKEND_DIR, env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                wait_until_healthy(port)
+                for clients in client_counts:
+                    latencies, errors = asyncio.run(run_load(port, clients, args.duration))
+                    print(f"{name:>7} {clients:>8} {len(latencies) / args.duration:>9.1f} "
+                          f"{statistics.median(latencies) * 1000 if latencies else 0:>8.1f} "
+                          f"{percentile(latencies, 95) * 1000:>8.1f} "
+                          f"{percentile(latencies, 99) * 1000:>8.1f} {len(errors):>7}")
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+    finally:
+        if proxy is not None:
+            proxy.terminate()
+
+
+if __name__ == '__main__':
+    main()
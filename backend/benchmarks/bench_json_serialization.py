@@ -0,0 +1,115 @@
+"""
+JSON Serialization Throughput Benchmark
+Encodes a page of synthetic appointments (ObjectId _id, datetime fields, as
+read from Mongo) the way the API used to and the way json_provider does now
+
+    legacy      copy each document, str() the _id and isoformat() the datetimes,
+                then json.dumps with sort_keys (Flask's default provider)
+    stdlib      json_provider's standard-library path (json.dumps + json_default)
+    orjson      json_provider's orjson path, when orjson is installed
+
+Usage: python benchmarks/bench_json_serialization.py [--size 10000] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bson import ObjectId
+
+import json_provider
+
+
+def make_appointments(size):
+    rng = random.Random(7)
+    start = datetime(2030, 1, 1, 8, 0)
+    created = datetime(2029, 12, 1, 12, 0, 0, 123456)
+    return [{
+        '_id': ObjectId(),
+        'id': f'bench-{i:06d}',
+        'patientName': f'Patient {i}',
+        'patientId': f'P{i:06d}',
+        'phone': '+27 82 000 0000',
+        'department': rng.choice(['emergency', 'general', 'cardiology', 'pediatrics']),
+        'departmentName': 'General Medicine',
+        'departmentColor': 'blue',
+        'doctor': 'Dr. Smith',
+        'doctorId': rng.choice(['dr_smith', 'dr_johnson', 'dr_williams']),
+        'dateTime': start + timedelta(minutes=30 * i),
+        'duration': 30,
+        'condition': 'Follow-up consultation',
+        'status': rng.choice(['pending', 'confirmed', 'completed']),
+        'priority': rng.choice(['low', 'medium', 'high']),
+        'notes': '',
+        'insuranceProvider': 'None',
+        'createdAt': created,
+        'updatedAt': created
+    } for i in range(size)]
+
+
+def legacy_encode(appointments):
+    converted = []
+    for appointment in appointments:
+        appointment = dict(appointment)
+        appointment['_id'] = str(appointment['_id'])
+        for field in ('dateTime', 'updatedAt', 'createdAt'):
+            if isinstance(appointment.get(field), datetime):
+                appointment[field] = appointment[field].isoformat()
+        converted.append(appointment)
+    return (json.dumps(converted, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def stdlib_encode(appointments):
+    return json.dumps(appointments, default=json_provider.json_default,
+                      separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def measure(encode, payload, repeat):
+    encode(payload)  # warm up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = encode(payload)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    payload = make_appointments(args.size)
+
+    encoders = {'legacy': legacy_encode, 'stdlib': stdlib_encode}
+    if json_provider.orjson is not None:
+        encoders['orjson'] = json_provider.dumps_bytes
+    else:
+        print("orjson not installed; skipping the orjson row")
+
+    # Every encoder must produce the same document
+    reference = json.loads(legacy_encode(payload))
+    for name, encode in encoders.items():
+        assert json.loads(encode(payload)) == reference, f'{name} output differs'
+
+    print(f"{args.size} appointments per payload, median of {args.repeat} runs")
+    print(f"{'encoder':>8} {'ms/payload':>11} {'payloads/s':>11} {'MB/s':>8} {'speedup':>8}")
+    baseline = None
+    for name, encode in encoders.items():
+        seconds, size = measure(encode, payload, args.repeat)
+        baseline = baseline or seconds
+        print(f"{name:>8} {seconds * 1000:>11.1f} {1 / seconds:>11.1f} "
+              f"{size / seconds / 1e6:>8.1f} {baseline / seconds:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Nearest-Facility Ranking Benchmark
+Ranks emergency facilities around random patient locations in South Africa
+for catalogues of 44 (today's production size) up to 10,000 facilities
+
+    scan        calculate_distance for every facility, then sort the list
+                (the snapshot fallback before spatial_index)
+    within      SpatialIndex.within, every facility inside --radius km
+    nearest     SpatialIndex.nearest, the 5 closest inside --radius km
+    batch       SpatialIndex.nearest_batch, the 5 closest for --patients
+                locations in one call, reported per location
+
+Without NumPy the index measures its candidates with math and batch falls
+back to one nearest() per location.
+
+Usage: python benchmarks/bench_spatial_index.py [--sizes 44,1000,10000] [--queries 500]
+       [--patients 10000] [--radius 50]
+"""
+
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import spatial_index
+from spatial_index import SpatialIndex
+
+# Rough bounding box of South Africa
+LAT_RANGE = (-34.8, -22.1)
+LNG_RANGE = (16.5, 32.9)
+
+
+def random_locations(count, seed):
+    rng = random.Random(seed)
+    return [(rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)) for _ in range(count)]
+
+
+def scan(facilities, lat, lng, radius):
+    lat_rad, lng_rad = math.radians(lat), math.radians(lng)
+    matches = []
+    for key, f_lat, f_lng in facilities:
+        f_lat_rad, f_lng_rad = math.radians(f_lat), math.radians(f_lng)
+        a = math.sin((f_lat_rad - lat_rad) / 2) ** 2 + \
+            math.cos(lat_rad) * math.cos(f_lat_rad) * math.sin((f_lng_rad - lng_rad) / 2) ** 2
+        distance = 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+        if distance <= radius:
+            matches.append((key, distance))
+    matches.sort(key=lambda match: match[1])
+    return matches[:5]
+
+
+def per_query(run, locations):
+    started = time.perf_counter()
+    for lat, lng in locations:
+        run(lat, lng)
+    return (time.perf_counter() - started) / len(locations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='44,1000,10000')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--patients', type=int, default=10000)
+    parser.add_argument('--radius', type=float, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    queries = random_locations(args.queries, seed=1)
+    patients = random_locations(args.patients, seed=2)
+    patient_lats = [lat for lat, _ in patients]
+    patient_lngs = [lng for _, lng in patients]
+
+    print(f"NumPy {'installed' if spatial_index.np is not None else 'not installed'}; "
+          f"{args.queries} queries, {args.radius:g} km radius, median of {args.repeat} runs, us/query")
+    print(f"{'facilities':>10} {'build ms':>9} {'scan':>8} {'within':>8} {'nearest':>8} {'batch':>8} {'speedup':>8}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        facilities = [(i, lat, lng) for i, (lat, lng) in enumerate(random_locations(size, seed=size))]
+
+        started = time.perf_counter()
+        index = SpatialIndex(facilities)
+        build = time.perf_counter() - started
+
+        # Both answer the same question
+        for lat, lng in queries[:20]:
+            assert [key for key, _ in scan(facilities, lat, lng, args.radius)] == \
+                [key for key, _ in index.nearest(lat, lng, 5, args.radius)]
+
+        def median(measure):
+            return statistics.median(measure() for _ in range(args.repeat))
+
+        scan_time = median(lambda: per_query(lambda lat, lng: scan(facilities, lat, lng, args.radius), queries))
+        within_time = median(lambda: per_query(lambda lat, lng: index.within(lat, lng, args.radius), queries))
+        nearest_time = median(lambda: per_query(lambda lat, lng: index.nearest(lat, lng, 5, args.radius), queries))
+
+        started = time.perf_counter()
+        index.nearest_batch(patient_lats, patient_lngs, 5)
+        batch_time = (time.perf_counter() - started) / len(patients)
+
+        print(f"{size:>10} {build * 1000:>9.1f} {scan_time * 1e6:>8.1f} {within_time * 1e6:>8.1f} "
+              f"{nearest_time * 1e6:>8.1f} {batch_time * 1e6:>8.1f} {scan_time / nearest_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+API Server Startup Benchmark
+Times a cold start of medroute_api_server in a fresh interpreter per run:
+
+    import      python start to `import medroute_api_server` returning; no
+                database I/O happens here, so this does not depend on Atlas
+    first       the first request after import, through the Flask test
+                client (GET /api/health/live by default, which touches no
+                database; pass --route to time one that does)
+    total       import + first
+
+Run it before and after a change to see what it adds to a worker's
+import-to-first-request latency. A regression in `import` usually means a
+module started doing I/O at import time.
+
+Usage: python benchmarks/bench_startup.py [--repeat 10] [--route /api/health/live]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child; prints one JSON line of timings
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import medroute_api_server
+imported = time.perf_counter()
+response = medroute_api_server.app.test_client().get(sys.argv[1])
+answered = time.perf_counter()
+print(json.dumps({'import': imported - started, 'first': answered - imported, 'status': response.status_code}))
+"""
+
+
+def run_once(route):
+    result = subprocess.run([sys.executable, '-c', PROBE, route], cwd=BACKEND_DIR,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--route', default='/api/health/live')
+    args = parser.parse_args()
+
+    runs = [run_once(args.route) for _ in range(args.repeat)]
+    statuses = sorted({run['status'] for run in runs})
+    timings = {
+        'import': [run['import'] for run in runs],
+        'first': [run['first'] for run in runs],
+        'total': [run['import'] + run['first'] for run in runs]
+    }
+
+    print(f"GET {args.route} (status {', '.join(map(str, statuses))}), {args.repeat} cold starts")
+    print(f"{'phase':>8} {'median ms':>10} {'p95 ms':>8}")
+    for phase, values in timings.items():
+        print(f"{phase:>8} {statistics.median(values) * 1000:>10.1f} {percentile(values, 0.95) * 1000:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Triage Rules Engine Micro-benchmark
+Per-assessment cost of the compiled rule table as it grows from the shipped
+rules to hundreds of clinical phrases, against the old per-phrase substring scan
+
+Usage: python benchmarks/bench_triage_rules.py
+"""
+
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from triage_rules import DEFAULT_RULES_PATH, TriageRulesEngine
+
+BODY_PARTS = ['abdominal', 'lower back', 'neck', 'shoulder', 'knee', 'wrist', 'ankle', 'pelvic',
+              'eye', 'ear', 'throat', 'jaw', 'hip', 'flank', 'groin', 'scalp', 'rib', 'calf']
+FINDINGS = ['pain', 'swelling', 'numbness', 'rash', 'bleeding', 'stiffness', 'tenderness',
+            'weakness', 'burning', 'itching', 'spasm', 'bruising', 'discharge', 'cramping']
+MODIFIERS = ['sudden', 'persistent', 'recurring', 'sharp', 'dull', 'radiating', 'worsening']
+
+SAMPLE_TEXTS = [
+    'Sudden chest pain radiating to the left arm with sweating',
+    'mild cough and runny nose for three days',
+    'Fell off a ladder, possible broken bone in the wrist and swelling',
+    'child with high fever and rash, not eating',
+    'persistent lower back pain worse in the morning, joint stiffness',
+    'allergic reaction after eating peanuts, lips swelling, difficulty breathing',
+    'Headache and dizziness since yesterday, no vomiting',
+]
+
+
+def build_rules_table(extra_phrases):
+    """Shipped rule table padded with generated clinical phrases"""
+    with open(DEFAULT_RULES_PATH, 'r') as f:
+        table = json.load(f)
+
+    rng = random.Random(42)
+    phrases = set(rule['phrase'] for rule in table['rules'])
+    urgencies = ['High', 'Medium', 'Low']
+    departments = list(table['departments'])
+
+    target = len(phrases) + extra_phrases
+    while len(phrases) < target:
+        phrase = f"{rng.choice(MODIFIERS)} {rng.choice(BODY_PARTS)} {rng.choice(FINDINGS)}"
+        if phrase in phrases:
+            continue
+        phrases.add(phrase)
+        if rng.random() < 0.5:
+            table['rules'].append({'phrase': phrase, 'urgency': rng.choice(urgencies)})
+        else:
+            table['rules'].append({'phrase': phrase, 'department': rng.choice(departments)})
+
+    return table
+
+
+def naive_assess(phrases, text):
+    """The previous approach: one substring scan per phrase"""
+    text = text.lower()
+    return [phrase for phrase in phrases if phrase in text]
+
+
+def main():
+    iterations = 2000
+
+    print(f"{'phrases':>8} {'compile ms':>11} {'engine us':>10} {'substring us':>13}")
+    for extra in (0, 100, 250, 500, 1000):
+        table = build_rules_table(extra)
+
+        start = timeit.default_timer()
+        engine = TriageRulesEngine(table)
+        compile_ms = (timeit.default_timer() - start) * 1000
+
+        phrases = [rule['phrase'] for rule in table['rules']]
+
+        engine_time = timeit.timeit(
+            lambda: [engine.assess(text, 'moderate', 40) for text in SAMPLE_TEXTS],
+            number=iterations
+        )
+        naive_time = timeit.timeit(
+            lambda: [naive_assess(phrases, text) for text in SAMPLE_TEXTS],
+            number=iterations
+        )
+
+        per_call = iterations * len(SAMPLE_TEXTS)
+        print(f"{len(phrases):>8} {compile_ms:>11.2f} {engine_time / per_call * 1e6:>10.2f} "
+              f"{naive_time / per_call * 1e6:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Live Department Capacity Events
+Turns department_capacity changes into a numbered event log that the
+Server-Sent Events endpoint fans out to dashboards
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from facility_snapshot import CHANGE_STREAMS_UNSUPPORTED
+
+
+@dataclass(frozen=True)
+class CapacityEvent:
+    seq: int
+    department_id: object
+    capacity: Dict
+
+    def event_id(self, epoch: str) -> str:
+        return f"{epoch}-{self.seq}"
+
+
+class CapacityEventHub:
+    """
+    Collects changed department_capacity rows from a change stream (or, where
+    change streams are unavailable, by polling Last_updated) into a bounded
+    history. Event IDs are '<epoch>-<seq>', so a client reconnecting with
+    Last-Event-ID resumes exactly where it stopped as long as it reconnects
+    to the same process and the history still holds its position.
+
+    max_subscribers bounds the streams open at once (None for no bound):
+    under gthread workers each open stream holds a request thread.
+    """
+
+    def __init__(self, db, history_size: int = 1000, poll_interval: float = 5.0,
+                 max_subscribers: Optional[int] = None):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+        self.epoch = format(int(time.time() * 1000), 'x')
+
+        self._history = deque(maxlen=history_size)
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_polled = None
+        self._subscribers_lock = threading.Lock()
+
+        # Metrics
+        self.mode = 'stopped'
+        self.published = 0
+        self.subscribers = 0
+        self.rejected_subscribers = 0
+
+    def start(self):
+        """Start the background watcher (safe to call more than once)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='capacity-events', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.mode = 'stopped'
+        with self._condition:
+            self._condition.notify_all()
+
+    def publish(self, capacity: Dict):
+        """Record a changed capacity row and wake every waiting subscriber"""
+        with self._condition:
+            self._seq += 1
+            self._history.append(CapacityEvent(self._seq, capacity.get('Department_ID'), capacity))
+            self.published += 1
+            self._condition.notify_all()
+
+    def subscribe(self) -> bool:
+        """Count a new stream in; False when max_subscribers streams are already open"""
+        with self._subscribers_lock:
+            if self.max_subscribers is not None and self.subscribers >= self.max_subscribers:
+                self.rejected_subscribers += 1
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self._subscribers_lock:
+            self.subscribers -= 1
+
+    def current_seq(self) -> int:
+        with self._condition:
+            return self._seq
+
+    def resume_position(self, last_event_id: Optional[str]) -> Optional[int]:
+        """
+        Sequence number to resume after, or None when the client must be sent
+        a fresh snapshot (no ID, another process's ID, or history overrun).
+        """
+        if not last_event_id:
+            return None
+
+        epoch, _, seq = last_event_id.partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+
+        seq = int(seq)
+        with self._condition:
+            oldest = self._history[0].seq if self._history else self._seq + 1
+            if seq > self._seq or seq < oldest - 1:
+                return None
+        return seq
+
+    def wait_for_events(self, after_seq: int, timeout: float) -> List[CapacityEvent]:
+        """Block until events newer than after_seq exist or timeout expires"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > after_seq or self._stop.is_set(), timeout)
+            return [event for event in self._history if event.seq > after_seq]
+
+    def stats(self) -> Dict:
+        return {
+            'mode': self.mode,
+            'epoch': self.epoch,
+            'last_seq': self._seq,
+            'published': self.published,
+            'subscribers': self.subscribers,
+            'max_subscribers': self.max_subscribers,
+            'rejected_subscribers': self.rejected_subscribers,
+            'history': len(self._history)
+        }
+
+    def _run(self):
+        change_streams_supported = True
+
+        while not self._stop.is_set():
+            if change_streams_supported:
+                try:
+                    self._watch_changes()
+                    continue
+                except OperationFailure as e:
+                    if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                        print("Change streams unavailable, polling department capacity instead")
+                        change_streams_supported = False
+                    else:
+                        print(f"Capacity change stream failed: {e}")
+                except PyMongoError as e:
+                    print(f"Capacity change stream failed: {e}")
+
+            self.mode = 'poll'
+            try:
+                self._poll_changes()
+            except PyMongoError as e:
+                print(f"Error polling department capacity: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _watch_changes(self):
+        pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace']}}}]
+        collection = self.db.get_collection('department_capacity')
+
+        with collection.watch(pipeline, full_document='updateLookup', max_await_time_ms=1000) as stream:
+            self.mode = 'change_stream'
+            while not self._stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is not None and change.get('fullDocument'):
+                    self.publish(change['fullDocument'])
+
+    def _poll_changes(self):
+        collection = self.db.get_collection('department_capacity')
+
+        if self._last_polled is None:
+            # Start from the newest row; history before the hub started is not replayed
+            newest = collection.find_one({}, sort=[('Last_updated', -1)])
+            self._last_polled = newest.get('Last_updated') if newest else datetime.utcnow()
+            return
+
+        for capacity in collection.find({'Last_updated': {'$gt': self._last_polled}}).sort('Last_updated', 1):
+            self._last_polled = capacity['Last_updated']
+            self.publish(capacity)
@@ -0,0 +1,166 @@
+"""
+Circuit Breaker for Atlas Calls
+Trips after consecutive failed or timed-out Atlas calls so that, while Atlas
+is unreachable, request handlers fail at once with CircuitOpenError instead
+of each waiting out serverSelectionTimeoutMS, and bounds every call it
+guards by a per-call timeout
+
+After reset_timeout one trial call is let through (half-open): success
+closes the circuit, failure opens it for another reset_timeout. Only errors
+that say Atlas is unreachable or too slow count as failures; a duplicate key
+or a validation error is an answer from Atlas, not an outage.
+
+Configuration (environment):
+    ATLAS_CIRCUIT_FAILURES          consecutive failures that open the circuit (default 5)
+    ATLAS_CIRCUIT_RESET_SECONDS     how long the circuit stays open before a trial call (default 30)
+    ATLAS_CALL_TIMEOUT_MS           time limit of each guarded call (default 2000)
+"""
+
+import asyncio
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+import pymongo
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, WTimeoutError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Server selection, network and operation timeouts; TimeoutError covers asyncio.wait_for
+ATLAS_UNAVAILABLE_ERRORS = (ConnectionFailure, ExecutionTimeout, WTimeoutError, TimeoutError, asyncio.TimeoutError)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Atlas while the circuit is open"""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} circuit open, retry in {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def retry_after(error: Exception, default: int = 5) -> int:
+    """Retry-After seconds for a 503 caused by error"""
+    return error.retry_after if isinstance(error, CircuitOpenError) else default
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker shared by every request thread of a
+    process. call_timeout is applied with pymongo.timeout(), which also caps
+    server selection, so no guarded call waits longer than it.
+    """
+
+    def __init__(self, name: str = 'atlas', failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 call_timeout: float = 2.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.call_timeout = call_timeout
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may go to Atlas now"""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._trial_in_flight = False
+
+            if self._state == OPEN or (self._state == HALF_OPEN and self._trial_in_flight):
+                self.rejected += 1
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                raise CircuitOpenError(self.name, max(1, math.ceil(remaining)))
+
+            if self._state == HALF_OPEN:
+                self._trial_in_flight = True
+            self.calls += 1
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opened += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    @contextmanager
+    def guard(self):
+        """Run the block as one Atlas call: rejected while open, time-limited, and counted"""
+        self.allow()
+        try:
+            with pymongo.timeout(self.call_timeout if self.call_timeout > 0 else None):
+                yield
+        except ATLAS_UNAVAILABLE_ERRORS:
+            self.record_failure()
+            raise
+        except BaseException:
+            # Atlas answered (or was never reached); either way it is not down
+            self.record_success()
+            raise
+        self.record_success()
+
+    def call(self, fetch: Callable):
+        with self.guard():
+            return fetch()
+
+    def stats(self) -> Dict:
+        return {
+            'state': self._state,
+            'consecutive_failures': self._failures,
+            'failure_threshold': self.failure_threshold,
+            'reset_timeout_seconds': self.reset_timeout,
+            'call_timeout_seconds': self.call_timeout,
+            'calls': self.calls,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'opened': self.opened
+        }
+
+
+class AsyncCircuitBreaker(CircuitBreaker):
+    """The same breaker for Motor coroutines; the timeout is applied with asyncio.wait_for"""
+
+    async def call(self, fetch: Callable):
+        """fetch() returns the awaitable, so nothing is created when the circuit is open"""
+        self.allow()
+        try:
+            if self.call_timeout > 0:
+                result = await asyncio.wait_for(fetch(), self.call_timeout)
+            else:
+                result = await fetch()
+        except ATLAS_UNAVAILABLE_ERRORS:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.record_success()
+            raise
+        self.record_success()
+        return result
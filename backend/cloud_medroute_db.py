@@ -6,12 +6,45 @@ import pymongo
 from pymongo import MongoClient
 from datetime import datetime
 import os
+import threading
 from dotenv import load_dotenv
 import certifi
 
+from metrics import MONGO_COMMAND_LISTENER
+from query_budget import QUERY_BUDGET_LISTENER
+
 load_dotenv()
 
+DATABASE_NAME = 'medroute_production'
+
+def mongo_client_options(connection_string):
+    """Client settings shared by the sync and async database wrappers"""
+    options = {
+        'retryWrites': True,
+        'w': 'majority',
+        'serverSelectionTimeoutMS': 5000,  # 5 second timeout
+        'maxPoolSize': 50,  # Connection pool size
+        'minPoolSize': 5
+    }
+    
+    # Atlas (mongodb+srv) always uses TLS; a plain local mongod usually does not
+    uses_tls = connection_string.startswith('mongodb+srv://') or any(
+        flag in connection_string.lower() for flag in ('tls=true', 'ssl=true')
+    )
+    if uses_tls:
+        options['tlsCAFile'] = certifi.where()  # SSL certificate bundle
+    
+    return options
+
 class CloudMedRouteDB:
+    """
+    Lazily created MongoClient wrapper that is safe to create before a
+    prefork server forks. Constructing it does no I/O: the client is opened
+    on first use, in the process that uses it, so a client's pool and monitor
+    threads are never shared with a child process. Indexes are not touched
+    here; they are managed by the versioned migrations in migrations.py.
+    """
+    
     def __init__(self):
         # Cloud connection string from environment variable
         self.connection_string = os.getenv('MONGODB_ATLAS_URI')
@@ -19,92 +52,62 @@ class CloudMedRouteDB:
         if not self.connection_string:
             raise ValueError("MONGODB_ATLAS_URI environment variable not set")
         
-        self.database_name = 'medroute_production'
-        self.client = None
-        self.db = None
-        self.connect()
+        self.database_name = DATABASE_NAME
+        self._client = None
+        self._db = None
+        self._pid = None
+        self._open_lock = threading.Lock()
+    
+    @property
+    def client(self):
+        self._ensure_client()
+        return self._client
+    
+    @property
+    def db(self):
+        self._ensure_client()
+        return self._db
+    
+    def _ensure_client(self):
+        """Open this process's client on first use, or again if the current one was inherited through fork"""
+        if self._pid == os.getpid():
+            return
+        with self._open_lock:
+            if self._pid != os.getpid():
+                # MongoClient connects in the background; nothing here waits on Atlas
+                self._client = MongoClient(
+                    self.connection_string,
+                    # Command timings for /api/metrics and per-request round-trip budgets
+                    event_listeners=[MONGO_COMMAND_LISTENER, QUERY_BUDGET_LISTENER],
+                    **mongo_client_options(self.connection_string)
+                )
+                self._db = self._client[self.database_name]
+                self._pid = os.getpid()
     
     def connect(self):
+        """Eagerly verify the connection (scripts); servers never need to call this"""
         try:
-            # Connect with SSL certificate verification
-            self.client = MongoClient(
-                self.connection_string,
-                tlsCAFile=certifi.where(),  # SSL certificate bundle
-                retryWrites=True,
-                w='majority',
-                serverSelectionTimeoutMS=5000,  # 5 second timeout
-                maxPoolSize=50,  # Connection pool size
-                minPoolSize=5
-            )
-            
-            self.db = self.client[self.database_name]
-            
-            # Test connection
             self.client.admin.command('ping')
             print(f"✅ Connected to MongoDB Atlas cluster: {self.database_name}")
-            
-            # Create indexes for production
-            self._create_production_indexes()
-            
             return True
         except Exception as e:
             print(f"❌ Error connecting to MongoDB Atlas: {e}")
             return False
     
-    def _create_production_indexes(self):
-        """Create optimized indexes for production workload"""
-        try:
-            # Patient indexes for fast lookups
-            self.db.patients.create_index([("Patient_email", 1)], unique=True, sparse=True)
-            self.db.patients.create_index([("Patient_phone", 1)])
-            self.db.patients.create_index([("Patient_district", 1)])
-            
-            # Medical consultation indexes for analytics
-            self.db.medical_consultations.create_index([
-                ("Consultation_Date", -1),
-                ("Patient_ID", 1)
-            ])
-            self.db.medical_consultations.create_index([("Doctor_ID", 1)])
-            self.db.medical_consultations.create_index([("Facility_ID", 1)])
-            self.db.medical_consultations.create_index([("Admitted", 1)])
-            
-            # Appointment scheduling indexes
-            self.db.appointments.create_index([
-                ("Date", 1),
-                ("Time_ID", 1)
-            ])
-            self.db.appointments.create_index([("Patient_id", 1)])
-            self.db.appointments.create_index([("assigned_doctor_id", 1)])
-            self.db.appointments.create_index([("urgency_level", 1)])
-            
-            # ML predictions indexes for analysis
-            self.db.medical_consultations.create_index([
-                ("ml_triage_result.symptom_analysis.severity_score", -1)
-            ])
-            self.db.medical_consultations.create_index([
-                ("ml_triage_result.urgency_level", 1)
-            ])
-            
-            # Doctor availability indexes
-            self.db.doctor_assignments.create_index([
-                ("Department_ID", 1),
-                ("End_date", 1)
-            ])
-            
-            # Capacity monitoring indexes
-            self.db.department_capacity.create_index([("Department_ID", 1)], unique=True)
-            
-            print("✅ Production indexes created successfully")
-            
-        except Exception as e:
-            print(f"⚠️ Warning: Some indexes may already exist: {e}")
+    def create_indexes(self, force=False):
+        """Apply the versioned index migrations (see migrations.py)"""
+        from migrations import apply_migrations
+        return apply_migrations(self, force=force)
     
     def get_collection(self, collection_name):
         return self.db[collection_name]
     
     def close_connection(self):
-        if self.client:
-            self.client.close()
+        if self._client:
+            self._client.close()
+            self._client = None
+            self._db = None
+            self._pid = None
 
 # Environment configuration template
 def create_env_template():
@@ -0,0 +1,100 @@
+"""
+Shared Route Test Fixtures
+The Flask API with medroute_production seeded on a disposable MongoDB, for
+the tests that drive routes end to end (round-trip budgets, double booking,
+the appointment page cache). Without MEDROUTE_TEST_MONGO_URI they are skipped:
+    MEDROUTE_TEST_MONGO_URI=mongodb://localhost:27017 python -m pytest
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+TEST_MONGO_URI = os.environ.get('MEDROUTE_TEST_MONGO_URI')
+
+APPOINTMENT = {
+    'patientName': 'Budget Patient', 'phone': '+27 000000000', 'department': 'general',
+    'doctor': 'Dr. Smith', 'doctorId': 'dr_smith', 'dateTime': '2030-01-01T09:00:00',
+    'duration': 30, 'condition': 'Check-up'
+}
+
+
+@pytest.fixture(scope='module')
+def api():
+    if not TEST_MONGO_URI or TEST_MONGO_URI.startswith('mongodb+srv://'):
+        pytest.skip('set MEDROUTE_TEST_MONGO_URI to a disposable local mongod')
+
+    os.environ['MONGODB_ATLAS_URI'] = TEST_MONGO_URI
+    os.environ['QUERY_BUDGET_MODE'] = 'raise'
+    os.environ.setdefault('TRIAGE_SPILL_PATH', os.path.join(os.path.dirname(__file__), 'test_triage.spill.ndjson'))
+
+    import medroute_api_server as api
+
+    seed_database(api.db.db)
+    api.facility_projector.rebuild()
+    api.app.config['TESTING'] = True
+
+    # Warm the process-wide state the routes read so only per-request work is counted
+    api.facility_cache.get()
+    api.appointment_counters.rebuild()
+    api.appointment_cache.clear()
+    return api
+
+
+@pytest.fixture
+def appointment():
+    """A valid POST /api/appointments body; override fields with dict(appointment, ...)"""
+    return dict(APPOINTMENT)
+
+
+@pytest.fixture
+def round_trips(api):
+    """Issue one request and return how many MongoDB commands it took"""
+    from query_budget import query_budget
+
+    def count(method, path, **kwargs):
+        with query_budget(f'{method} {path}') as budget:
+            response = api.app.test_client().open(path, method=method, **kwargs)
+        assert response.status_code < 500, response.get_data(as_text=True)
+        return budget.round_trips
+
+    return count
+
+
+def seed_database(database):
+    now = datetime.utcnow()
+    facilities, departments, capacity = [], [], []
+    for facility_id in (1, 2, 3):
+        lat, lng = -26.2 + facility_id * 0.01, 28.0 + facility_id * 0.01
+        facilities.append({
+            '_id': facility_id, 'Name': f'Test Hospital {facility_id}', 'City': 'Johannesburg',
+            'Province': 'Gauteng', 'Facility_type': 'Hospital', 'Level_of_care': 'Secondary',
+            'latitude': lat, 'longitude': lng,
+            'location': {'type': 'Point', 'coordinates': [lng, lat]}, 'has_emergency': True
+        })
+        for index, name in enumerate(('Emergency', 'Pediatrics', 'Cardiology')):
+            dept_id = facility_id * 100 + index
+            departments.append({'_id': dept_id, 'Facility_ID': facility_id, 'Name': name, 'Capacity_beds': 20})
+            capacity.append({'Department_ID': dept_id, 'Current_patients': 5, 'Current_beds_available': 15,
+                             'Current_doctors_on_duty': 2, 'Last_updated': now})
+
+    doctors = [{'_id': doctor_id} for doctor_id in (1, 2, 3)]
+    assignments = [{'Doctor_ID': doctor_id, 'Department_ID': 100, 'End_date': None} for doctor_id in (1, 2, 3)]
+    specializations = [{'Doctor_ID': doctor_id, 'Specialization_ID': 1} for doctor_id in (1, 2, 3)]
+    consultations = [{'Doctor_ID': doctor_id, 'Consultation_Date': now} for doctor_id in (1, 2, 3)]
+
+    appointments = [{
+        'id': f'budget-{i}', 'patientName': f'Patient {i}', 'phone': '+27 000000000',
+        'department': 'general', 'doctor': 'Dr. Smith', 'doctorId': 'dr_smith',
+        'dateTime': now + timedelta(hours=i), 'duration': 30, 'condition': 'Follow-up', 'status': 'pending'
+    } for i in range(10)]
+
+    for name, docs in (('facilities', facilities), ('departments', departments),
+                       ('department_capacity', capacity), ('doctors', doctors),
+                       ('doctor_assignments', assignments), ('doctor_specializations', specializations),
+                       ('medical_consultations', consultations), ('appointments', appointments),
+                       ('triage_assessments', []), ('appointment_slots', []), ('facility_read_model', [])):
+        database[name].delete_many({})
+        if docs:
+            database[name].insert_many(docs)
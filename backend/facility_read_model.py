@@ -0,0 +1,360 @@
+"""
+Denormalized Facility Read Model
+One document per facility in the facility_read_model collection holding
+everything listing and emergency routing derive from a facility and its
+departments: specialties, emergency level, emergency department, pediatric
+flag and coordinates, computed when the source changes instead of per request
+
+The projector rebuilds the collection once when it starts, then re-projects
+only the facilities a facilities/departments change touches (or rebuilds
+every poll interval where change streams are unavailable).
+
+Every server process builds a projector, but with a lease only one of them
+(across workers and hosts) follows changes at a time: the holder renews a
+document in projector_leases, the others stand by and take over once it
+expires. Projection is deterministic, so the overlap when a lease changes
+hands only writes the same documents twice.
+
+Run as a standalone job: python facility_read_model.py [--once]
+"""
+
+import argparse
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+
+from api_common import (
+    facility_location, get_facility_coordinates, map_facility_type_to_emergency_level, specialties_from_departments
+)
+from facility_snapshot import CHANGE_STREAMS_UNSUPPORTED
+
+READ_MODEL_COLLECTION = 'facility_read_model'
+SOURCE_COLLECTIONS = ('facilities', 'departments')
+LEASE_COLLECTION = 'projector_leases'
+DEFAULT_LEASE_SECONDS = 30.0
+
+
+def find_emergency_department(departments: Iterable[Dict]) -> Optional[Dict]:
+    for dept in departments:
+        if 'Emergency' in dept.get('Name', ''):
+            return dept
+    return None
+
+
+def project_facility(facility: Dict, departments: List[Dict]) -> Dict:
+    """The read model document for a facility and its departments"""
+    emergency_dept = find_emergency_department(departments)
+    emergency_level = map_facility_type_to_emergency_level(
+        facility.get('Facility_type', ''),
+        facility.get('Level_of_care', '')
+    )
+
+    document = {
+        '_id': facility['_id'],
+        'name': facility.get('Name', 'Unknown Hospital'),
+        'address': f"{facility.get('Address', '')}, {facility.get('City', '')}, {facility.get('Province', '')}",
+        'phone': facility.get('Phone', ''),
+        'city': facility.get('City', ''),
+        'province': facility.get('Province', ''),
+        'facilityType': facility.get('Facility_type', 'Hospital'),
+        'ownership': facility.get('Ownership_type', 'Public'),
+        'capacityBeds': facility.get('capacity_beds', 50),
+        'coordinates': get_facility_coordinates(facility),
+        'specialties': sorted(specialties_from_departments(departments)),
+        'emergencyLevel': emergency_level,
+        'isLevel1Trauma': 'Level 1' in emergency_level,
+        'acceptsEmergencies': facility.get('has_emergency') is True or facility.get('Facility_type') == 'Emergency Center',
+        'emergencyDepartmentId': emergency_dept['_id'] if emergency_dept else None,
+        'emergencyDepartmentBeds': emergency_dept.get('Capacity_beds', 15) if emergency_dept else None,
+        'pediatric': any(
+            'Pediatric' in dept.get('Name', '') or 'Children' in facility.get('Name', '') for dept in departments
+        ),
+        'hasAmbulance': facility.get('Facility_type') != 'Clinic',
+        # crc32 rather than hash() so every worker and restart agrees on the rating
+        'rating': 4.0 + (zlib.crc32(facility.get('Name', '').encode('utf-8')) % 10) / 10,
+        'departmentIds': [dept['_id'] for dept in departments]
+    }
+    # Only facilities with their own coordinates are routable; databases loaded before
+    # the uploader stored GeoJSON only have latitude/longitude, so build the point from those
+    location = facility_location(facility)
+    if location:
+        document['location'] = location
+    return document
+
+
+class Lease:
+    """
+    A named lease in LEASE_COLLECTION held by one process at a time.
+    acquire() takes a free or expired lease, or extends one already held;
+    taking a held one upserts a second document with the same _id and fails
+    on the duplicate key. The owner includes the PID, so forked workers that
+    share this object still compete with each other.
+    """
+
+    def __init__(self, db, name: str, seconds: float = DEFAULT_LEASE_SECONDS):
+        self.db = db
+        self.name = name
+        self.seconds = seconds
+        self._token = uuid.uuid4().hex[:8]
+
+    @property
+    def owner(self) -> str:
+        return f'{socket.gethostname()}:{os.getpid()}:{self._token}'
+
+    @property
+    def collection(self):
+        return self.db.get_collection(LEASE_COLLECTION)
+
+    def acquire(self) -> bool:
+        owner = self.owner
+        now = datetime.utcnow()
+        try:
+            self.collection.find_one_and_update(
+                {'_id': self.name, '$or': [{'owner': owner}, {'expiresAt': {'$lt': now}}]},
+                {'$set': {'owner': owner, 'expiresAt': now + timedelta(seconds=self.seconds)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def release(self):
+        self.collection.delete_one({'_id': self.name, 'owner': self.owner})
+
+
+class FacilityReadModelProjector:
+    """
+    Keeps facility_read_model in step with facilities and departments.
+    A background thread follows a change stream on both collections and
+    re-projects just the affected facilities, debouncing bursts (e.g. a bulk
+    upload) into one write. With lease_seconds set it only does so while it
+    holds the projector lease, renewing it every third of the lease.
+    """
+
+    def __init__(self, db, poll_interval: float = 300.0, debounce_seconds: float = 1.0,
+                 lease_seconds: Optional[float] = None):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.debounce_seconds = debounce_seconds
+        self.lease = Lease(db, READ_MODEL_COLLECTION, lease_seconds) if lease_seconds else None
+        self._lease_renewed_at = None
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._change_streams_supported = True
+
+        # Metrics
+        self.mode = 'stopped'
+        self.rebuilds = 0
+        self.projected = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_projected_at = None
+
+    @property
+    def collection(self):
+        return self.db.get_collection(READ_MODEL_COLLECTION)
+
+    def start(self):
+        """Start the background projector (safe to call more than once)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='facility-read-model', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.mode = 'stopped'
+        if self.lease and self._lease_renewed_at is not None:
+            self._lease_renewed_at = None
+            try:
+                self.lease.release()
+            except PyMongoError as e:
+                print(f"Error releasing facility read model lease: {e}")
+
+    def rebuild(self) -> int:
+        """Project every facility and drop read model documents whose facility is gone"""
+        with self._lock:
+            facilities = list(self.db.get_collection('facilities').find({}))
+            departments = self._departments_by_facility({})
+            self._write(facilities, departments)
+            self.collection.delete_many({'_id': {'$nin': [facility['_id'] for facility in facilities]}})
+            self.rebuilds += 1
+            return len(facilities)
+
+    def project(self, facility_ids: Iterable) -> int:
+        """Re-project only the given facilities"""
+        facility_ids = list(facility_ids)
+        if not facility_ids:
+            return 0
+        with self._lock:
+            facilities = list(self.db.get_collection('facilities').find({'_id': {'$in': facility_ids}}))
+            departments = self._departments_by_facility({'Facility_ID': {'$in': facility_ids}})
+            self._write(facilities, departments)
+            found = {facility['_id'] for facility in facilities}
+            removed = [facility_id for facility_id in facility_ids if facility_id not in found]
+            if removed:
+                self.collection.delete_many({'_id': {'$in': removed}})
+            return len(facilities)
+
+    def stats(self) -> Dict:
+        return {
+            'mode': self.mode,
+            'leader': self.lease is None or self._lease_renewed_at is not None,
+            'rebuilds': self.rebuilds,
+            'projected': self.projected,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'age_seconds': round(time.time() - self.last_projected_at, 1) if self.last_projected_at else None
+        }
+
+    def _departments_by_facility(self, query: Dict) -> Dict:
+        grouped: Dict = {}
+        for dept in self.db.get_collection('departments').find(query).sort('_id', 1):
+            grouped.setdefault(dept.get('Facility_ID'), []).append(dept)
+        return grouped
+
+    def _write(self, facilities: List[Dict], departments: Dict):
+        if not facilities:
+            return
+        self.collection.bulk_write([
+            ReplaceOne({'_id': facility['_id']},
+                       project_facility(facility, departments.get(facility['_id'], [])),
+                       upsert=True)
+            for facility in facilities
+        ], ordered=False)
+        self.projected += len(facilities)
+        self.last_projected_at = time.time()
+
+    def _affected_facilities(self, change: Dict) -> Set:
+        if change['ns']['coll'] == 'facilities':
+            return {change['documentKey']['_id']}
+
+        affected = set()
+        department = change.get('fullDocument')
+        if department and 'Facility_ID' in department:
+            affected.add(department['Facility_ID'])
+        # A deleted (or moved) department is only known to the facility that listed it
+        department_id = change['documentKey']['_id']
+        affected.update(doc['_id'] for doc in self.collection.find({'departmentIds': department_id}, {'_id': 1}))
+        return affected
+
+    def _safely(self, action, *args):
+        try:
+            action(*args)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            print(f"Error projecting facility read model: {e}")
+
+    def _holds_lease(self) -> bool:
+        """Renew the lease when a third of it has passed; False if another process holds it"""
+        if self.lease is None:
+            return True
+        now = time.monotonic()
+        if self._lease_renewed_at is not None and now - self._lease_renewed_at < self.lease.seconds / 3:
+            return True
+        try:
+            held = self.lease.acquire()
+        except PyMongoError as e:
+            print(f"Facility read model lease not renewed: {e}")
+            held = False
+        self._lease_renewed_at = now if held else None
+        return held
+
+    def _wait(self, seconds: float) -> bool:
+        """Sleep, renewing the lease meanwhile; True once stopped or the lease is lost"""
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            step = min(remaining, self.lease.seconds / 3) if self.lease else remaining
+            if self._stop.wait(step) or not self._holds_lease():
+                return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._holds_lease():
+                self._project_while_leader()
+            elif not self._stop.is_set():
+                self.mode = 'standby'
+                self._stop.wait(self.lease.seconds / 3)
+
+    def _project_while_leader(self):
+        self._safely(self.rebuild)
+
+        while not self._stop.is_set() and self._holds_lease():
+            if self._change_streams_supported:
+                try:
+                    self._watch_changes()
+                    continue
+                except OperationFailure as e:
+                    if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                        print("Change streams unavailable, rebuilding facility read model on a timer instead")
+                        self._change_streams_supported = False
+                    else:
+                        print(f"Facility read model change stream failed: {e}")
+                except PyMongoError as e:
+                    print(f"Facility read model change stream failed: {e}")
+
+            self.mode = 'poll'
+            if self._wait(self.poll_interval):
+                break
+            self._safely(self.rebuild)
+
+    def _watch_changes(self):
+        pipeline = [{'$match': {'ns.coll': {'$in': list(SOURCE_COLLECTIONS)}}}]
+
+        with self.db.db.watch(pipeline, full_document='updateLookup', max_await_time_ms=1000) as stream:
+            self.mode = 'change_stream'
+
+            # Catch anything written before the stream opened
+            self._safely(self.rebuild)
+
+            while not self._stop.is_set() and stream.alive and self._holds_lease():
+                change = stream.try_next()
+                if change is None:
+                    continue
+
+                # Let bulk uploads settle, then project every facility they touched at once
+                time.sleep(self.debounce_seconds)
+                affected = set()
+                while change is not None:
+                    affected |= self._affected_facilities(change)
+                    change = stream.try_next()
+                self._safely(self.project, affected)
+
+
+if __name__ == '__main__':
+    from cloud_medroute_db import CloudMedRouteDB
+
+    parser = argparse.ArgumentParser(description='Project facilities and departments into facility_read_model')
+    parser.add_argument('--once', action='store_true', help='rebuild and exit instead of following changes')
+    args = parser.parse_args()
+
+    # Shares the lease with the servers' projectors, so running it alongside them is safe
+    projector = FacilityReadModelProjector(
+        CloudMedRouteDB(),
+        lease_seconds=float(os.environ.get('FACILITY_READ_MODEL_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+    )
+    if args.once:
+        print(f"Projected {projector.rebuild()} facilities into {READ_MODEL_COLLECTION}")
+    else:
+        projector.start()
+        try:
+            while True:
+                time.sleep(60)
+                print(f"Facility read model: {projector.stats()}")
+        except KeyboardInterrupt:
+            projector.stop()
@@ -0,0 +1,247 @@
+"""
+In-process Facility Snapshot Cache for the MedRoute API Server
+Keeps an immutable copy of the near-static facilities and departments
+collections in memory and rebuilds it in the background
+
+Each facility's read model (facility_read_model.project_facility) is
+computed once per rebuild, so listings format precomputed documents, and so
+is a spatial index over the facilities that accept emergencies.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from single_flight import SingleFlight
+from spatial_index import SpatialIndex
+
+# Server error code returned when change streams are not supported (standalone mongod)
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+
+@dataclass(frozen=True)
+class FacilitySnapshot:
+    """Read-only view of the facility catalogue at one point in time"""
+    facilities: Tuple[Mapping, ...]
+    facilities_by_id: Mapping
+    departments_by_facility: Mapping
+    departments_by_id: Mapping
+    read_models: Mapping
+    emergency_index: SpatialIndex
+    version: str
+    built_at: float
+
+    def age_seconds(self) -> float:
+        return time.time() - self.built_at
+
+    def get_facility(self, facility_id) -> Optional[Mapping]:
+        return self.facilities_by_id.get(facility_id)
+
+    def get_departments(self, facility_id) -> Tuple[Mapping, ...]:
+        return self.departments_by_facility.get(facility_id, ())
+
+    def get_department(self, department_id) -> Optional[Mapping]:
+        return self.departments_by_id.get(department_id)
+
+    def get_read_model(self, facility_id) -> Optional[Mapping]:
+        return self.read_models.get(facility_id)
+
+    def get_specialties(self, facility_id) -> Tuple[str, ...]:
+        read_model = self.read_models.get(facility_id)
+        return tuple(read_model['specialties']) if read_model else ('general',)
+
+
+def emergency_spatial_index(read_models: Mapping) -> SpatialIndex:
+    """Index of the read models that accept emergencies, keyed by facility _id"""
+    return SpatialIndex(
+        (facility_id, read_model['location']['coordinates'][1], read_model['location']['coordinates'][0])
+        for facility_id, read_model in read_models.items()
+        if read_model['acceptsEmergencies'] and 'location' in read_model
+    )
+
+
+class FacilitySnapshotCache:
+    """
+    Holds the current FacilitySnapshot and swaps in a new one atomically.
+    A background thread rebuilds the snapshot whenever a change stream on
+    facilities/departments fires, or every poll_interval seconds when change
+    streams are unavailable (e.g. a local single-node mongod).
+    """
+
+    WATCHED_COLLECTIONS = ('facilities', 'departments')
+
+    def __init__(self, db, project_facility: Callable[[Dict, List[Dict]], Dict],
+                 poll_interval: float = 300.0, debounce_seconds: float = 1.0):
+        self.db = db
+        self.project_facility = project_facility
+        self.poll_interval = poll_interval
+        self.debounce_seconds = debounce_seconds
+
+        self._snapshot: Optional[FacilitySnapshot] = None
+        self._build_lock = threading.Lock()
+        self._first_build = SingleFlight()
+        self._stop = threading.Event()
+        self._thread = None
+        self._change_streams_supported = True
+
+        # Metrics
+        self.mode = 'stopped'
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.last_error = None
+
+    def start(self):
+        """Start the background refresher (safe to call more than once)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='facility-snapshot', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.mode = 'stopped'
+
+    def get(self) -> FacilitySnapshot:
+        """Return the current snapshot; only the very first call may hit the database"""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+
+        # A cold start under load: every request waiting here shares one build
+        self.misses += 1
+        snapshot, _ = self._first_build.do('snapshot', self.refresh)
+        return snapshot
+
+    def peek(self) -> Optional[FacilitySnapshot]:
+        """The current snapshot if one is loaded; never touches the database"""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            self.hits += 1
+        return snapshot
+
+    def refresh(self) -> FacilitySnapshot:
+        """Rebuild the snapshot and swap it in if the content changed"""
+        with self._build_lock:
+            try:
+                snapshot = self._build()
+            except Exception as e:
+                self.refresh_errors += 1
+                self.last_error = str(e)
+                print(f"Error refreshing facility snapshot: {e}")
+                if self._snapshot is None:
+                    raise
+                return self._snapshot
+
+            self.refreshes += 1
+            if self._snapshot is None or self._snapshot.version != snapshot.version:
+                self._snapshot = snapshot
+            return self._snapshot
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        lookups = self.hits + self.misses
+        return {
+            'mode': self.mode,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'refreshes': self.refreshes,
+            'refresh_errors': self.refresh_errors,
+            'last_error': self.last_error,
+            'version': snapshot.version if snapshot else None,
+            'age_seconds': round(snapshot.age_seconds(), 1) if snapshot else None,
+            'facilities': len(snapshot.facilities) if snapshot else 0,
+            'emergency_index': snapshot.emergency_index.stats() if snapshot else None
+        }
+
+    def _build(self) -> FacilitySnapshot:
+        facilities = list(self.db.get_collection('facilities').find({}).sort('_id', 1))
+        departments = list(self.db.get_collection('departments').find({}).sort('_id', 1))
+
+        # Content version, used to skip no-op swaps and for HTTP validators
+        digest = hashlib.sha1()
+        digest.update(json.dumps(facilities, sort_keys=True, default=str).encode('utf-8'))
+        digest.update(json.dumps(departments, sort_keys=True, default=str).encode('utf-8'))
+
+        grouped_departments: Dict = {}
+        for dept in departments:
+            grouped_departments.setdefault(dept.get('Facility_ID'), []).append(dept)
+
+        frozen_facilities = tuple(MappingProxyType(facility) for facility in facilities)
+        frozen_departments = {dept['_id']: MappingProxyType(dept) for dept in departments}
+        read_models = MappingProxyType({
+            facility['_id']: MappingProxyType(
+                self.project_facility(facility, grouped_departments.get(facility['_id'], []))
+            )
+            for facility in facilities
+        })
+
+        return FacilitySnapshot(
+            facilities=frozen_facilities,
+            facilities_by_id=MappingProxyType({facility['_id']: facility for facility in frozen_facilities}),
+            departments_by_facility=MappingProxyType({
+                facility_id: tuple(frozen_departments[dept['_id']] for dept in depts)
+                for facility_id, depts in grouped_departments.items()
+            }),
+            departments_by_id=MappingProxyType(frozen_departments),
+            read_models=read_models,
+            emergency_index=emergency_spatial_index(read_models),
+            version=digest.hexdigest(),
+            built_at=time.time()
+        )
+
+    def _run(self):
+        try:
+            self.refresh()
+        except Exception:
+            pass  # Already logged; the loop below keeps retrying
+
+        while not self._stop.is_set():
+            if self._change_streams_supported:
+                try:
+                    self._watch_changes()
+                    continue
+                except OperationFailure as e:
+                    if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                        print("Change streams unavailable, polling facility snapshot instead")
+                        self._change_streams_supported = False
+                    else:
+                        print(f"Facility change stream failed: {e}")
+                except PyMongoError as e:
+                    print(f"Facility change stream failed: {e}")
+
+            # Poll for one interval, then retry the change stream if it is supported
+            self.mode = 'poll'
+            if self._stop.wait(self.poll_interval):
+                break
+            self.refresh()
+
+    def _watch_changes(self):
+        pipeline = [{'$match': {'ns.coll': {'$in': list(self.WATCHED_COLLECTIONS)}}}]
+
+        with self.db.db.watch(pipeline, max_await_time_ms=1000) as stream:
+            self.mode = 'change_stream'
+
+            # Catch anything written between the initial build and opening the stream
+            self.refresh()
+
+            while not self._stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is None:
+                    continue
+
+                # Let bulk uploads settle, then drain queued events into one rebuild
+                time.sleep(self.debounce_seconds)
+                while stream.try_next() is not None:
+                    pass
+                self.refresh()
@@ -0,0 +1,69 @@
+# gunicorn.conf.py
+"""
+Production Prefork Profile for the MedRoute API Server
+Imports the app once in the master (--preload) so the compiled triage rules
+and the facility snapshot are shared copy-on-write by every worker, then
+gives each worker its own MongoClient and background threads after fork
+
+Usage: gunicorn -c gunicorn.conf.py medroute_api_server:app
+"""
+
+import os
+
+
+def available_cpus():
+    """CPUs this process may run on (respects container CPU sets where the OS exposes them)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# One process per core (plus one to cover a worker blocked in a slow call);
+# threads let each worker overlap Atlas round trips and hold SSE streams
+workers = int(os.environ.get('WEB_CONCURRENCY', available_cpus() + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+preload_app = True
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so a slow leak cannot grow without bound
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = 1000
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """Master: warm the shared state, then drop the master's database client before any fork"""
+    import medroute_api_server as api
+
+    try:
+        snapshot = api.facility_cache.get()
+        server.log.info("Facility snapshot %s preloaded (%d facilities)",
+                        snapshot.version[:12], len(snapshot.facilities))
+    except Exception as e:
+        server.log.warning("Facility snapshot not preloaded, workers will build it: %s", e)
+
+    # Routing reads facility_read_model, so bring it up to date before any worker serves
+    if api.run_facility_projector:
+        try:
+            server.log.info("Facility read model rebuilt (%d facilities)", api.facility_projector.rebuild())
+        except Exception as e:
+            server.log.warning("Facility read model not rebuilt, the leading worker will retry: %s", e)
+
+    # Workers open their own clients on first use (CloudMedRouteDB is fork-aware)
+    api.db.close_connection()
+
+
+def post_fork(server, worker):
+    """Worker: start this process's background threads on its own MongoClient"""
+    import medroute_api_server as api
+
+    api.start_background_workers()
@@ -0,0 +1,81 @@
+"""
+Fast JSON Serialization for the MedRoute API
+Encodes ObjectId, datetime and numpy values directly while serializing, so
+routes hand Mongo documents and model outputs to jsonify() unconverted
+
+Uses orjson when it is installed and the standard library json otherwise;
+both produce the same document (ObjectId as its hex string, datetimes in
+ISO 8601 as datetime.isoformat() writes them).
+"""
+
+import json
+from datetime import date, datetime
+
+from bson import ObjectId
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def json_default(value):
+    """Types neither encoder handles natively (orjson covers datetime and numpy itself)"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if np is not None:
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps_bytes(obj, default=json_default) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def dumps(obj, default=json_default) -> str:
+    return dumps_bytes(obj, default).decode('utf-8')
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONProviderMixin:
+    """
+    Mixed into the framework's DefaultJSONProvider (Flask or Quart) so that
+    jsonify() and request.get_json() go through the encoder above
+    """
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        if args and kwargs:
+            raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+        if not args and not kwargs:
+            obj = None
+        elif len(args) == 1:
+            obj = args[0]
+        else:
+            obj = args or kwargs
+        return self._app.response_class(dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
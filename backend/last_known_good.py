@@ -0,0 +1,192 @@
+"""
+Last-Known-Good Responses
+The most recent successful payload of each read route, keyed by route and
+normalized parameters, served with its age when Atlas errors, times out or
+the circuit breaker is open, while a background refresh tries Atlas again
+
+A stale answer is always one Atlas actually gave: a request with nothing
+remembered gets a 503, never invented data. Entries older than max_age are
+not served at all.
+
+Configuration (environment):
+    LAST_KNOWN_GOOD_MAX_ENTRIES     payloads kept per process (default 512)
+    LAST_KNOWN_GOOD_MAX_AGE_SECONDS oldest payload that may still be served (default 3600)
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from circuit_breaker import ATLAS_UNAVAILABLE_ERRORS, CircuitOpenError
+
+# What a failed Atlas read raises when stale data may stand in for it
+FALLBACK_ERRORS = ATLAS_UNAVAILABLE_ERRORS + (CircuitOpenError,)
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_AGE_SECONDS = 3600.0
+
+
+def stale_headers(age: float) -> Dict[str, str]:
+    """Response headers marking a payload served from the last-known-good cache"""
+    return {
+        'Age': str(int(age)),
+        'Warning': '110 - "Response is Stale"',
+        'X-Data-Stale': 'true'
+    }
+
+
+class LastKnownGoodCache:
+    """
+    LRU of (payload, stored_at) per key. fetch() runs a read through the
+    circuit breaker, remembers what it returns and falls back to the
+    remembered payload when the read fails with an Atlas outage error.
+    """
+
+    def __init__(self, breaker, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_age: float = DEFAULT_MAX_AGE_SECONDS):
+        self.breaker = breaker
+        self.max_entries = max_entries
+        self.max_age = max_age
+
+        self._entries: 'OrderedDict[Hashable, Tuple[object, float]]' = OrderedDict()
+        self._refreshing = set()
+        self._refresh_pool = None
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.fresh = 0
+        self.stale_served = 0
+        self.unavailable = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def remember(self, key: Hashable, payload):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (payload, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def recall(self, key: Hashable) -> Optional[Tuple[object, float]]:
+        """(payload, age_seconds), or None when nothing servable is remembered"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, stored_at = entry
+            age = time.monotonic() - stored_at
+            if age > self.max_age:
+                del self._entries[key]
+                return None
+            return payload, age
+
+    def fetch(self, key: Hashable, read: Callable) -> Tuple[object, Optional[float]]:
+        """
+        (payload, None) from Atlas, or (payload, age) from the cache when
+        Atlas is unavailable; re-raises when nothing is remembered for key.
+        """
+        try:
+            payload = self.breaker.call(read)
+        except FALLBACK_ERRORS as e:
+            return self._fall_back(key, read, e)
+        self._fresh(key, payload)
+        return payload, None
+
+    def stats(self) -> Dict:
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'max_age_seconds': self.max_age,
+            'fresh': self.fresh,
+            'stale_served': self.stale_served,
+            'unavailable': self.unavailable,
+            'refreshes': self.refreshes,
+            'refresh_failures': self.refresh_failures,
+            'refreshing': len(self._refreshing)
+        }
+
+    def _fresh(self, key: Hashable, payload):
+        self.fresh += 1
+        self.remember(key, payload)
+
+    def _fall_back(self, key: Hashable, read: Callable, error: Exception) -> Tuple[object, float]:
+        stale = self.recall(key)
+        if stale is None:
+            self.unavailable += 1
+            raise error
+        self.stale_served += 1
+        self._refresh_later(key, read)
+        return stale
+
+    def _claim_refresh(self, key: Hashable) -> bool:
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _refresh_done(self, key: Hashable, payload=None, error: Optional[Exception] = None):
+        with self._lock:
+            self._refreshing.discard(key)
+        if error is None:
+            self.refreshes += 1
+            self.remember(key, payload)
+        elif not isinstance(error, CircuitOpenError):
+            self.refresh_failures += 1
+
+    def _refresh_later(self, key: Hashable, read: Callable):
+        if self._claim_refresh(key):
+            self._executor.submit(self._refresh, key, read)
+
+    @property
+    def _executor(self) -> ThreadPoolExecutor:
+        # Created on first use, so a process forked after import gets its own threads
+        with self._lock:
+            if self._refresh_pool is None:
+                self._refresh_pool = ThreadPoolExecutor(2, thread_name_prefix='last-known-good')
+            return self._refresh_pool
+
+    def _refresh(self, key: Hashable, read: Callable):
+        try:
+            payload = self.breaker.call(read)
+        except Exception as e:
+            self._refresh_done(key, error=e)
+        else:
+            self._refresh_done(key, payload)
+
+
+class AsyncLastKnownGoodCache(LastKnownGoodCache):
+    """The same cache for coroutine reads; refreshes run as tasks on the serving loop"""
+
+    def __init__(self, breaker, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_age: float = DEFAULT_MAX_AGE_SECONDS):
+        super().__init__(breaker, max_entries, max_age)
+        self._tasks = set()
+
+    async def fetch(self, key: Hashable, read: Callable) -> Tuple[object, Optional[float]]:
+        """read() returns the awaitable for one attempt, so it can be retried in the background"""
+        try:
+            payload = await self.breaker.call(read)
+        except FALLBACK_ERRORS as e:
+            return self._fall_back(key, read, e)
+        self._fresh(key, payload)
+        return payload, None
+
+    def _refresh_later(self, key: Hashable, read: Callable):
+        if self._claim_refresh(key):
+            task = asyncio.get_running_loop().create_task(self._refresh(key, read))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, key: Hashable, read: Callable):
+        try:
+            payload = await self.breaker.call(read)
+        except Exception as e:
+            self._refresh_done(key, error=e)
+        else:
+            self._refresh_done(key, payload)
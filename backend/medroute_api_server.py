@@ -4,219 +4,358 @@ Enhanced Flask API Server for MedRoute Frontend
 Provides REST endpoints for appointments, triage, and facility data
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from cloud_medroute_db import CloudMedRouteDB
+from facility_snapshot import FacilitySnapshotCache
+from facility_read_model import (
+    DEFAULT_LEASE_SECONDS, READ_MODEL_COLLECTION, FacilityReadModelProjector, project_facility
+)
+from triage_rules import DEFAULT_RULES_PATH, TriageRulesEngine
+from write_behind import WriteBehindBuffer
+from appointment_counters import AppointmentCounters
+from appointment_slots import SlotReservations, holds_slots, slot_ids
+from capacity_events import CapacityEventHub
+from json_provider import FastJSONProviderMixin, dumps_bytes
+from metrics import (
+    HTTP_IN_FLIGHT, REGISTRY, admission_collector, component_collector, fallback_collector, record_http_request,
+    response_cache_collector, single_flight_collector
+)
+from admission import (
+    DEFAULT_RESERVED, AdmissionController, AdmissionRejected, admission_classes, admission_enabled, route_class
+)
+from query_budget import begin_budget, discard_budget, end_budget
+from response_cache import AppointmentResponseCache, appointment_cache_key
+from migrations import LATEST_VERSION, schema_version
+from circuit_breaker import CircuitBreaker, retry_after
+from travel_times import DEFAULT_MATRIX_DIR, TravelTimes
+from single_flight import SingleFlight
+from last_known_good import FALLBACK_ERRORS, LastKnownGoodCache, stale_headers
+from api_common import (
+    APPOINTMENT_REQUIRED_FIELDS, APPOINTMENT_SCHEDULE_FIELDS, CAPACITY_STREAM_HEARTBEAT_SECONDS,
+    CAPACITY_STREAM_RETRY_MS, INACTIVE_APPOINTMENT_STATUSES,
+    DEPARTMENTS, DOCTORS, EXPORT_BATCH_SIZE, EXPORT_CSV_COLUMNS, FACILITY_CACHE_CONTROL,
+    TRIAGE_REQUIRED_FIELDS,
+    build_appointment_document, build_appointment_update, build_export_query,
+    bulk_create_results, bulk_update_results, bulk_write_errors,
+    build_triage_assessment, capacity_event_row, chunk_export,
+    emergency_fallback_matches, emergency_search_pipeline, export_csv_lines, export_headers, export_ndjson_lines,
+    facility_capacity_pipeline, finish_appointment_page, format_emergency_hospital,
+    format_facilities, format_sse, group_facility_capacity, health_payload, parse_appointment_page,
+    parse_appointment_batch, parse_facility_id, parse_facility_ids,
+    prepare_appointment_batch, prepare_appointment_updates, rank_emergency_hospitals,
+    reactivated_appointments
+)
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
-import math
-import uuid
+import atexit
+import threading
+import time
 
 load_dotenv()
 
+class MedRouteJSONProvider(FastJSONProviderMixin, DefaultJSONProvider):
+    """jsonify() that encodes ObjectId, datetime and numpy values itself"""
+
 app = Flask(__name__)
-CORS(app)  # Enable CORS for frontend requests
+app.json = MedRouteJSONProvider(app)
+CORS(app, expose_headers=['X-Next-Cursor', 'ETag', 'X-Cache', 'Age', 'Warning', 'X-Data-Stale'])  # Enable CORS for frontend requests
 
 # Initialize database
 db = CloudMedRouteDB()
 
-# Helper functions
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two points using Haversine formula"""
-    R = 6371  # Earth's radius in kilometers
-    
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-    
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-    
-    a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    
-    return R * c
-
-def get_city_coordinates(city):
-    """Get coordinates for South African cities"""
-    city_coords = {
-        'Johannesburg': {'lat': -26.2041, 'lng': 28.0473},
-        'Cape Town': {'lat': -33.9249, 'lng': 18.4241},
-        'Durban': {'lat': -29.8587, 'lng': 31.0218},
-        'Pretoria': {'lat': -25.7461, 'lng': 28.1881},
-        'Port Elizabeth': {'lat': -33.9608, 'lng': 25.6022},
-        'Bloemfontein': {'lat': -29.0852, 'lng': 26.1596},
-        'Polokwane': {'lat': -23.9045, 'lng': 29.4689},
-        'Nelspruit': {'lat': -25.4753, 'lng': 30.9700},
-        'Kimberley': {'lat': -28.7282, 'lng': 24.7499},
-        'Rustenburg': {'lat': -25.6672, 'lng': 27.2424}
+# Triage assessments are persisted behind the response instead of inline
+triage_writer = WriteBehindBuffer(
+    db,
+    'triage_assessments',
+    max_batch_size=int(os.environ.get('TRIAGE_WRITE_BATCH_SIZE', 100)),
+    flush_interval=float(os.environ.get('TRIAGE_WRITE_FLUSH_SECONDS', 1.0)),
+    spill_path=os.environ.get('TRIAGE_SPILL_PATH', 'triage_assessments.spill.ndjson')
+)
+atexit.register(triage_writer.close)
+
+# Appointment totals maintained by the write routes for /api/stats
+appointment_counters = AppointmentCounters(db)
+
+# Double-booking guard for the appointment write routes
+slot_reservations = SlotReservations(db)
+
+# Serialized GET /api/appointments pages shared by every dashboard tab
+appointment_cache = AppointmentResponseCache(
+    max_bytes=int(os.environ.get('APPOINTMENT_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+    ttl=float(os.environ.get('APPOINTMENT_CACHE_TTL_SECONDS', 5))
+)
+
+# Request-path Atlas reads share one breaker: each waits at most
+# ATLAS_CALL_TIMEOUT_MS, and once Atlas keeps failing they fail at once
+atlas_breaker = CircuitBreaker(
+    'atlas',
+    failure_threshold=int(os.environ.get('ATLAS_CIRCUIT_FAILURES', 5)),
+    reset_timeout=float(os.environ.get('ATLAS_CIRCUIT_RESET_SECONDS', 30)),
+    call_timeout=float(os.environ.get('ATLAS_CALL_TIMEOUT_MS', 2000)) / 1000
+)
+
+# The last real answer of each read route, served marked stale while Atlas is unavailable
+last_known_good = LastKnownGoodCache(
+    atlas_breaker,
+    max_entries=int(os.environ.get('LAST_KNOWN_GOOD_MAX_ENTRIES', 512)),
+    max_age=float(os.environ.get('LAST_KNOWN_GOOD_MAX_AGE_SECONDS', 3600))
+)
+
+# The last capacity document seen for each department, for emergency routing without Atlas
+known_capacity = LastKnownGoodCache(
+    atlas_breaker,
+    max_entries=int(os.environ.get('KNOWN_CAPACITY_MAX_ENTRIES', 20000)),
+    max_age=float(os.environ.get('LAST_KNOWN_GOOD_MAX_AGE_SECONDS', 3600))
+)
+
+# Drive times from the offline travel-time matrix (python travel_times.py), memory-mapped on first use
+travel_times = TravelTimes(os.environ.get('TRAVEL_TIME_MATRIX_DIR', DEFAULT_MATRIX_DIR))
+
+# Identical concurrent reads (a dashboard loading on many screens at once) share one computation
+request_flights = SingleFlight()
+
+def atlas_unavailable(error, message):
+    """503 for a read Atlas could not answer and no earlier answer can stand in for"""
+    print(f"{message}: {error}")
+    return jsonify({'error': 'Database temporarily unavailable, please retry'}), 503, {
+        'Retry-After': str(retry_after(error))
     }
-    return city_coords.get(city, city_coords['Johannesburg'])
-
-def map_facility_type_to_emergency_level(facility_type, level_of_care):
-    """Map facility type to emergency level"""
-    if facility_type == 'Emergency Center':
-        return 'Level 2 Trauma Center'
-    elif level_of_care == 'Tertiary':
-        return 'Level 1 Trauma Center'
-    elif level_of_care == 'Secondary':
-        return 'Level 2 Trauma Center'
-    elif facility_type == 'Hospital':
-        return 'Level 3 Trauma Center'
-    else:
-        return 'Basic Emergency Care'
+
+# Triage rule table, compiled once at startup
+triage_engine = TriageRulesEngine.from_file(os.environ.get('TRIAGE_RULES_PATH', DEFAULT_RULES_PATH))
 
 def get_specialties_from_departments(facility_id):
     """Get specialties based on departments in the facility"""
     try:
-        departments = list(db.get_collection('departments').find({'Facility_ID': facility_id}))
-        
-        specialty_mapping = {
-            'Emergency': 'emergency',
-            'Cardiology': 'cardiology', 
-            'General Medicine': 'general',
-            'Pediatrics': 'pediatrics',
-            'Neurology': 'neurology',
-            'Orthopedics': 'orthopedics',
-            'Oncology': 'oncology',
-            'Surgery': 'surgery'
-        }
-        
-        specialties = []
-        for dept in departments:
-            dept_name = dept.get('Name', '')
-            for key, value in specialty_mapping.items():
-                if key in dept_name:
-                    specialties.append(value)
-                    break
-            else:
-                specialties.append('general')
-        
-        # Always include general if not emergency-only
-        if 'emergency' not in specialties and 'general' not in specialties:
-            specialties.append('general')
-            
-        return list(set(specialties))  # Remove duplicates
+        return list(facility_cache.get().get_specialties(facility_id))
         
     except Exception as e:
         print(f"Error getting specialties for facility {facility_id}: {e}")
         return ['general']
 
+# Facilities and departments are near-static: serve them from an in-process
+# snapshot that is rebuilt in the background when the collections change
+facility_cache = FacilitySnapshotCache(
+    db,
+    project_facility,
+    poll_interval=int(os.environ.get('FACILITY_SNAPSHOT_POLL_SECONDS', 300))
+)
+
+# Keeps facility_read_model (what emergency routing reads) in step with
+# facilities and departments.
+# 'lease' (default): every worker starts a projector but only the holder of
+# the projector lease follows changes; 'on': project unconditionally (one
+# process only); 'off': leave it to the standalone job
+facility_projector_mode = os.environ.get('FACILITY_READ_MODEL_PROJECTOR', 'lease').lower()
+facility_projector = FacilityReadModelProjector(
+    db,
+    poll_interval=int(os.environ.get('FACILITY_SNAPSHOT_POLL_SECONDS', 300)),
+    lease_seconds=float(os.environ.get('FACILITY_READ_MODEL_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+    if facility_projector_mode == 'lease' else None
+)
+run_facility_projector = facility_projector_mode != 'off'
+
+# Changed department_capacity rows, fanned out to /api/capacity/stream subscribers
+capacity_events = CapacityEventHub(
+    db,
+    history_size=int(os.environ.get('CAPACITY_EVENT_HISTORY', 1000)),
+    poll_interval=int(os.environ.get('CAPACITY_POLL_SECONDS', 5))
+)
+
+_background_lock = threading.Lock()
+_background_pid = None
+
+def start_background_workers():
+    """
+    Start the snapshot, capacity-event and write-behind threads in this process.
+    Threads do not survive fork, so under a prefork server every worker starts
+    its own (gunicorn.conf.py calls this from post_fork); the first request
+    starts them anywhere else.
+    """
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        triage_writer.start()
+        facility_cache.start()
+        capacity_events.start()
+        if run_facility_projector:
+            facility_projector.start()
+        _background_pid = os.getpid()
+
+@app.before_request
+def ensure_background_workers():
+    start_background_workers()
+
+# Request metrics for /api/metrics
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.in_flight = True
+    HTTP_IN_FLIGHT.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        record_http_request(
+            request.method,
+            request.url_rule.rule if request.url_rule else 'unmatched',
+            response.status_code,
+            time.perf_counter() - started,
+            request.content_length,
+            None if response.is_streamed else response.calculate_content_length()
+        )
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error):
+    # Streamed responses tear down when the stream ends, so open SSE streams count as in flight
+    if g.pop('in_flight', False):
+        HTTP_IN_FLIGHT.dec()
+
+REGISTRY.register_collector(component_collector(triage_writer, facility_cache, capacity_events))
+REGISTRY.register_collector(response_cache_collector(appointment_cache))
+REGISTRY.register_collector(fallback_collector(atlas_breaker, last_known_good))
+REGISTRY.register_collector(single_flight_collector(request_flights))
+
+# Admission control: emergency routing and triage are admitted first, listing
+# and analytics requests are shed with 503 when their queue gets too slow.
+# Capacity defaults to the gthread pool so a queued request never waits on a thread.
+admission_capacity = int(os.environ.get('ADMISSION_CAPACITY', os.environ.get('GUNICORN_THREADS', 8)))
+admission_reserved = int(os.environ.get('ADMISSION_RESERVED', DEFAULT_RESERVED))
+admission = AdmissionController(
+    admission_classes(admission_capacity, admission_reserved),
+    admission_capacity,
+    admission_reserved
+)
+REGISTRY.register_collector(admission_collector(admission))
+
+# Each open capacity stream holds a gthread thread for as long as it is connected,
+# so streams get fewer threads than are left once the critical reserve is set aside,
+# and each one also holds a shared admission slot (see stream_capacity)
+capacity_events.max_subscribers = int(os.environ.get(
+    'CAPACITY_STREAM_MAX_SUBSCRIBERS', max(1, admission_capacity - admission_reserved - 1)
+))
+
+@app.before_request
+def admit_request():
+    if not admission_enabled():
+        return None
+    name = route_class(request.method, request.url_rule.rule if request.url_rule else None)
+    if name is None:
+        return None
+    try:
+        g.admission_ticket = admission.acquire(name)
+    except AdmissionRejected as e:
+        return jsonify({'error': 'Server busy, please retry', 'route_class': e.route_class}), 503, {
+            'Retry-After': str(e.retry_after)
+        }
+
+@app.teardown_request
+def release_admission(error):
+    # Streamed responses tear down when the stream ends, so an export keeps its slot until then
+    admission.release(g.pop('admission_ticket', None))
+
+# Database round-trip budget per request (QUERY_BUDGET_MODE: log in production, raise in tests)
+
+@app.before_request
+def start_query_budget():
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.query_budget = begin_budget(f'{request.method} {route}')
+
+@app.after_request
+def check_query_budget(response):
+    # Streamed bodies (exports, SSE) query after this point and are not counted
+    end_budget(g.pop('query_budget', None))
+    return response
+
+@app.teardown_request
+def release_query_budget(error):
+    # Worker threads are reused, so never leave a budget active past its request
+    discard_budget(g.pop('query_budget', None))
+
 # NEW: Appointment Management Routes
 
 @app.route('/api/appointments', methods=['GET'])
 def get_appointments():
-    """Get all appointments with optional filtering"""
+    """
+    Get appointments with optional filtering, one page at a time.
+    Pages are ordered by (dateTime, _id); pass the X-Next-Cursor response
+    header back as ?cursor= to fetch the next page. Identical queries within
+    APPOINTMENT_CACHE_TTL_SECONDS are answered from the response cache,
+    concurrent misses for the same page share one query, and while Atlas is
+    unavailable the last page it returned is served marked stale.
+    """
     try:
-        # Get query parameters
-        department = request.args.get('department')
-        doctor = request.args.get('doctor')
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        status = request.args.get('status')
-        
-        # Build query
-        query = {}
-        if department and department != 'all':
-            query['department'] = department
-        if doctor and doctor != 'all':
-            query['doctorId'] = doctor
-        if status and status != 'all':
-            query['status'] = status
-        if date_from or date_to:
-            date_query = {}
-            if date_from:
-                date_query['$gte'] = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-            if date_to:
-                date_query['$lte'] = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
-            query['dateTime'] = date_query
-        
-        # Get appointments from database
-        appointments_collection = db.get_collection('appointments')
-        appointments = list(appointments_collection.find(query))
+        try:
+            query, projection, limit, _ = parse_appointment_page(request.args)
+            cache_key, cache_scope = appointment_cache_key(request.args)
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'error': f'Invalid query parameters: {e}'}), 400
+        
+        cached = appointment_cache.get(cache_key)
+        if cached is not None:
+            response = Response(cached.body, mimetype=app.json.mimetype)
+            if cached.next_cursor:
+                response.headers['X-Next-Cursor'] = cached.next_cursor
+            response.headers['X-Cache'] = 'HIT'
+            return response
+        generation = appointment_cache.generation
         
-        # If no appointments in database, return mock data for demo
-        if not appointments:
-            appointments = generate_mock_appointments()
+        def read_page():
+            # Get one page (plus one row to detect a following page) from database
+            appointments = list(
+                db.get_collection('appointments').find(query, projection)
+                .sort([('dateTime', 1), ('_id', 1)])
+                .limit(limit + 1)
+            )
+            return finish_appointment_page(appointments, limit)
         
-        # Convert ObjectId and datetime to strings
-        for apt in appointments:
-            if '_id' in apt:
-                apt['_id'] = str(apt['_id'])
-            if 'dateTime' in apt and isinstance(apt['dateTime'], datetime):
-                apt['dateTime'] = apt['dateTime'].isoformat()
+        flight_key = ('appointments', cache_key)
+        ((appointments, next_cursor), stale_age), shared = request_flights.do(
+            flight_key, lambda: last_known_good.fetch(flight_key, read_page)
+        )
         
-        return jsonify(appointments)
+        response = jsonify(appointments)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        if stale_age is not None:
+            response.headers.update(stale_headers(stale_age))
+            return response
+        response.headers['X-Cache'] = 'MISS'
+        if not shared:
+            appointment_cache.put(cache_key, cache_scope, response.get_data(), next_cursor, generation)
+        return response
         
+    except FALLBACK_ERRORS as e:
+        return atlas_unavailable(e, "Atlas unavailable fetching appointments")
     except Exception as e:
         print(f"Error fetching appointments: {e}")
         return jsonify({'error': 'Failed to fetch appointments'}), 500
 
-def generate_mock_appointments():
-    """Generate mock appointments for demo purposes"""
-    import random
-    
-    mock_appointments = []
-    today = datetime.now()
-    
-    departments = [
-        {'id': 'emergency', 'name': 'Emergency', 'color': 'red'},
-        {'id': 'general', 'name': 'General Medicine', 'color': 'blue'},
-        {'id': 'cardiology', 'name': 'Cardiology', 'color': 'purple'},
-        {'id': 'pediatrics', 'name': 'Pediatrics', 'color': 'green'},
-        {'id': 'orthopedics', 'name': 'Orthopedics', 'color': 'orange'}
-    ]
+def claim_booking(appointment, held=()):
+    """
+    Check the doctor's schedule and claim the appointment's slots (besides
+    those in held, which it already owns). Returns a 409 body when the time
+    is taken, else None.
+    """
+    conflicts = slot_reservations.conflicts([appointment], exclude_ids=[appointment['id']]).get(0)
+    if conflicts:
+        return {'error': 'Doctor is already booked at this time', 'conflicts': conflicts}
     
-    doctors = [
-        {'id': 'dr_smith', 'name': 'Dr. Smith', 'department': 'emergency'},
-        {'id': 'dr_johnson', 'name': 'Dr. Johnson', 'department': 'general'},
-        {'id': 'dr_williams', 'name': 'Dr. Williams', 'department': 'cardiology'},
-        {'id': 'dr_brown', 'name': 'Dr. Brown', 'department': 'pediatrics'},
-        {'id': 'dr_davis', 'name': 'Dr. Davis', 'department': 'orthopedics'}
-    ]
+    if slot_reservations.reserve([appointment], held):
+        return {'error': 'Doctor was booked at this time by another request', 'conflicts': []}
     
-    # Generate appointments for next 7 days
-    for day_offset in range(7):
-        current_date = today + timedelta(days=day_offset)
-        
-        # Skip weekends
-        if current_date.weekday() >= 5:
-            continue
-            
-        # Generate 5-10 appointments per day
-        for i in range(random.randint(5, 10)):
-            department = random.choice(departments)
-            doctor = next((d for d in doctors if d['department'] == department['id']), doctors[0])
-            
-            # Random time between 8 AM and 5 PM
-            hour = random.randint(8, 16)
-            minute = random.choice([0, 30])
-            
-            appointment_time = current_date.replace(hour=hour, minute=minute, second=0, microsecond=0)
-            
-            appointment = {
-                'id': f"apt_{current_date.strftime('%Y%m%d')}_{i}",
-                'patientName': f"Patient {random.randint(100, 999)}",
-                'patientId': f"P{random.randint(1000, 9999)}",
-                'phone': f"+27 {random.randint(100000000, 999999999)}",
-                'department': department['id'],
-                'departmentName': department['name'],
-                'departmentColor': department['color'],
-                'doctor': doctor['name'],
-                'doctorId': doctor['id'],
-                'dateTime': appointment_time.isoformat(),
-                'duration': random.choice([30, 45, 60]),
-                'condition': random.choice(['Routine Check-up', 'Follow-up', 'New Patient', 'Consultation']),
-                'status': random.choice(['pending', 'confirmed', 'completed']),
-                'priority': random.choice(['low', 'medium', 'high']),
-                'notes': 'Sample appointment',
-                'insuranceProvider': random.choice(['Discovery', 'Momentum', 'Bonitas', 'None'])
-            }
-            mock_appointments.append(appointment)
-    
-    return mock_appointments
+    return None
 
 @app.route('/api/appointments', methods=['POST'])
 def create_appointment():
@@ -225,40 +364,31 @@ def create_appointment():
         data = request.get_json()
         
         # Validate required fields
-        required_fields = ['patientName', 'phone', 'department', 'doctor', 'dateTime', 'condition']
-        for field in required_fields:
+        for field in APPOINTMENT_REQUIRED_FIELDS:
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
         # Create appointment document
-        appointment = {
-            'id': str(uuid.uuid4()),
-            'patientName': data['patientName'],
-            'patientId': data.get('patientId', ''),
-            'phone': data['phone'],
-            'department': data['department'],
-            'departmentName': data.get('departmentName', ''),
-            'departmentColor': data.get('departmentColor', 'blue'),
-            'doctor': data['doctor'],
-            'doctorId': data.get('doctorId', data['doctor']),
-            'dateTime': datetime.fromisoformat(data['dateTime'].replace('Z', '+00:00')),
-            'duration': int(data.get('duration', 30)),
-            'condition': data['condition'],
-            'status': data.get('status', 'pending'),
-            'priority': data.get('priority', 'medium'),
-            'notes': data.get('notes', ''),
-            'insuranceProvider': data.get('insuranceProvider', 'None'),
-            'createdAt': datetime.utcnow(),
-            'updatedAt': datetime.utcnow()
-        }
+        try:
+            appointment = build_appointment_document(data)
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({'error': f'Invalid appointment: {e}'}), 400
+        
+        # Refuse the booking if the doctor's time is taken
+        conflict = claim_booking(appointment)
+        if conflict:
+            return jsonify(conflict), 409
         
         # Insert into database
         appointments_collection = db.get_collection('appointments')
-        result = appointments_collection.insert_one(appointment)
-        appointment['_id'] = str(result.inserted_id)
-        appointment['dateTime'] = appointment['dateTime'].isoformat()
-        appointment['createdAt'] = appointment['createdAt'].isoformat()
-        appointment['updatedAt'] = appointment['updatedAt'].isoformat()
+        try:
+            result = appointments_collection.insert_one(appointment)
+        except Exception:
+            slot_reservations.release([appointment['id']])
+            raise
+        appointment_counters.record_inserts([appointment])
+        appointment_cache.invalidate([appointment])
+        appointment['_id'] = result.inserted_id
         
         return jsonify(appointment), 201
         
@@ -266,6 +396,125 @@ def create_appointment():
         print(f"Error creating appointment: {e}")
         return jsonify({'error': 'Failed to create appointment'}), 500
 
+@app.route('/api/appointments/bulk', methods=['POST'])
+def create_appointments_bulk():
+    """
+    Create a batch of appointments (e.g. a clinic's day list) in one write.
+    The whole batch is validated first and nothing is written if any item is
+    invalid; after that each item succeeds or fails on its own (207 if any
+    failed), including items refused because the doctor is already booked.
+    """
+    try:
+        try:
+            items = parse_appointment_batch(request.get_json())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        appointments, errors = prepare_appointment_batch(items)
+        if errors:
+            return jsonify({'error': 'Invalid appointments in batch', 'errors': errors}), 400
+        
+        # One overlap query and one slot claim for the whole batch
+        conflicts = slot_reservations.conflicts(appointments)
+        candidates = [index for index in range(len(appointments)) if index not in conflicts]
+        for position in slot_reservations.reserve([appointments[index] for index in candidates]):
+            conflicts[candidates[position]] = []  # booked by another request meanwhile
+        
+        to_insert = [appointment for index, appointment in enumerate(appointments) if index not in conflicts]
+        write_errors = {}
+        if to_insert:
+            try:
+                db.get_collection('appointments').insert_many(to_insert, ordered=False)
+            except BulkWriteError as e:
+                write_errors = bulk_write_errors(e.details)
+                slot_reservations.release([to_insert[position]['id'] for position in write_errors])
+        
+        results, created = bulk_create_results(appointments, conflicts, write_errors)
+        appointment_counters.record_inserts(created)
+        appointment_cache.invalidate(created)
+        
+        return jsonify({
+            'created': len(created),
+            'failed': len(appointments) - len(created),
+            'results': results
+        }), 201 if len(created) == len(appointments) else 207
+        
+    except Exception as e:
+        print(f"Error creating appointments in bulk: {e}")
+        return jsonify({'error': 'Failed to create appointments'}), 500
+
+@app.route('/api/appointments/bulk', methods=['PATCH'])
+def update_appointments_bulk():
+    """
+    Update a batch of appointments, each item {"id": ..., <fields>}.
+    One read for the current statuses (kept for the counters and to report
+    unknown IDs) and one unordered bulk write, whatever the batch size.
+    Rescheduling and reactivating cancelled appointments go through PUT,
+    which checks the doctor's schedule.
+    """
+    try:
+        try:
+            items = parse_appointment_batch(request.get_json())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        updates, errors = prepare_appointment_updates(items)
+        if errors:
+            return jsonify({'error': 'Invalid updates in batch', 'errors': errors}), 400
+        
+        appointments_collection = db.get_collection('appointments')
+        current = {
+            appointment['id']: appointment
+            for appointment in appointments_collection.find(
+                {'id': {'$in': [appointment_id for appointment_id, _ in updates]}},
+                {'_id': 0, 'id': 1, 'status': 1, 'department': 1, 'doctorId': 1, 'dateTime': 1}
+            )
+        }
+        previous_status = {appointment_id: appointment.get('status') for appointment_id, appointment in current.items()}
+        
+        rejected = reactivated_appointments(updates, previous_status)
+        operations = [
+            UpdateOne({'id': appointment_id}, {'$set': update_data})
+            for appointment_id, update_data in updates
+            if appointment_id in previous_status and appointment_id not in rejected
+        ]
+        
+        write_errors = {}
+        if operations:
+            try:
+                appointments_collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                write_errors = bulk_write_errors(e.details)
+        
+        results, status_changes = bulk_update_results(updates, previous_status, rejected, write_errors)
+        appointment_counters.record_status_changes(status_changes)
+        
+        # Pages that held the appointments before, or hold them now (department can change)
+        appointment_cache.invalidate(
+            version
+            for result, (appointment_id, update_data) in zip(results, updates) if result['status'] == 'updated'
+            for version in (current[appointment_id], {**current[appointment_id], **update_data})
+        )
+        
+        # Cancelled appointments give the doctor's time back
+        cancelled = [
+            result['id'] for result, (_, update_data) in zip(results, updates)
+            if result['status'] == 'updated' and update_data.get('status') in INACTIVE_APPOINTMENT_STATUSES
+        ]
+        if cancelled:
+            slot_reservations.release(cancelled)
+        
+        updated = sum(1 for result in results if result['status'] == 'updated')
+        return jsonify({
+            'updated': updated,
+            'failed': len(results) - updated,
+            'results': results
+        }), 200 if updated == len(results) else 207
+        
+    except Exception as e:
+        print(f"Error updating appointments in bulk: {e}")
+        return jsonify({'error': 'Failed to update appointments'}), 500
+
 @app.route('/api/appointments/<appointment_id>', methods=['PUT'])
 def update_appointment(appointment_id):
     """Update an existing appointment"""
@@ -273,48 +522,55 @@ def update_appointment(appointment_id):
         data = request.get_json()
         
         # Prepare update data
-        update_data = {}
+        try:
+            update_data = build_appointment_update(data)
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({'error': f'Invalid update: {e}'}), 400
         
-        # Fields that can be updated
-        updatable_fields = [
-            'patientName', 'patientId', 'phone', 'department', 'departmentName',
-            'departmentColor', 'doctor', 'doctorId', 'duration', 'condition',
-            'status', 'priority', 'notes', 'insuranceProvider'
-        ]
+        appointments_collection = db.get_collection('appointments')
         
-        for field in updatable_fields:
-            if field in data:
-                update_data[field] = data[field]
+        # Moving the booking (or reactivating it) must not overlap another of the doctor's
+        held, claimed = set(), set()
+        if any(field in update_data for field in APPOINTMENT_SCHEDULE_FIELDS + ('status',)):
+            current = appointments_collection.find_one({'id': appointment_id})
+            if current is None:
+                return jsonify({'error': 'Appointment not found'}), 404
+            
+            held = slot_ids(current)
+            claimed = slot_ids({**current, **update_data}) - held
+            if claimed:
+                conflict = claim_booking({**current, **update_data}, held)
+                if conflict:
+                    return jsonify(conflict), 409
         
-        # Handle dateTime separately
-        if 'dateTime' in data:
-            if isinstance(data['dateTime'], str):
-                update_data['dateTime'] = datetime.fromisoformat(data['dateTime'].replace('Z', '+00:00'))
-            else:
-                update_data['dateTime'] = data['dateTime']
+        # Update in database, keeping the previous version for the status counters
+        try:
+            previous_appointment = appointments_collection.find_one_and_update(
+                {'id': appointment_id},
+                {'$set': update_data},
+                return_document=ReturnDocument.BEFORE
+            )
+        except Exception:
+            if claimed:
+                slot_reservations.release([appointment_id], claimed)
+            raise
         
-        update_data['updatedAt'] = datetime.utcnow()
+        if previous_appointment is None:
+            if claimed:
+                slot_reservations.release([appointment_id], claimed)
+            return jsonify({'error': 'Appointment not found'}), 404
         
-        # Update in database
-        appointments_collection = db.get_collection('appointments')
-        result = appointments_collection.update_one(
-            {'id': appointment_id},
-            {'$set': update_data}
-        )
+        if 'status' in update_data:
+            appointment_counters.record_status_change(previous_appointment.get('status'), update_data['status'])
         
-        if result.matched_count == 0:
-            return jsonify({'error': 'Appointment not found'}), 404
+        # Updated appointment is the previous version with the $set applied
+        updated_appointment = {**previous_appointment, **update_data}
+        appointment_cache.invalidate([previous_appointment, updated_appointment])
         
-        # Get updated appointment
-        updated_appointment = appointments_collection.find_one({'id': appointment_id})
-        if updated_appointment:
-            updated_appointment['_id'] = str(updated_appointment['_id'])
-            if isinstance(updated_appointment.get('dateTime'), datetime):
-                updated_appointment['dateTime'] = updated_appointment['dateTime'].isoformat()
-            if isinstance(updated_appointment.get('updatedAt'), datetime):
-                updated_appointment['updatedAt'] = updated_appointment['updatedAt'].isoformat()
-            if isinstance(updated_appointment.get('createdAt'), datetime):
-                updated_appointment['createdAt'] = updated_appointment['createdAt'].isoformat()
+        # Hand back the slots the booking no longer covers
+        released = held - slot_ids(updated_appointment)
+        if released:
+            slot_reservations.release([appointment_id], released)
         
         return jsonify(updated_appointment)
         
@@ -327,17 +583,69 @@ def delete_appointment(appointment_id):
     """Delete an appointment"""
     try:
         appointments_collection = db.get_collection('appointments')
-        result = appointments_collection.delete_one({'id': appointment_id})
+        deleted_appointment = appointments_collection.find_one_and_delete({'id': appointment_id})
         
-        if result.deleted_count == 0:
+        if deleted_appointment is None:
             return jsonify({'error': 'Appointment not found'}), 404
         
+        appointment_counters.record_delete(deleted_appointment)
+        appointment_cache.invalidate([deleted_appointment])
+        if holds_slots(deleted_appointment):
+            slot_reservations.release([appointment_id])
+        
         return jsonify({'message': 'Appointment deleted successfully'})
         
     except Exception as e:
         print(f"Error deleting appointment: {e}")
         return jsonify({'error': 'Failed to delete appointment'}), 500
 
+# NEW: Streaming Export Routes
+
+@app.route('/api/export/<dataset>', methods=['GET'])
+def export_dataset(dataset):
+    """
+    Stream appointments or triage assessments as NDJSON or CSV.
+    Documents are read from a batched cursor and written out as they arrive,
+    so memory stays flat however large the date range is.
+    """
+    if dataset not in EXPORT_CSV_COLUMNS:
+        return jsonify({'error': f'Unknown export dataset: {dataset}'}), 404
+    
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    
+    compress = request.args.get('gzip', 'false').lower() in ('1', 'true', 'yes')
+    
+    try:
+        query = build_export_query(dataset, request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameters: {e}'}), 400
+    
+    def generate():
+        cursor = db.get_collection(dataset).find(query).batch_size(EXPORT_BATCH_SIZE)
+        if dataset == 'appointments':
+            cursor = cursor.sort([('dateTime', 1), ('_id', 1)])
+        
+        try:
+            if export_format == 'csv':
+                lines = export_csv_lines(cursor, EXPORT_CSV_COLUMNS[dataset])
+            else:
+                lines = export_ndjson_lines(cursor)
+            
+            for chunk in chunk_export(lines, compress):
+                yield chunk
+        except Exception as e:
+            # Headers are already sent, so the client only sees a truncated stream
+            print(f"Error streaming {dataset} export: {e}")
+        finally:
+            cursor.close()
+    
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    headers = export_headers(dataset, export_format, compress)
+    
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers=headers)
+
 # NEW: Triage Assessment Routes
 
 @app.route('/api/triage/assess', methods=['POST'])
@@ -347,86 +655,18 @@ def submit_triage_assessment():
         data = request.get_json()
         
         # Validate required fields
-        required_fields = ['symptoms', 'severity', 'age', 'gender']
-        for field in required_fields:
+        for field in TRIAGE_REQUIRED_FIELDS:
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
-        # Process triage logic
-        symptoms = data['symptoms'].lower()
-        severity = data['severity']
-        age = int(data['age'])
-        
-        # Determine urgency and priority
-        urgency = 'Low'
-        priority_score = 3
-        department = {'id': 'general', 'name': 'General Medicine', 'color': 'blue'}
-        estimated_wait = '45-60 minutes'
-        
-        # Critical symptoms
-        critical_symptoms = [
-            'chest pain', 'difficulty breathing', 'severe bleeding', 'unconscious',
-            'stroke', 'heart attack', 'severe head injury', 'severe burns'
-        ]
-        
-        # High priority symptoms
-        high_symptoms = [
-            'broken bone', 'severe pain', 'high fever', 'allergic reaction',
-            'vomiting blood', 'severe nausea'
-        ]
-        
-        # Check for critical conditions
-        if severity == 'critical' or any(symptom in symptoms for symptom in critical_symptoms):
-            urgency = 'Critical'
-            priority_score = 9
-            department = {'id': 'emergency', 'name': 'Emergency', 'color': 'red'}
-            estimated_wait = 'Immediate'
-        elif severity == 'severe' or any(symptom in symptoms for symptom in high_symptoms) or age > 65:
-            urgency = 'High'
-            priority_score = 7
-            estimated_wait = '15-30 minutes'
-        elif severity == 'moderate':
-            urgency = 'Medium'
-            priority_score = 5
-            estimated_wait = '30-45 minutes'
-        
-        # Determine appropriate department
-        if 'heart' in symptoms or 'chest' in symptoms:
-            department = {'id': 'cardiology', 'name': 'Cardiology', 'color': 'purple'}
-        elif 'bone' in symptoms or 'joint' in symptoms or 'fracture' in symptoms:
-            department = {'id': 'orthopedics', 'name': 'Orthopedics', 'color': 'orange'}
-        elif age < 18:
-            department = {'id': 'pediatrics', 'name': 'Pediatrics', 'color': 'green'}
+        # Process triage logic: one pass of the compiled rule table over the text
+        decision = triage_engine.assess(data['symptoms'], data['severity'], int(data['age']))
         
         # Create assessment result
-        assessment = {
-            'id': str(uuid.uuid4()),
-            'urgency': urgency,
-            'priorityScore': priority_score,
-            'department': {
-                **department,
-                'description': f'Recommended based on your symptoms and medical history.'
-            },
-            'estimatedWait': estimated_wait,
-            'condition': data['symptoms'],
-            'summary': f'Based on your assessment, you have been assigned a {urgency.lower()} priority level. Your symptoms suggest you should be seen in the {department["name"]} department.',
-            'recommendations': [
-                'Seek immediate medical attention' if urgency == 'Critical' else 'Schedule an appointment with the recommended department',
-                'Bring a list of current medications',
-                'Arrive 15 minutes early for check-in',
-                'Do not delay seeking care' if urgency == 'Critical' else 'Continue monitoring symptoms'
-            ],
-            'patientData': data,
-            'createdAt': datetime.utcnow()
-        }
+        assessment = build_triage_assessment(data, decision)
         
-        # Save assessment to database
-        triage_collection = db.get_collection('triage_assessments')
-        assessment_to_save = assessment.copy()
-        triage_collection.insert_one(assessment_to_save)
-        
-        # Convert datetime for JSON response
-        assessment['createdAt'] = assessment['createdAt'].isoformat()
+        # Queue assessment for the write-behind buffer (the insert adds an _id to its copy)
+        triage_writer.put(assessment.copy())
         
         return jsonify(assessment)
         
@@ -440,15 +680,7 @@ def submit_triage_assessment():
 def get_departments():
     """Get all departments"""
     try:
-        departments = [
-            {'id': 'emergency', 'name': 'Emergency', 'color': 'red'},
-            {'id': 'general', 'name': 'General Medicine', 'color': 'blue'},
-            {'id': 'cardiology', 'name': 'Cardiology', 'color': 'purple'},
-            {'id': 'pediatrics', 'name': 'Pediatrics', 'color': 'green'},
-            {'id': 'orthopedics', 'name': 'Orthopedics', 'color': 'orange'}
-        ]
-        
-        return jsonify(departments)
+        return jsonify(DEPARTMENTS)
         
     except Exception as e:
         print(f"Error fetching departments: {e}")
@@ -458,16 +690,7 @@ def get_departments():
 def get_doctors():
     """Get all doctors by department"""
     try:
-        doctors = [
-            {'id': 'all', 'name': 'All Doctors', 'department': 'all'},
-            {'id': 'dr_smith', 'name': 'Dr. Smith', 'department': 'emergency'},
-            {'id': 'dr_johnson', 'name': 'Dr. Johnson', 'department': 'general'},
-            {'id': 'dr_williams', 'name': 'Dr. Williams', 'department': 'cardiology'},
-            {'id': 'dr_brown', 'name': 'Dr. Brown', 'department': 'pediatrics'},
-            {'id': 'dr_davis', 'name': 'Dr. Davis', 'department': 'orthopedics'}
-        ]
-        
-        return jsonify(doctors)
+        return jsonify(DOCTORS)
         
     except Exception as e:
         print(f"Error fetching doctors: {e}")
@@ -477,180 +700,182 @@ def get_doctors():
 
 @app.route('/api/facilities', methods=['GET'])
 def get_facilities():
-    """Return all facilities from MongoDB"""
+    """
+    Return all facilities from the in-memory facility snapshot.
+    The snapshot's content version doubles as the ETag, so clients that
+    already hold the catalogue get a bodyless 304; concurrent requests for
+    the same version share one serialized body.
+    """
     try:
-        facilities_collection = db.get_collection('facilities')
-        facilities = list(facilities_collection.find({}))
-        
-        # Transform MongoDB data to frontend format
-        formatted_facilities = []
-        for facility in facilities:
-            # Get coordinates for the city
-            coords = get_city_coordinates(facility.get('City', 'Johannesburg'))
-            
-            # Get specialties from departments
-            specialties = get_specialties_from_departments(facility['_id'])
-            
-            # Format facility data
-            formatted_facility = {
-                'id': str(facility['_id']),
-                'name': facility.get('Name', 'Unknown Hospital'),
-                'location': {
-                    'lat': coords['lat'],
-                    'lng': coords['lng']
-                },
-                'address': f"{facility.get('Address', '')}, {facility.get('City', '')}, {facility.get('Province', '')}",
-                'phone': facility.get('Phone', ''),
-                'specialties': specialties,
-                'emergencyLevel': map_facility_type_to_emergency_level(
-                    facility.get('Facility_type', ''), 
-                    facility.get('Level_of_care', '')
-                ),
-                'rating': 4.0 + (hash(facility.get('Name', '')) % 10) / 10,  # Generate consistent rating
-                'capacity': facility.get('capacity_beds', 50),
-                'facilityType': facility.get('Facility_type', 'Hospital'),
-                'ownership': facility.get('Ownership_type', 'Public'),
-                'city': facility.get('City', ''),
-                'province': facility.get('Province', '')
-            }
-            formatted_facilities.append(formatted_facility)
-        
-        return jsonify(formatted_facilities)
+        snapshot = facility_cache.get()
+        etag = f'facilities-{snapshot.version}'
+        
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            body, _ = request_flights.do(etag, lambda: dumps_bytes(format_facilities(snapshot)) + b'\n')
+            response = Response(body, mimetype=app.json.mimetype)
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = FACILITY_CACHE_CONTROL
+        return response
         
     except Exception as e:
         print(f"Error fetching facilities: {e}")
         return jsonify({'error': 'Failed to fetch facilities'}), 500
 
+def aggregate_facility_capacity(facility_ids=None):
+    """Capacity rows for many facilities in a single round trip, keyed by facility ID"""
+    departments = list(db.get_collection('departments').aggregate(facility_capacity_pipeline(facility_ids)))
+    for dept in departments:
+        if dept.get('capacity'):
+            known_capacity.remember(dept['_id'], dept['capacity'])
+    return group_facility_capacity(departments, facility_ids)
+
+def fetch_facility_capacity(facility_ids=None):
+    """
+    (capacity_by_facility, stale_age) through the breaker, falling back to
+    the last answer for these IDs; concurrent requests for the same IDs
+    share one aggregation
+    """
+    key = ('capacity', tuple(facility_ids) if facility_ids is not None else None)
+    result, _ = request_flights.do(
+        key, lambda: last_known_good.fetch(key, lambda: aggregate_facility_capacity(facility_ids))
+    )
+    return result
+
+@app.route('/api/capacity', methods=['GET'])
+def get_bulk_capacity():
+    """Return capacity for many facilities keyed by facility ID"""
+    try:
+        # Comma separated list, e.g. /api/capacity?facility_ids=1,2,3; omit for all
+        facility_ids = parse_facility_ids(request.args.get('facility_ids'))
+        
+        capacity_by_facility, stale_age = fetch_facility_capacity(facility_ids)
+        
+        response = jsonify({str(facility_id): rows for facility_id, rows in capacity_by_facility.items()})
+        if stale_age is not None:
+            response.headers.update(stale_headers(stale_age))
+        return response
+        
+    except FALLBACK_ERRORS as e:
+        return atlas_unavailable(e, "Atlas unavailable fetching bulk capacity")
+    except Exception as e:
+        print(f"Error fetching bulk capacity: {e}")
+        return jsonify({'error': 'Failed to fetch capacity'}), 500
+
 @app.route('/api/facilities/<facility_id>/capacity', methods=['GET'])
 def get_facility_capacity(facility_id):
-    """Return current capacity for specific facility with better error handling"""
+    """Return current capacity for specific facility (stale-marked while Atlas is unavailable)"""
     try:
         # Convert string ID to int if needed
-        try:
-            facility_id_int = int(facility_id)
-        except ValueError:
-            facility_id_int = facility_id
+        facility_id_int = parse_facility_id(facility_id)
         
         # Check if facility exists first
-        facility = db.get_collection('facilities').find_one({'_id': facility_id_int})
+        facility = facility_cache.get().get_facility(facility_id_int)
         if not facility:
-            # Return mock data if facility doesn't exist
-            return jsonify([{
-                'Department_name': 'General Department',
-                'Specialty': 'general',
-                'Current_patients': 5,
-                'Current_beds_available': 10,
-                'Total_beds': 15,
-                'Current_doctors_on_duty': 2,
-                'Wait_time_minutes': 45,
-                'Status': 'MODERATE',
-                'Utilization_rate': 33.3
-            }])
-        
-        # Get departments for this facility with timeout
-        departments = list(db.get_collection('departments').find({'Facility_ID': facility_id_int}).limit(10))
-        
-        capacity_data = []
-        
-        if not departments:
-            # Return default department if none found
-            capacity_data.append({
-                'Department_name': 'General Department',
-                'Specialty': 'general',
-                'Current_patients': 3,
-                'Current_beds_available': 12,
-                'Total_beds': 15,
-                'Current_doctors_on_duty': 2,
-                'Wait_time_minutes': 30,
-                'Status': 'LOW',
-                'Utilization_rate': 20.0
-            })
-        else:
-            for dept in departments:
-                dept_id = dept['_id']
-                
-                # Get capacity data for this department with fallback
-                try:
-                    capacity = db.get_collection('department_capacity').find_one({'Department_ID': dept_id})
-                except:
-                    capacity = None
-                
-                # Map department name to specialty
-                dept_name = dept.get('Name', 'General Department')
-                specialty_name = 'general'
-                
-                if 'Emergency' in dept_name:
-                    specialty_name = 'emergency'
-                elif 'Cardiology' in dept_name:
-                    specialty_name = 'cardiology'
-                elif 'Pediatrics' in dept_name or 'Children' in dept_name:
-                    specialty_name = 'pediatrics'
-                elif 'Neurology' in dept_name:
-                    specialty_name = 'neurology'
-                elif 'Orthopedics' in dept_name:
-                    specialty_name = 'orthopedics'
-                
-                # Use capacity data if available, otherwise use defaults
-                if capacity:
-                    current_patients = capacity.get('Current_patients', 0)
-                    doctors_on_duty = capacity.get('Current_doctors_on_duty', 1)
-                    wait_time = min(max(current_patients * 15 // doctors_on_duty, 15), 180)
-                    total_beds = dept.get('Capacity_beds', 20)
-                    available_beds = capacity.get('Current_beds_available', total_beds // 2)
-                else:
-                    # Generate reasonable mock data
-                    import random
-                    total_beds = random.randint(10, 30)
-                    current_patients = random.randint(0, total_beds)
-                    available_beds = total_beds - current_patients
-                    doctors_on_duty = random.randint(1, 5)
-                    wait_time = random.randint(15, 120)
-                
-                # Calculate utilization and status
-                utilization = ((total_beds - available_beds) / total_beds * 100) if total_beds > 0 else 0
-                
-                if utilization >= 95:
-                    status = 'CRITICAL'
-                elif utilization >= 85:
-                    status = 'HIGH'
-                elif utilization >= 65:
-                    status = 'MODERATE'
-                else:
-                    status = 'LOW'
-                
-                capacity_info = {
-                    'Department_name': dept_name,
-                    'Specialty': specialty_name,
-                    'Current_patients': current_patients,
-                    'Current_beds_available': available_beds,
-                    'Total_beds': total_beds,
-                    'Current_doctors_on_duty': doctors_on_duty,
-                    'Wait_time_minutes': wait_time,
-                    'Status': status,
-                    'Utilization_rate': round(utilization, 1)
-                }
-                capacity_data.append(capacity_info)
-        
-        return jsonify(capacity_data)
+            return jsonify({'error': 'Facility not found'}), 404
+        
+        # Departments and their capacity in one aggregation
+        capacity_by_facility, stale_age = fetch_facility_capacity([facility_id_int])
         
+        response = jsonify(capacity_by_facility[facility_id_int])
+        if stale_age is not None:
+            response.headers.update(stale_headers(stale_age))
+        return response
+        
+    except FALLBACK_ERRORS as e:
+        return atlas_unavailable(e, f"Atlas unavailable fetching capacity for facility {facility_id}")
     except Exception as e:
         print(f"Error fetching capacity for facility {facility_id}: {e}")
-        # Return mock data on any error to prevent frontend timeouts
-        return jsonify([{
-            'Department_name': 'General Department',
-            'Specialty': 'general',
-            'Current_patients': 3,
-            'Current_beds_available': 12,
-            'Total_beds': 15,
-            'Current_doctors_on_duty': 2,
-            'Wait_time_minutes': 45,
-            'Status': 'MODERATE',
-            'Utilization_rate': 20.0
-        }]), 200  # Return 200 even on error to prevent timeouts
+        return jsonify({'error': 'Failed to fetch capacity'}), 500
+
+@app.route('/api/capacity/stream', methods=['GET'])
+def stream_capacity():
+    """
+    Server-Sent Events feed of department capacity.
+    Sends a full 'snapshot' event on connect, then a 'capacity' event for each
+    changed department row. Reconnecting clients send Last-Event-ID and only
+    receive what they missed, or a new snapshot if that is no longer possible.
+    """
+    facility_ids = parse_facility_ids(request.args.get('facility_ids'))
+    facility_ids = set(facility_ids) if facility_ids else None
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    
+    def refused():
+        return jsonify({'error': 'Too many open capacity streams, please retry'}), 503, {
+            'Retry-After': str(CAPACITY_STREAM_RETRY_MS // 1000 or 1)
+        }
+    
+    if not capacity_events.subscribe():
+        return refused()
+    
+    # The stream's thread comes out of the shared admission budget, never the critical reserve
+    holds_admission = admission_enabled()
+    if holds_admission and not admission.hold():
+        capacity_events.unsubscribe()
+        return refused()
+    
+    def close_stream():
+        capacity_events.unsubscribe()
+        if holds_admission:
+            admission.unhold()
+    
+    def generate():
+        try:
+            yield f"retry: {CAPACITY_STREAM_RETRY_MS}\n\n"
+            
+            after_seq = capacity_events.resume_position(last_event_id)
+            if after_seq is None:
+                # Read the position first so nothing written during the snapshot is lost
+                after_seq = capacity_events.current_seq()
+                capacity = aggregate_facility_capacity(sorted(facility_ids) if facility_ids else None)
+                yield format_sse(
+                    {str(facility_id): rows for facility_id, rows in capacity.items()},
+                    event='snapshot',
+                    event_id=f"{capacity_events.epoch}-{after_seq}"
+                )
+            
+            while True:
+                events = capacity_events.wait_for_events(after_seq, CAPACITY_STREAM_HEARTBEAT_SECONDS)
+                if not events:
+                    yield ": heartbeat\n\n"
+                    continue
+                
+                snapshot = facility_cache.get()
+                for event in events:
+                    after_seq = event.seq
+                    facility_id, row = capacity_event_row(snapshot, event)
+                    if row is None or (facility_ids and facility_id not in facility_ids):
+                        continue
+                    yield format_sse(
+                        {'facility_id': str(facility_id), 'department': row},
+                        event='capacity',
+                        event_id=event.event_id(capacity_events.epoch)
+                    )
+        except Exception as e:
+            print(f"Error streaming capacity: {e}")
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    # Released when the server closes the response, even if the stream never started
+    response.call_on_close(close_stream)
+    return response
 
 @app.route('/api/emergency-hospitals', methods=['POST'])
 def get_emergency_hospitals():
-    """Return emergency-capable hospitals near location"""
+    """
+    Return emergency-capable hospitals near location.
+    While Atlas is unavailable the search runs over the facility snapshot
+    with each emergency department's last known capacity, marked stale.
+    """
     try:
         data = request.get_json()
         user_lat = data.get('latitude')
@@ -661,149 +886,134 @@ def get_emergency_hospitals():
         if not user_lat or not user_lng:
             return jsonify({'error': 'Location coordinates required'}), 400
         
-        # Get all facilities
-        facilities = list(db.get_collection('facilities').find({}))
+        is_pediatric = bool(patient_age and patient_age <= 18)
         
-        emergency_hospitals = []
+        # With a travel-time matrix, rank every facility in range by drive time
+        rank_by_eta = travel_times.available
+        pipeline = emergency_search_pipeline(user_lat, user_lng, max_distance, is_pediatric, rank_by_eta)
         
-        for facility in facilities:
-            # Check if facility has emergency capability
-            departments = list(db.get_collection('departments').find({'Facility_ID': facility['_id']}))
-            has_emergency = any('Emergency' in dept.get('Name', '') for dept in departments)
-            
-            # Skip if no emergency department
-            if not has_emergency and facility.get('Facility_type') != 'Emergency Center':
-                continue
-            
-            # Get facility coordinates
-            coords = get_city_coordinates(facility.get('City', 'Johannesburg'))
-            
-            # Calculate distance
-            distance = calculate_distance(user_lat, user_lng, coords['lat'], coords['lng'])
-            
-            # Skip if too far
-            if distance > max_distance:
-                continue
-            
-            # For pediatric emergencies, check if facility handles children
-            if patient_age and patient_age <= 18:
-                has_pediatrics = any('Pediatric' in dept.get('Name', '') or 'Children' in facility.get('Name', '') 
-                                   for dept in departments)
-                # Prefer pediatric facilities for children, but don't exclude others
-                pediatric_preference = has_pediatrics
-            else:
-                pediatric_preference = False
-            
-            # Get emergency department capacity
-            emergency_dept = None
-            for dept in departments:
-                if 'Emergency' in dept.get('Name', ''):
-                    emergency_dept = dept
-                    break
-            
-            if emergency_dept:
-                capacity = db.get_collection('department_capacity').find_one({'Department_ID': emergency_dept['_id']})
-            else:
-                capacity = None
-            
-            # Calculate current status
-            if capacity:
-                current_patients = capacity.get('Current_patients', 0)
-                available_beds = capacity.get('Current_beds_available', 10)
-                total_beds = emergency_dept.get('Capacity_beds', 15)
-                doctors_on_duty = capacity.get('Current_doctors_on_duty', 2)
-                wait_time = min(max(current_patients * 15 // doctors_on_duty, 15), 180)
-            else:
-                available_beds = 5
-                total_beds = 15
-                wait_time = 45
-                current_patients = total_beds - available_beds
-            
-            emergency_hospital = {
-                'id': str(facility['_id']),
-                'name': facility.get('Name', 'Unknown Hospital'),
-                'location': coords,
-                'address': f"{facility.get('Address', '')}, {facility.get('City', '')}, {facility.get('Province', '')}",
-                'phone': facility.get('Phone', ''),
-                'distance': round(distance, 1),
-                'estimatedArrival': max(15, int(distance * 2.5)),  # Factor in traffic
-                'emergencyLevel': map_facility_type_to_emergency_level(
-                    facility.get('Facility_type', ''), 
-                    facility.get('Level_of_care', '')
-                ),
-                'specialties': get_specialties_from_departments(facility['_id']),
-                'currentCapacity': {
-                    'emergency': {
-                        'available': available_beds,
-                        'total': total_beds,
-                        'waitTime': wait_time,
-                        'status': 'CRITICAL' if available_beds <= 2 else 'HIGH' if available_beds <= 5 else 'MODERATE'
-                    }
-                },
-                'isLevel1Trauma': 'Level 1' in map_facility_type_to_emergency_level(
-                    facility.get('Facility_type', ''), 
-                    facility.get('Level_of_care', '')
-                ),
-                'hasAmbulance': facility.get('Facility_type') != 'Clinic',
-                'directionsUrl': f"https://maps.google.com/maps?daddr={coords['lat']},{coords['lng']}",
-                'pediatricPreference': pediatric_preference
-            }
-            
-            emergency_hospitals.append(emergency_hospital)
+        # Precomputed facility attributes and live emergency capacity in one indexed read
+        stale_age = None
+        try:
+            matches = atlas_breaker.call(lambda: list(db.get_collection(READ_MODEL_COLLECTION).aggregate(pipeline)))
+            for match in matches:
+                if match.get('capacity') and match['emergencyDepartmentId'] is not None:
+                    known_capacity.remember(match['emergencyDepartmentId'], match['capacity'])
+        except FALLBACK_ERRORS as e:
+            print(f"Atlas unavailable, routing from the facility snapshot: {e}")
+            snapshot = facility_cache.get()
+            matches, stale_age = emergency_fallback_matches(
+                snapshot.read_models, snapshot.emergency_index, user_lat, user_lng, max_distance, is_pediatric,
+                known_capacity.recall, rank_by_eta
+            )
         
-        # Sort by distance, but prioritize pediatric facilities for children
-        if patient_age and patient_age <= 18:
-            emergency_hospitals.sort(key=lambda h: (not h['pediatricPreference'], h['distance']))
-        else:
-            emergency_hospitals.sort(key=lambda h: h['distance'])
+        etas = travel_times.eta_minutes(user_lat, user_lng, (match['_id'] for match in matches))
+        emergency_hospitals = [
+            format_emergency_hospital(match, is_pediatric, etas.get(match['_id'])) for match in matches
+        ]
         
-        # Return top 5 closest
-        return jsonify(emergency_hospitals[:5])
+        response = jsonify(rank_emergency_hospitals(emergency_hospitals, is_pediatric))
+        if stale_age is not None:
+            response.headers.update(stale_headers(stale_age))
+        return response
         
     except Exception as e:
         print(f"Error finding emergency hospitals: {e}")
         return jsonify({'error': 'Failed to find emergency hospitals'}), 500
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
+# Health: liveness is the process answering, readiness is it being able to serve
+
+verified_schema_version = None
+
+def check_readiness():
+    """(payload, ready); warms the facility snapshot on the first probe"""
+    global verified_schema_version
     try:
-        # Test database connection
-        db.client.admin.command('ping')
-        return jsonify({
-            'status': 'healthy',
-            'database': 'connected',
-            'timestamp': datetime.utcnow().isoformat()
-        })
+        facility_cache.get()
+        snapshot_loaded = True
     except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'database': 'disconnected',
-            'error': str(e),
-            'timestamp': datetime.utcnow().isoformat()
-        }), 500
+        print(f"Readiness: facility snapshot not loaded: {e}")
+        snapshot_loaded = False
+    
+    try:
+        atlas_breaker.call(lambda: db.client.admin.command('ping'))
+        database_connected = True
+    except Exception:
+        database_connected = False
+    
+    # Read schema_migrations until it is current, then trust it for the life of the process
+    if database_connected and verified_schema_version != LATEST_VERSION:
+        try:
+            verified_schema_version = schema_version(db)
+        except Exception as e:
+            print(f"Readiness: schema version not read: {e}")
+    
+    return health_payload(snapshot_loaded, database_connected, verified_schema_version, LATEST_VERSION)
+
+@app.route('/api/health/live', methods=['GET'])
+def liveness_check():
+    """Liveness: answers without touching the database"""
+    return jsonify({'status': 'alive', 'timestamp': datetime.utcnow().isoformat()})
+
+@app.route('/api/health/ready', methods=['GET'])
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    """Readiness (and liveness) report; 503 until this process can serve traffic"""
+    payload, ready = check_readiness()
+    return jsonify(payload), 200 if ready else 503
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss/age metrics for the in-process caches"""
+    return jsonify({
+        'facility_snapshot': facility_cache.stats(),
+        'capacity_events': capacity_events.stats(),
+        'facility_read_model': facility_projector.stats(),
+        'appointment_responses': appointment_cache.stats(),
+        'last_known_good': last_known_good.stats(),
+        'atlas_circuit': atlas_breaker.stats(),
+        'single_flight': request_flights.stats(),
+        'travel_times': travel_times.stats(),
+        'triage_write_behind': triage_writer.stats(),
+        'admission': admission.stats()
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition of this process's request, database and cache metrics"""
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def read_system_stats():
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    counters = appointment_counters.get()
+    by_status = counters.get('by_status', {})
+    
+    return {
+        'total_appointments': counters.get('total', 0),
+        'appointments_today': db.get_collection('appointments').count_documents({
+            'dateTime': {'$gte': today, '$lt': today + timedelta(days=1)}
+        }),
+        'pending_appointments': by_status.get('pending', 0),
+        'confirmed_appointments': by_status.get('confirmed', 0),
+        'total_facilities': len(facility_cache.get().facilities),
+        'total_assessments': db.get_collection('triage_assessments').estimated_document_count(),
+        'timestamp': datetime.utcnow().isoformat()
+    }
 
 @app.route('/api/stats', methods=['GET'])
 def get_system_stats():
-    """Get basic system statistics"""
+    """
+    Get basic system statistics.
+    Totals come from maintained counters, collection metadata and the facility
+    snapshot, so only the "today" count touches the appointments index.
+    Concurrent requests share one set of reads.
+    """
     try:
-        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        appointments_collection = db.get_collection('appointments')
-        
-        stats = {
-            'total_appointments': appointments_collection.count_documents({}),
-            'appointments_today': appointments_collection.count_documents({
-                'dateTime': {'$gte': today}
-            }),
-            'pending_appointments': appointments_collection.count_documents({'status': 'pending'}),
-            'confirmed_appointments': appointments_collection.count_documents({'status': 'confirmed'}),
-            'total_facilities': db.get_collection('facilities').count_documents({}),
-            'total_assessments': db.get_collection('triage_assessments').count_documents({}),
-            'timestamp': datetime.utcnow().isoformat()
-        }
+        stats, _ = request_flights.do('GET /api/stats', read_system_stats)
         return jsonify(stats)
     except Exception as e:
+        print(f"Error fetching stats: {e}")
         return jsonify({'error': 'Failed to fetch stats'}), 500
 
 # Error handlers
@@ -821,20 +1031,30 @@ if __name__ == '__main__':
     
     # Print available endpoints
     print("\nAvailable endpoints:")
-    print("GET    /api/appointments - Get appointments")
+    print("GET    /api/appointments - Get appointments (paged, ?limit=&cursor=&fields=)")
     print("POST   /api/appointments - Create appointment")
+    print("POST   /api/appointments/bulk - Create many appointments")
+    print("PATCH  /api/appointments/bulk - Update many appointments")
     print("PUT    /api/appointments/<id> - Update appointment")
     print("DELETE /api/appointments/<id> - Delete appointment")
+    print("GET    /api/export/<dataset> - Stream appointments/triage_assessments (NDJSON/CSV)")
     print("POST   /api/triage/assess - Submit triage assessment")
     print("GET    /api/departments - Get departments")
     print("GET    /api/doctors - Get doctors")
     print("GET    /api/facilities - Get all hospitals")
     print("GET    /api/facilities/<id>/capacity - Get hospital capacity")
+    print("GET    /api/capacity - Get capacity for many hospitals")
+    print("GET    /api/capacity/stream - Live capacity updates (Server-Sent Events)")
     print("POST   /api/emergency-hospitals - Find emergency hospitals")
-    print("GET    /api/health - Health check")
+    print("GET    /api/health - Health check (readiness and liveness)")
+    print("GET    /api/health/live - Liveness probe")
+    print("GET    /api/health/ready - Readiness probe")
     print("GET    /api/stats - System statistics")
+    print("GET    /api/cache/stats - Cache metrics")
+    print("GET    /api/metrics - Prometheus metrics")
     
     # Run the server
+    start_background_workers()
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
     
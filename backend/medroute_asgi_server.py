@@ -0,0 +1,944 @@
+# medroute_asgi_server.py
+"""
+Async (ASGI) Variant of the MedRoute API Server
+Same URLs and JSON as medroute_api_server.py, served by Quart on the Motor
+driver, so a slow Atlas call parks only the request that made it
+
+Run with: hypercorn medroute_asgi_server:app --bind 0.0.0.0:$PORT
+"""
+
+from quart import Quart, Response, g, jsonify, make_response, request
+from quart.json.provider import DefaultJSONProvider
+from quart_cors import cors
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from cloud_medroute_db import CloudMedRouteDB
+from async_medroute_db import AsyncMedRouteDB
+from facility_snapshot import FacilitySnapshotCache
+from facility_read_model import (
+    DEFAULT_LEASE_SECONDS, READ_MODEL_COLLECTION, FacilityReadModelProjector, project_facility
+)
+from triage_rules import DEFAULT_RULES_PATH, TriageRulesEngine
+from write_behind import WriteBehindBuffer
+from appointment_counters import AsyncAppointmentCounters
+from appointment_slots import AsyncSlotReservations, holds_slots, slot_ids
+from capacity_events import CapacityEventHub
+from json_provider import FastJSONProviderMixin
+from metrics import (
+    HTTP_IN_FLIGHT, REGISTRY, admission_collector, component_collector, fallback_collector, record_http_request,
+    response_cache_collector, single_flight_collector
+)
+from admission import (
+    DEFAULT_RESERVED, AdmissionRejected, AsyncAdmissionController, admission_classes, admission_enabled,
+    route_class
+)
+from response_cache import AppointmentResponseCache, appointment_cache_key
+from circuit_breaker import AsyncCircuitBreaker, retry_after
+from travel_times import DEFAULT_MATRIX_DIR, TravelTimes
+from single_flight import AsyncSingleFlight
+from migrations import LATEST_VERSION, schema_version
+from last_known_good import FALLBACK_ERRORS, AsyncLastKnownGoodCache, stale_headers
+from api_common import (
+    APPOINTMENT_REQUIRED_FIELDS, APPOINTMENT_SCHEDULE_FIELDS, CAPACITY_STREAM_HEARTBEAT_SECONDS,
+    CAPACITY_STREAM_RETRY_MS, INACTIVE_APPOINTMENT_STATUSES,
+    DEPARTMENTS, DOCTORS, EXPORT_BATCH_SIZE, EXPORT_CSV_COLUMNS, FACILITY_CACHE_CONTROL,
+    TRIAGE_REQUIRED_FIELDS,
+    CsvLineWriter, ExportChunker, build_appointment_document, build_appointment_update,
+    build_export_query, build_triage_assessment, bulk_create_results, bulk_update_results,
+    bulk_write_errors, capacity_event_row,
+    emergency_fallback_matches, emergency_search_pipeline, export_headers, export_ndjson_line, facility_capacity_pipeline,
+    finish_appointment_page, format_emergency_hospital, format_facilities, format_sse,
+    group_facility_capacity, health_payload, parse_appointment_batch, parse_appointment_page, parse_facility_id,
+    parse_facility_ids, prepare_appointment_batch, prepare_appointment_updates,
+    rank_emergency_hospitals, reactivated_appointments
+)
+from datetime import datetime, timedelta
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class MedRouteJSONProvider(FastJSONProviderMixin, DefaultJSONProvider):
+    """jsonify() that encodes ObjectId, datetime and numpy values itself"""
+
+app = Quart(__name__)
+app.json = MedRouteJSONProvider(app)
+app = cors(app, allow_origin='*', expose_headers=['X-Next-Cursor', 'ETag', 'X-Cache', 'Age', 'Warning', 'X-Data-Stale'])
+
+# Request handlers use the Motor client, created on the serving loop in startup().
+# The background threads (facility snapshot, capacity events, write-behind)
+# keep a blocking client of their own, opened on first use. Indexes are
+# created by the migration step (python migrations.py), not at startup.
+db = None
+appointment_counters = None
+slot_reservations = None
+background_db = CloudMedRouteDB()
+
+# Serialized GET /api/appointments pages shared by every dashboard tab
+appointment_cache = AppointmentResponseCache(
+    max_bytes=int(os.environ.get('APPOINTMENT_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+    ttl=float(os.environ.get('APPOINTMENT_CACHE_TTL_SECONDS', 5))
+)
+
+# Request-path Atlas reads share one breaker (see the Flask server)
+atlas_breaker = AsyncCircuitBreaker(
+    'atlas',
+    failure_threshold=int(os.environ.get('ATLAS_CIRCUIT_FAILURES', 5)),
+    reset_timeout=float(os.environ.get('ATLAS_CIRCUIT_RESET_SECONDS', 30)),
+    call_timeout=float(os.environ.get('ATLAS_CALL_TIMEOUT_MS', 2000)) / 1000
+)
+
+last_known_good = AsyncLastKnownGoodCache(
+    atlas_breaker,
+    max_entries=int(os.environ.get('LAST_KNOWN_GOOD_MAX_ENTRIES', 512)),
+    max_age=float(os.environ.get('LAST_KNOWN_GOOD_MAX_AGE_SECONDS', 3600))
+)
+
+known_capacity = AsyncLastKnownGoodCache(
+    atlas_breaker,
+    max_entries=int(os.environ.get('KNOWN_CAPACITY_MAX_ENTRIES', 20000)),
+    max_age=float(os.environ.get('LAST_KNOWN_GOOD_MAX_AGE_SECONDS', 3600))
+)
+
+# Drive times from the offline travel-time matrix (python travel_times.py), memory-mapped on first use
+travel_times = TravelTimes(os.environ.get('TRAVEL_TIME_MATRIX_DIR', DEFAULT_MATRIX_DIR))
+
+# Identical concurrent reads share one Atlas computation; the facility listing
+# is serialized without yielding the loop, so it never overlaps and is left out
+request_flights = AsyncSingleFlight()
+
+def atlas_unavailable(error, message):
+    """503 for a read Atlas could not answer and no earlier answer can stand in for"""
+    print(f"{message}: {error}")
+    return jsonify({'error': 'Database temporarily unavailable, please retry'}), 503, {
+        'Retry-After': str(retry_after(error))
+    }
+
+# How often an open capacity stream checks the event hub for new rows
+CAPACITY_STREAM_POLL_SECONDS = 1.0
+
+triage_writer = WriteBehindBuffer(
+    background_db,
+    'triage_assessments',
+    max_batch_size=int(os.environ.get('TRIAGE_WRITE_BATCH_SIZE', 100)),
+    flush_interval=float(os.environ.get('TRIAGE_WRITE_FLUSH_SECONDS', 1.0)),
+    spill_path=os.environ.get('TRIAGE_SPILL_PATH', 'triage_assessments.spill.ndjson')
+)
+
+triage_engine = TriageRulesEngine.from_file(os.environ.get('TRIAGE_RULES_PATH', DEFAULT_RULES_PATH))
+
+facility_cache = FacilitySnapshotCache(
+    background_db,
+    project_facility,
+    poll_interval=int(os.environ.get('FACILITY_SNAPSHOT_POLL_SECONDS', 300))
+)
+
+# 'lease' (default): every worker starts a projector but only the holder of
+# the projector lease follows changes; 'on': project unconditionally (one
+# process only); 'off': leave it to the standalone job
+facility_projector_mode = os.environ.get('FACILITY_READ_MODEL_PROJECTOR', 'lease').lower()
+facility_projector = FacilityReadModelProjector(
+    background_db,
+    poll_interval=int(os.environ.get('FACILITY_SNAPSHOT_POLL_SECONDS', 300)),
+    lease_seconds=float(os.environ.get('FACILITY_READ_MODEL_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+    if facility_projector_mode == 'lease' else None
+)
+run_facility_projector = facility_projector_mode != 'off'
+
+capacity_events = CapacityEventHub(
+    background_db,
+    history_size=int(os.environ.get('CAPACITY_EVENT_HISTORY', 1000)),
+    poll_interval=int(os.environ.get('CAPACITY_POLL_SECONDS', 5)),
+    # Streams here are coroutines, not threads; unbounded unless configured
+    max_subscribers=int(os.environ['CAPACITY_STREAM_MAX_SUBSCRIBERS'])
+    if os.environ.get('CAPACITY_STREAM_MAX_SUBSCRIBERS') else None
+)
+
+# Startup work left running once serving begins
+startup_tasks = set()
+
+@app.before_serving
+async def startup():
+    global db, appointment_counters, slot_reservations
+    db = AsyncMedRouteDB()
+    appointment_counters = AsyncAppointmentCounters(db)
+    slot_reservations = AsyncSlotReservations(db)
+
+    triage_writer.start()
+    facility_cache.start()
+    capacity_events.start()
+    if run_facility_projector:
+        facility_projector.start()
+
+    # Build the first snapshot off the loop without holding up serving;
+    # /api/health/ready reports 503 until it is loaded
+    warm_task = asyncio.get_running_loop().create_task(warm_facility_snapshot())
+    startup_tasks.add(warm_task)
+    warm_task.add_done_callback(startup_tasks.discard)
+
+async def facility_snapshot():
+    """The loaded facility snapshot, or one built in a worker thread so the loop never waits on Atlas"""
+    return facility_cache.peek() or await asyncio.to_thread(facility_cache.get)
+
+async def warm_facility_snapshot():
+    try:
+        await asyncio.to_thread(facility_cache.get)
+    except Exception as e:
+        print(f"Facility snapshot not ready at startup: {e}")
+
+@app.after_serving
+async def shutdown():
+    capacity_events.stop()
+    facility_cache.stop()
+    facility_projector.stop()
+    await asyncio.to_thread(triage_writer.close)
+    db.close_connection()
+
+# Request metrics for /api/metrics
+
+@app.before_request
+async def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.in_flight = True
+    HTTP_IN_FLIGHT.inc()
+
+@app.after_request
+async def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        record_http_request(
+            request.method,
+            request.url_rule.rule if request.url_rule else 'unmatched',
+            response.status_code,
+            time.perf_counter() - started,
+            request.content_length,
+            response.content_length
+        )
+    return response
+
+@app.teardown_request
+async def finish_request_metrics(error):
+    if g.pop('in_flight', False):
+        HTTP_IN_FLIGHT.dec()
+
+REGISTRY.register_collector(component_collector(triage_writer, facility_cache, capacity_events))
+REGISTRY.register_collector(response_cache_collector(appointment_cache))
+REGISTRY.register_collector(fallback_collector(atlas_breaker, last_known_good))
+REGISTRY.register_collector(single_flight_collector(request_flights))
+
+# Admission control: emergency routing and triage are admitted first, listing
+# and analytics requests are shed with 503 when their queue gets too slow.
+# Waiting costs no thread here, so capacity defaults to the Mongo pool size.
+admission_capacity = int(os.environ.get('ADMISSION_CAPACITY', 50))
+admission_reserved = int(os.environ.get('ADMISSION_RESERVED', DEFAULT_RESERVED))
+admission = AsyncAdmissionController(
+    admission_classes(admission_capacity, admission_reserved),
+    admission_capacity,
+    admission_reserved
+)
+REGISTRY.register_collector(admission_collector(admission))
+
+@app.before_request
+async def admit_request():
+    if not admission_enabled():
+        return None
+    name = route_class(request.method, request.url_rule.rule if request.url_rule else None)
+    if name is None:
+        return None
+    try:
+        g.admission_ticket = await admission.acquire(name)
+    except AdmissionRejected as e:
+        return jsonify({'error': 'Server busy, please retry', 'route_class': e.route_class}), 503, {
+            'Retry-After': str(e.retry_after)
+        }
+
+@app.teardown_request
+async def release_admission(error):
+    admission.release(g.pop('admission_ticket', None))
+
+# Appointment Management Routes
+
+@app.route('/api/appointments', methods=['GET'])
+async def get_appointments():
+    """
+    Get appointments with optional filtering, one page at a time.
+    Pages are ordered by (dateTime, _id); pass the X-Next-Cursor response
+    header back as ?cursor= to fetch the next page. Identical queries within
+    APPOINTMENT_CACHE_TTL_SECONDS are answered from the response cache,
+    concurrent misses for the same page share one query, and while Atlas is
+    unavailable the last page it returned is served marked stale.
+    """
+    try:
+        try:
+            query, projection, limit, _ = parse_appointment_page(request.args)
+            cache_key, cache_scope = appointment_cache_key(request.args)
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'error': f'Invalid query parameters: {e}'}), 400
+
+        cached = appointment_cache.get(cache_key)
+        if cached is not None:
+            response = Response(cached.body, mimetype=app.json.mimetype)
+            if cached.next_cursor:
+                response.headers['X-Next-Cursor'] = cached.next_cursor
+            response.headers['X-Cache'] = 'HIT'
+            return response
+        generation = appointment_cache.generation
+
+        async def read_page():
+            appointments = await (
+                db.get_collection('appointments').find(query, projection)
+                .sort([('dateTime', 1), ('_id', 1)])
+                .limit(limit + 1)
+                .to_list(None)
+            )
+            return finish_appointment_page(appointments, limit)
+
+        flight_key = ('appointments', cache_key)
+        ((appointments, next_cursor), stale_age), shared = await request_flights.do(
+            flight_key, lambda: last_known_good.fetch(flight_key, read_page)
+        )
+
+        response = jsonify(appointments)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        if stale_age is not None:
+            response.headers.update(stale_headers(stale_age))
+            return response
+        response.headers['X-Cache'] = 'MISS'
+        if not shared:
+            appointment_cache.put(cache_key, cache_scope, await response.get_data(), next_cursor, generation)
+        return response
+
+    except FALLBACK_ERRORS as e:
+        return atlas_unavailable(e, "Atlas unavailable fetching appointments")
+    except Exception as e:
+        print(f"Error fetching appointments: {e}")
+        return jsonify({'error': 'Failed to fetch appointments'}), 500
+
+async def claim_booking(appointment, held=()):
+    """Check the doctor's schedule and claim the slots; a 409 body when the time is taken"""
+    conflicts = (await slot_reservations.conflicts([appointment], exclude_ids=[appointment['id']])).get(0)
+    if conflicts:
+        return {'error': 'Doctor is already booked at this time', 'conflicts': conflicts}
+
+    if await slot_reservations.reserve([appointment], held):
+        return {'error': 'Doctor was booked at this time by another request', 'conflicts': []}
+
+    return None
+
+@app.route('/api/appointments', methods=['POST'])
+async def create_appointment():
+    """Create a new appointment"""
+    try:
+        data = await request.get_json()
+
+        for field in APPOINTMENT_REQUIRED_FIELDS:
+            if field not in data:
+                return jsonify({'error': f'Missing required field: {field}'}), 400
+
+        try:
+            appointment = build_appointment_document(data)
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({'error': f'Invalid appointment: {e}'}), 400
+
+        conflict = await claim_booking(appointment)
+        if conflict:
+            return jsonify(conflict), 409
+
+        try:
+            result = await db.get_collection('appointments').insert_one(appointment)
+        except Exception:
+            await slot_reservations.release([appointment['id']])
+            raise
+        await appointment_counters.record_inserts([appointment])
+        appointment_cache.invalidate([appointment])
+        appointment['_id'] = result.inserted_id
+
+        return jsonify(appointment), 201
+
+    except Exception as e:
+        print(f"Error creating appointment: {e}")
+        return jsonify({'error': 'Failed to create appointment'}), 500
+
+@app.route('/api/appointments/bulk', methods=['POST'])
+async def create_appointments_bulk():
+    """Create a batch of appointments in one write (see the Flask server)"""
+    try:
+        try:
+            items = parse_appointment_batch(await request.get_json())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        appointments, errors = prepare_appointment_batch(items)
+        if errors:
+            return jsonify({'error': 'Invalid appointments in batch', 'errors': errors}), 400
+
+        conflicts = await slot_reservations.conflicts(appointments)
+        candidates = [index for index in range(len(appointments)) if index not in conflicts]
+        for position in await slot_reservations.reserve([appointments[index] for index in candidates]):
+            conflicts[candidates[position]] = []
+
+        to_insert = [appointment for index, appointment in enumerate(appointments) if index not in conflicts]
+        write_errors = {}
+        if to_insert:
+            try:
+                await db.get_collection('appointments').insert_many(to_insert, ordered=False)
+            except BulkWriteError as e:
+                write_errors = bulk_write_errors(e.details)
+                await slot_reservations.release([to_insert[position]['id'] for position in write_errors])
+
+        results, created = bulk_create_results(appointments, conflicts, write_errors)
+        await appointment_counters.record_inserts(created)
+        appointment_cache.invalidate(created)
+
+        return jsonify({
+            'created': len(created),
+            'failed': len(appointments) - len(created),
+            'results': results
+        }), 201 if len(created) == len(appointments) else 207
+
+    except Exception as e:
+        print(f"Error creating appointments in bulk: {e}")
+        return jsonify({'error': 'Failed to create appointments'}), 500
+
+@app.route('/api/appointments/bulk', methods=['PATCH'])
+async def update_appointments_bulk():
+    """Update a batch of appointments with one read and one bulk write (see the Flask server)"""
+    try:
+        try:
+            items = parse_appointment_batch(await request.get_json())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        updates, errors = prepare_appointment_updates(items)
+        if errors:
+            return jsonify({'error': 'Invalid updates in batch', 'errors': errors}), 400
+
+        appointments_collection = db.get_collection('appointments')
+        current = {}
+        async for appointment in appointments_collection.find(
+            {'id': {'$in': [appointment_id for appointment_id, _ in updates]}},
+            {'_id': 0, 'id': 1, 'status': 1, 'department': 1, 'doctorId': 1, 'dateTime': 1}
+        ):
+            current[appointment['id']] = appointment
+        previous_status = {appointment_id: appointment.get('status') for appointment_id, appointment in current.items()}
+
+        rejected = reactivated_appointments(updates, previous_status)
+        operations = [
+            UpdateOne({'id': appointment_id}, {'$set': update_data})
+            for appointment_id, update_data in updates
+            if appointment_id in previous_status and appointment_id not in rejected
+        ]
+
+        write_errors = {}
+        if operations:
+            try:
+                await appointments_collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                write_errors = bulk_write_errors(e.details)
+
+        results, status_changes = bulk_update_results(updates, previous_status, rejected, write_errors)
+        await appointment_counters.record_status_changes(status_changes)
+
+        appointment_cache.invalidate(
+            version
+            for result, (appointment_id, update_data) in zip(results, updates) if result['status'] == 'updated'
+            for version in (current[appointment_id], {**current[appointment_id], **update_data})
+        )
+
+        cancelled = [
+            result['id'] for result, (_, update_data) in zip(results, updates)
+            if result['status'] == 'updated' and update_data.get('status') in INACTIVE_APPOINTMENT_STATUSES
+        ]
+        if cancelled:
+            await slot_reservations.release(cancelled)
+
+        updated = sum(1 for result in results if result['status'] == 'updated')
+        return jsonify({
+            'updated': updated,
+            'failed': len(results) - updated,
+            'results': results
+        }), 200 if updated == len(results) else 207
+
+    except Exception as e:
+        print(f"Error updating appointments in bulk: {e}")
+        return jsonify({'error': 'Failed to update appointments'}), 500
+
+@app.route('/api/appointments/<appointment_id>', methods=['PUT'])
+async def update_appointment(appointment_id):
+    """Update an existing appointment"""
+    try:
+        data = await request.get_json()
+        try:
+            update_data = build_appointment_update(data)
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({'error': f'Invalid update: {e}'}), 400
+
+        appointments_collection = db.get_collection('appointments')
+
+        held, claimed = set(), set()
+        if any(field in update_data for field in APPOINTMENT_SCHEDULE_FIELDS + ('status',)):
+            current = await appointments_collection.find_one({'id': appointment_id})
+            if current is None:
+                return jsonify({'error': 'Appointment not found'}), 404
+
+            held = slot_ids(current)
+            claimed = slot_ids({**current, **update_data}) - held
+            if claimed:
+                conflict = await claim_booking({**current, **update_data}, held)
+                if conflict:
+                    return jsonify(conflict), 409
+
+        try:
+            previous_appointment = await appointments_collection.find_one_and_update(
+                {'id': appointment_id},
+                {'$set': update_data},
+                return_document=ReturnDocument.BEFORE
+            )
+        except Exception:
+            if claimed:
+                await slot_reservations.release([appointment_id], claimed)
+            raise
+
+        if previous_appointment is None:
+            if claimed:
+                await slot_reservations.release([appointment_id], claimed)
+            return jsonify({'error': 'Appointment not found'}), 404
+
+        if 'status' in update_data:
+            await appointment_counters.record_status_change(previous_appointment.get('status'), update_data['status'])
+
+        updated_appointment = {**previous_appointment, **update_data}
+        appointment_cache.invalidate([previous_appointment, updated_appointment])
+
+        released = held - slot_ids(updated_appointment)
+        if released:
+            await slot_reservations.release([appointment_id], released)
+
+        return jsonify(updated_appointment)
+
+    except Exception as e:
+        print(f"Error updating appointment: {e}")
+        return jsonify({'error': 'Failed to update appointment'}), 500
+
+@app.route('/api/appointments/<appointment_id>', methods=['DELETE'])
+async def delete_appointment(appointment_id):
+    """Delete an appointment"""
+    try:
+        deleted_appointment = await db.get_collection('appointments').find_one_and_delete({'id': appointment_id})
+
+        if deleted_appointment is None:
+            return jsonify({'error': 'Appointment not found'}), 404
+
+        await appointment_counters.record_delete(deleted_appointment)
+        appointment_cache.invalidate([deleted_appointment])
+        if holds_slots(deleted_appointment):
+            await slot_reservations.release([appointment_id])
+
+        return jsonify({'message': 'Appointment deleted successfully'})
+
+    except Exception as e:
+        print(f"Error deleting appointment: {e}")
+        return jsonify({'error': 'Failed to delete appointment'}), 500
+
+# Streaming Export Routes
+
+@app.route('/api/export/<dataset>', methods=['GET'])
+async def export_dataset(dataset):
+    """Stream appointments or triage assessments as NDJSON or CSV"""
+    if dataset not in EXPORT_CSV_COLUMNS:
+        return jsonify({'error': f'Unknown export dataset: {dataset}'}), 404
+
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    compress = request.args.get('gzip', 'false').lower() in ('1', 'true', 'yes')
+
+    try:
+        query = build_export_query(dataset, request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameters: {e}'}), 400
+
+    async def generate():
+        cursor = db.get_collection(dataset).find(query).batch_size(EXPORT_BATCH_SIZE)
+        if dataset == 'appointments':
+            cursor = cursor.sort([('dateTime', 1), ('_id', 1)])
+
+        chunker = ExportChunker(compress)
+        csv_writer = CsvLineWriter(EXPORT_CSV_COLUMNS[dataset]) if export_format == 'csv' else None
+
+        try:
+            if csv_writer:
+                chunk = chunker.feed(csv_writer.header())
+                if chunk:
+                    yield chunk
+
+            async for doc in cursor:
+                chunk = chunker.feed(csv_writer.line(doc) if csv_writer else export_ndjson_line(doc))
+                if chunk:
+                    yield chunk
+
+            chunk = chunker.finish()
+            if chunk:
+                yield chunk
+        except Exception as e:
+            # Headers are already sent, so the client only sees a truncated stream
+            print(f"Error streaming {dataset} export: {e}")
+        finally:
+            await cursor.close()
+
+    response = await make_response(generate(), 200, export_headers(dataset, export_format, compress))
+    response.mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response.timeout = None
+    return response
+
+# Triage Assessment Routes
+
+@app.route('/api/triage/assess', methods=['POST'])
+async def submit_triage_assessment():
+    """Submit a triage assessment and get recommendations"""
+    try:
+        data = await request.get_json()
+
+        for field in TRIAGE_REQUIRED_FIELDS:
+            if field not in data:
+                return jsonify({'error': f'Missing required field: {field}'}), 400
+
+        decision = triage_engine.assess(data['symptoms'], data['severity'], int(data['age']))
+        assessment = build_triage_assessment(data, decision)
+
+        # Queue assessment for the write-behind buffer; when the queue is full (Atlas
+        # down) the backpressure wait and spill-file write happen off the loop
+        document = assessment.copy()
+        if not triage_writer.put_nowait(document):
+            await asyncio.to_thread(triage_writer.put, document)
+
+        return jsonify(assessment)
+
+    except Exception as e:
+        print(f"Error processing triage assessment: {e}")
+        return jsonify({'error': 'Failed to process triage assessment'}), 500
+
+# Department and Doctor Routes
+
+@app.route('/api/departments', methods=['GET'])
+async def get_departments():
+    """Get all departments"""
+    return jsonify(DEPARTMENTS)
+
+@app.route('/api/doctors', methods=['GET'])
+async def get_doctors():
+    """Get all doctors by department"""
+    return jsonify(DOCTORS)
+
+# Facility Routes
+
+@app.route('/api/facilities', methods=['GET'])
+async def get_facilities():
+    """Return all facilities from the in-memory facility snapshot, with ETag revalidation"""
+    try:
+        snapshot = await facility_snapshot()
+        etag = f'facilities-{snapshot.version}'
+
+        if request.if_none_match.contains_weak(etag):
+            response = Response('', status=304)
+        else:
+            response = jsonify(format_facilities(snapshot))
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = FACILITY_CACHE_CONTROL
+        return response
+
+    except Exception as e:
+        print(f"Error fetching facilities: {e}")
+        return jsonify({'error': 'Failed to fetch facilities'}), 500
+
+async def aggregate_facility_capacity(facility_ids=None):
+    """Capacity rows for many facilities in a single round trip, keyed by facility ID"""
+    departments = await db.get_collection('departments').aggregate(
+        facility_capacity_pipeline(facility_ids)
+    ).to_list(None)
+    for dept in departments:
+        if dept.get('capacity'):
+            known_capacity.remember(dept['_id'], dept['capacity'])
+    return group_facility_capacity(departments, facility_ids)
+
+async def fetch_facility_capacity(facility_ids=None):
+    """(capacity_by_facility, stale_age); see the Flask server"""
+    key = ('capacity', tuple(facility_ids) if facility_ids is not None else None)
+    result, _ = await request_flights.do(
+        key, lambda: last_known_good.fetch(key, lambda: aggregate_facility_capacity(facility_ids))
+    )
+    return result
+
+@app.route('/api/capacity', methods=['GET'])
+async def get_bulk_capacity():
+    """Return capacity for many facilities keyed by facility ID"""
+    try:
+        facility_ids = parse_facility_ids(request.args.get('facility_ids'))
+
+        capacity_by_facility, stale_age = await fetch_facility_capacity(facility_ids)
+
+        response = jsonify({str(facility_id): rows for facility_id, rows in capacity_by_facility.items()})
+        if stale_age is not None:
+            response.headers.update(stale_headers(stale_age))
+        return response
+
+    except FALLBACK_ERRORS as e:
+        return atlas_unavailable(e, "Atlas unavailable fetching bulk capacity")
+    except Exception as e:
+        print(f"Error fetching bulk capacity: {e}")
+        return jsonify({'error': 'Failed to fetch capacity'}), 500
+
+@app.route('/api/facilities/<facility_id>/capacity', methods=['GET'])
+async def get_facility_capacity(facility_id):
+    """Return current capacity for specific facility (stale-marked while Atlas is unavailable)"""
+    try:
+        facility_id_int = parse_facility_id(facility_id)
+
+        facility = (await facility_snapshot()).get_facility(facility_id_int)
+        if not facility:
+            return jsonify({'error': 'Facility not found'}), 404
+
+        capacity_by_facility, stale_age = await fetch_facility_capacity([facility_id_int])
+
+        response = jsonify(capacity_by_facility[facility_id_int])
+        if stale_age is not None:
+            response.headers.update(stale_headers(stale_age))
+        return response
+
+    except FALLBACK_ERRORS as e:
+        return atlas_unavailable(e, f"Atlas unavailable fetching capacity for facility {facility_id}")
+    except Exception as e:
+        print(f"Error fetching capacity for facility {facility_id}: {e}")
+        return jsonify({'error': 'Failed to fetch capacity'}), 500
+
+@app.route('/api/capacity/stream', methods=['GET'])
+async def stream_capacity():
+    """
+    Server-Sent Events feed of department capacity (see the Flask route).
+    Open streams poll the in-process event hub instead of blocking a thread each.
+    """
+    facility_ids = parse_facility_ids(request.args.get('facility_ids'))
+    facility_ids = set(facility_ids) if facility_ids else None
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+
+    if not capacity_events.subscribe():
+        return jsonify({'error': 'Too many open capacity streams, please retry'}), 503, {
+            'Retry-After': str(CAPACITY_STREAM_RETRY_MS // 1000 or 1)
+        }
+
+    async def generate():
+        try:
+            yield f"retry: {CAPACITY_STREAM_RETRY_MS}\n\n".encode('utf-8')
+
+            after_seq = capacity_events.resume_position(last_event_id)
+            if after_seq is None:
+                after_seq = capacity_events.current_seq()
+                capacity = await aggregate_facility_capacity(sorted(facility_ids) if facility_ids else None)
+                yield format_sse(
+                    {str(facility_id): rows for facility_id, rows in capacity.items()},
+                    event='snapshot',
+                    event_id=f"{capacity_events.epoch}-{after_seq}"
+                ).encode('utf-8')
+
+            last_sent = time.monotonic()
+            while True:
+                events = capacity_events.wait_for_events(after_seq, 0)
+                if not events:
+                    if time.monotonic() - last_sent >= CAPACITY_STREAM_HEARTBEAT_SECONDS:
+                        last_sent = time.monotonic()
+                        yield b": heartbeat\n\n"
+                    await asyncio.sleep(CAPACITY_STREAM_POLL_SECONDS)
+                    continue
+
+                snapshot = await facility_snapshot()
+                for event in events:
+                    after_seq = event.seq
+                    facility_id, row = capacity_event_row(snapshot, event)
+                    if row is None or (facility_ids and facility_id not in facility_ids):
+                        continue
+                    last_sent = time.monotonic()
+                    yield format_sse(
+                        {'facility_id': str(facility_id), 'department': row},
+                        event='capacity',
+                        event_id=event.event_id(capacity_events.epoch)
+                    ).encode('utf-8')
+        except Exception as e:
+            print(f"Error streaming capacity: {e}")
+        finally:
+            capacity_events.unsubscribe()
+
+    response = await make_response(generate(), 200, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.timeout = None
+    return response
+
+@app.route('/api/emergency-hospitals', methods=['POST'])
+async def get_emergency_hospitals():
+    """Return emergency-capable hospitals near location (see the Flask route for the Atlas outage fallback)"""
+    try:
+        data = await request.get_json()
+        user_lat = data.get('latitude')
+        user_lng = data.get('longitude')
+        max_distance = data.get('max_distance', 50)  # Default 50km radius
+        patient_age = data.get('patient_age')
+
+        if not user_lat or not user_lng:
+            return jsonify({'error': 'Location coordinates required'}), 400
+
+        is_pediatric = bool(patient_age and patient_age <= 18)
+
+        # With a travel-time matrix, rank every facility in range by drive time
+        rank_by_eta = travel_times.available
+        pipeline = emergency_search_pipeline(user_lat, user_lng, max_distance, is_pediatric, rank_by_eta)
+
+        # Precomputed facility attributes and live emergency capacity in one indexed read
+        stale_age = None
+        try:
+            matches = await atlas_breaker.call(
+                lambda: db.get_collection(READ_MODEL_COLLECTION).aggregate(pipeline).to_list(None)
+            )
+            for match in matches:
+                if match.get('capacity') and match['emergencyDepartmentId'] is not None:
+                    known_capacity.remember(match['emergencyDepartmentId'], match['capacity'])
+        except FALLBACK_ERRORS as e:
+            print(f"Atlas unavailable, routing from the facility snapshot: {e}")
+            snapshot = await facility_snapshot()
+            matches, stale_age = emergency_fallback_matches(
+                snapshot.read_models, snapshot.emergency_index, user_lat, user_lng, max_distance, is_pediatric,
+                known_capacity.recall, rank_by_eta
+            )
+
+        etas = travel_times.eta_minutes(user_lat, user_lng, (match['_id'] for match in matches))
+        emergency_hospitals = [
+            format_emergency_hospital(match, is_pediatric, etas.get(match['_id'])) for match in matches
+        ]
+
+        response = jsonify(rank_emergency_hospitals(emergency_hospitals, is_pediatric))
+        if stale_age is not None:
+            response.headers.update(stale_headers(stale_age))
+        return response
+
+    except Exception as e:
+        print(f"Error finding emergency hospitals: {e}")
+        return jsonify({'error': 'Failed to find emergency hospitals'}), 500
+
+# Health: liveness is the process answering, readiness is it being able to serve
+
+verified_schema_version = None
+
+async def check_readiness():
+    """(payload, ready); warms the facility snapshot on the first probe"""
+    global verified_schema_version
+    try:
+        await asyncio.to_thread(facility_cache.get)
+        snapshot_loaded = True
+    except Exception as e:
+        print(f"Readiness: facility snapshot not loaded: {e}")
+        snapshot_loaded = False
+
+    try:
+        await atlas_breaker.call(db.ping)
+        database_connected = True
+    except Exception:
+        database_connected = False
+
+    # Read schema_migrations until it is current, then trust it for the life of the process
+    if database_connected and verified_schema_version != LATEST_VERSION:
+        try:
+            verified_schema_version = await asyncio.to_thread(schema_version, background_db)
+        except Exception as e:
+            print(f"Readiness: schema version not read: {e}")
+
+    return health_payload(snapshot_loaded, database_connected, verified_schema_version, LATEST_VERSION)
+
+@app.route('/api/health/live', methods=['GET'])
+async def liveness_check():
+    """Liveness: answers without touching the database"""
+    return jsonify({'status': 'alive', 'timestamp': datetime.utcnow().isoformat()})
+
+@app.route('/api/health/ready', methods=['GET'])
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    """Readiness (and liveness) report; 503 until this process can serve traffic"""
+    payload, ready = await check_readiness()
+    return jsonify(payload), 200 if ready else 503
+
+@app.route('/api/cache/stats', methods=['GET'])
+async def get_cache_stats():
+    """Hit/miss/age metrics for the in-process caches"""
+    return jsonify({
+        'facility_snapshot': facility_cache.stats(),
+        'capacity_events': capacity_events.stats(),
+        'facility_read_model': facility_projector.stats(),
+        'appointment_responses': appointment_cache.stats(),
+        'last_known_good': last_known_good.stats(),
+        'atlas_circuit': atlas_breaker.stats(),
+        'single_flight': request_flights.stats(),
+        'travel_times': travel_times.stats(),
+        'triage_write_behind': triage_writer.stats(),
+        'admission': admission.stats()
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+async def get_metrics():
+    """Prometheus text exposition of this process's request, database and cache metrics"""
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+async def read_system_stats():
+    """The three database reads run concurrently"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    counters, appointments_today, total_assessments = await asyncio.gather(
+        appointment_counters.get(),
+        db.get_collection('appointments').count_documents({
+            'dateTime': {'$gte': today, '$lt': today + timedelta(days=1)}
+        }),
+        db.get_collection('triage_assessments').estimated_document_count()
+    )
+    by_status = counters.get('by_status', {})
+
+    return {
+        'total_appointments': counters.get('total', 0),
+        'appointments_today': appointments_today,
+        'pending_appointments': by_status.get('pending', 0),
+        'confirmed_appointments': by_status.get('confirmed', 0),
+        'total_facilities': len((await facility_snapshot()).facilities),
+        'total_assessments': total_assessments,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+@app.route('/api/stats', methods=['GET'])
+async def get_system_stats():
+    """Basic system statistics; concurrent requests share one set of reads"""
+    try:
+        stats, _ = await request_flights.do('GET /api/stats', read_system_stats)
+        return jsonify(stats)
+    except Exception as e:
+        print(f"Error fetching stats: {e}")
+        return jsonify({'error': 'Failed to fetch stats'}), 500
+
+# Error handlers
+@app.errorhandler(404)
+async def not_found(error):
+    return jsonify({'error': 'Endpoint not found'}), 404
+
+@app.errorhandler(500)
+async def internal_error(error):
+    return jsonify({'error': 'Internal server error'}), 500
+
+if __name__ == '__main__':
+    print("Starting MedRoute API Server (ASGI)...")
+
+    port = int(os.environ.get('PORT', 5000))
+    debug = os.environ.get('FLASK_ENV') == 'development'
+
+    app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,435 @@
+"""
+In-process Metrics for the MedRoute API Server
+Counters, gauges and histograms rendered in the Prometheus text exposition
+format, plus a pymongo CommandListener that times every database command
+
+Metrics are per process: under the prefork profile each worker keeps its own
+registry and a scrape sees the worker that answered it (pid is exported as
+medroute_process_id so series from different workers can be told apart).
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+REPORTED_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+
+
+class Counter(_Metric):
+    metric_type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    metric_type = 'gauge'
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    Cumulative-bucket histogram. Alongside the buckets it exports
+    <name>_quantile estimates (interpolated within the bucket, as PromQL's
+    histogram_quantile does) so p50/p95/p99 are readable without a server.
+    """
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def quantile(self, q: float, counts: Sequence[int]) -> float:
+        total = sum(counts)
+        if total == 0:
+            return 0.0
+
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index]
+                if upper == float('inf'):
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-2]
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series[0]), series[1]) for key, series in self._series.items())
+
+        lines = self.header()
+        quantile_lines = [
+            f'# HELP {self.name}_quantile Estimated quantiles of {self.name}',
+            f'# TYPE {self.name}_quantile gauge'
+        ]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{_format_labels(self.labelnames, key, ("le", _format_value(bound)))} {cumulative}'
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+            for q in REPORTED_QUANTILES:
+                quantile_lines.append(
+                    f'{self.name}_quantile{_format_labels(self.labelnames, key, ("quantile", q))} '
+                    f'{_format_value(self.quantile(q, counts))}'
+                )
+
+        return lines + (quantile_lines if items else [])
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collect: Callable[[], Iterable[str]]):
+        """Add a callback producing exposition lines at scrape time (e.g. from existing stats())"""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = [
+            '# HELP medroute_process_id PID of the process that served this scrape',
+            '# TYPE medroute_process_id gauge',
+            f'medroute_process_id {os.getpid()}'
+        ]
+        for metric in list(self._metrics):
+            lines.extend(metric.render())
+        for collect in list(self._collectors):
+            try:
+                lines.extend(collect())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+def sample_lines(name: str, documentation: str, values: Dict[Tuple[Tuple[str, str], ...], float],
+                 metric_type: str = 'gauge') -> List[str]:
+    """Exposition lines for a value read at scrape time; keys are ((label, value), ...) tuples"""
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}']
+    for labels, value in values.items():
+        if value is None:
+            continue
+        label_text = _format_labels([label for label, _ in labels], [val for _, val in labels])
+        lines.append(f'{name}{label_text} {_format_value(value)}')
+    return lines
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    'medroute_http_request_duration_seconds', 'Time to produce a response, by route',
+    ('method', 'route')
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    'medroute_http_requests_total', 'Responses sent, by route and status code',
+    ('method', 'route', 'status')
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    'medroute_http_requests_in_flight', 'Requests currently being handled (including open streams)'
+)
+HTTP_REQUEST_SIZE = REGISTRY.histogram(
+    'medroute_http_request_size_bytes', 'Request body size, by route',
+    ('method', 'route'), SIZE_BUCKETS
+)
+HTTP_RESPONSE_SIZE = REGISTRY.histogram(
+    'medroute_http_response_size_bytes', 'Response body size for non-streamed responses, by route',
+    ('method', 'route'), SIZE_BUCKETS
+)
+MONGO_COMMAND_DURATION = REGISTRY.histogram(
+    'medroute_mongo_command_duration_seconds', 'MongoDB command round trip time, by command and collection',
+    ('command', 'collection')
+)
+MONGO_COMMAND_FAILURES = REGISTRY.counter(
+    'medroute_mongo_command_failures_total', 'MongoDB commands that failed, by command and collection',
+    ('command', 'collection')
+)
+ML_INFERENCE_DURATION = REGISTRY.histogram(
+    'medroute_ml_inference_seconds', 'ML model inference time, by model',
+    ('model',)
+)
+ADMISSION_QUEUE_WAIT = REGISTRY.histogram(
+    'medroute_admission_queue_wait_seconds', 'Time queued requests waited for admission, by route class',
+    ('route_class',)
+)
+
+
+def record_http_request(method: str, route: str, status: int, duration: float,
+                        request_size: Optional[int], response_size: Optional[int]):
+    """Record one finished request; sizes are None when unknown (e.g. streamed bodies)"""
+    HTTP_REQUEST_DURATION.observe(duration, method=method, route=route)
+    HTTP_REQUESTS.inc(method=method, route=route, status=status)
+    if request_size:
+        HTTP_REQUEST_SIZE.observe(request_size, method=method, route=route)
+    if response_size is not None:
+        HTTP_RESPONSE_SIZE.observe(response_size, method=method, route=route)
+
+
+def component_collector(triage_writer, facility_cache, capacity_events) -> Callable[[], List[str]]:
+    """Scrape-time collector exposing the existing stats() of the server's caches and buffers"""
+
+    def collect() -> List[str]:
+        writer = triage_writer.stats()
+        snapshot = facility_cache.stats()
+        events = capacity_events.stats()
+        collection = (('collection', writer['collection']),)
+
+        return (
+            sample_lines('medroute_write_behind_queue_depth', 'Documents waiting in the write-behind buffer',
+                         {collection: writer['queue_depth']})
+            + sample_lines('medroute_write_behind_documents_total', 'Write-behind documents by outcome',
+                           {collection + (('outcome', outcome),): writer[outcome]
+                            for outcome in ('written', 'spilled', 'replayed', 'dropped')}, 'counter')
+            + sample_lines('medroute_facility_snapshot_lookups_total', 'Facility snapshot lookups by result',
+                           {(('result', 'hit'),): snapshot['hits'], (('result', 'miss'),): snapshot['misses']},
+                           'counter')
+            + sample_lines('medroute_facility_snapshot_age_seconds', 'Age of the facility snapshot being served',
+                           {(): snapshot['age_seconds']})
+            + sample_lines('medroute_capacity_stream_subscribers', 'Open /api/capacity/stream connections',
+                           {(): events['subscribers']})
+            + sample_lines('medroute_capacity_stream_rejected_total',
+                           '/api/capacity/stream connections refused at the subscriber cap',
+                           {(): events['rejected_subscribers']}, 'counter')
+        )
+
+    return collect
+
+
+def response_cache_collector(appointment_cache) -> Callable[[], List[str]]:
+    """Scrape-time collector for the appointment listing response cache"""
+
+    def collect() -> List[str]:
+        stats = appointment_cache.stats()
+        return (
+            sample_lines('medroute_appointment_cache_lookups_total', 'Appointment page cache lookups by result',
+                         {(('result', 'hit'),): stats['hits'], (('result', 'miss'),): stats['misses']}, 'counter')
+            + sample_lines('medroute_appointment_cache_removals_total', 'Appointment pages dropped, by reason',
+                           {(('reason', reason),): stats[field] for reason, field in
+                            (('expired', 'expired'), ('evicted', 'evictions'), ('invalidated', 'invalidations'))},
+                           'counter')
+            + sample_lines('medroute_appointment_cache_bytes', 'Body bytes held by the appointment page cache',
+                           {(): stats['bytes']})
+            + sample_lines('medroute_appointment_cache_entries', 'Pages held by the appointment page cache',
+                           {(): stats['entries']})
+        )
+
+    return collect
+
+
+def fallback_collector(breaker, last_known_good) -> Callable[[], List[str]]:
+    """Scrape-time collector for the Atlas circuit breaker and the last-known-good fallback"""
+
+    def collect() -> List[str]:
+        circuit = breaker.stats()
+        fallback = last_known_good.stats()
+        return (
+            sample_lines('medroute_atlas_circuit_open', '1 while the Atlas circuit breaker is open or half-open',
+                         {(): 0 if circuit['state'] == 'closed' else 1})
+            + sample_lines('medroute_atlas_circuit_opened_total', 'Times the Atlas circuit breaker opened',
+                           {(): circuit['opened']}, 'counter')
+            + sample_lines('medroute_atlas_calls_total', 'Guarded Atlas calls by outcome',
+                           {(('outcome', 'attempted'),): circuit['calls'],
+                            (('outcome', 'failed'),): circuit['failures'],
+                            (('outcome', 'rejected'),): circuit['rejected']}, 'counter')
+            + sample_lines('medroute_last_known_good_responses_total', 'Guarded reads answered, by source',
+                           {(('source', 'atlas'),): fallback['fresh'],
+                            (('source', 'stale'),): fallback['stale_served'],
+                            (('source', 'unavailable'),): fallback['unavailable']}, 'counter')
+        )
+
+    return collect
+
+
+def single_flight_collector(flights) -> Callable[[], List[str]]:
+    """Scrape-time collector for request coalescing"""
+
+    def collect() -> List[str]:
+        stats = flights.stats()
+        return (
+            sample_lines('medroute_single_flight_requests_total', 'Coalescable reads, run or joined',
+                         {(('result', 'executed'),): stats['executions'],
+                          (('result', 'coalesced'),): stats['coalesced']}, 'counter')
+            + sample_lines('medroute_single_flight_in_flight', 'Distinct reads currently in flight',
+                           {(): stats['in_flight']})
+        )
+
+    return collect
+
+
+def admission_collector(admission) -> Callable[[], List[str]]:
+    """Scrape-time collector for the admission controller's queues and shed counts"""
+
+    def collect() -> List[str]:
+        admission_stats = admission.stats()
+        classes = admission_stats['classes']
+
+        def per_class(field):
+            return {(('route_class', name),): stats[field] for name, stats in classes.items()}
+
+        return (
+            sample_lines('medroute_admission_running', 'Admitted requests currently running, by route class',
+                         per_class('running'))
+            + sample_lines('medroute_admission_queue_depth', 'Requests waiting for admission, by route class',
+                           per_class('queued'))
+            + sample_lines('medroute_admission_held', 'Shared slots held by open streams',
+                           {(): admission_stats['held']})
+            + sample_lines('medroute_admission_admitted_total', 'Requests admitted, by route class',
+                           per_class('admitted'), 'counter')
+            + sample_lines('medroute_admission_shed_total', 'Requests answered 503 by route class and reason',
+                           {(('route_class', name), ('reason', reason)): count
+                            for name, stats in classes.items() for reason, count in stats['shed'].items()},
+                           'counter')
+        )
+
+    return collect
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command sent by the clients it is attached to"""
+
+    # Handshake and monitoring chatter is not application traffic
+    IGNORED_COMMANDS = frozenset({'hello', 'ismaster', 'isMaster', 'ping', 'saslStart', 'saslContinue',
+                                  'endSessions', 'buildinfo', 'buildInfo'})
+
+    def __init__(self):
+        self._collections: Dict[Tuple, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _collection(event) -> str:
+        command = event.command
+        target = command.get('collection') if event.command_name == 'getMore' else command.get(event.command_name)
+        return target if isinstance(target, str) else ''
+
+    def started(self, event):
+        if event.command_name in self.IGNORED_COMMANDS:
+            return
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = self._collection(event)
+
+    def _finish(self, event) -> Optional[str]:
+        with self._lock:
+            return self._collections.pop((event.connection_id, event.request_id), None)
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        if collection is None:
+            return
+        MONGO_COMMAND_DURATION.observe(
+            event.duration_micros / 1e6, command=event.command_name, collection=collection
+        )
+
+    def failed(self, event):
+        collection = self._finish(event)
+        if collection is None:
+            return
+        MONGO_COMMAND_DURATION.observe(
+            event.duration_micros / 1e6, command=event.command_name, collection=collection
+        )
+        MONGO_COMMAND_FAILURES.inc(command=event.command_name, collection=collection)
+
+
+# One listener instance for every client in the process
+MONGO_COMMAND_LISTENER = MongoCommandMetrics()
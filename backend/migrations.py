@@ -0,0 +1,172 @@
+"""
+Versioned Database Migrations
+Index management for medroute_production, run as an explicit deploy step
+instead of on every process start. Each migration is applied once and
+recorded in the schema_migrations collection; servers only read the
+recorded version to report readiness.
+
+Every step is idempotent (create_index on an identical index is a no-op), so
+a migration interrupted half way, or run by two deploys at once, is safe to
+run again. Append new migrations with the next version number; never edit
+one that has shipped.
+
+Usage: python migrations.py [--status] [--force]
+"""
+
+import argparse
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from appointment_slots import SLOT_RETENTION_SECONDS
+
+MIGRATIONS_COLLECTION = 'schema_migrations'
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable
+
+
+def baseline_indexes(db):
+    # Patient indexes for fast lookups
+    db.patients.create_index([("Patient_email", 1)], unique=True, sparse=True)
+    db.patients.create_index([("Patient_phone", 1)])
+    db.patients.create_index([("Patient_district", 1)])
+
+    # Medical consultation indexes for analytics
+    db.medical_consultations.create_index([("Consultation_Date", -1), ("Patient_ID", 1)])
+    db.medical_consultations.create_index([("Doctor_ID", 1)])
+    db.medical_consultations.create_index([("Facility_ID", 1)])
+    db.medical_consultations.create_index([("Admitted", 1)])
+
+    # Appointment scheduling indexes
+    db.appointments.create_index([("Date", 1), ("Time_ID", 1)])
+    db.appointments.create_index([("Patient_id", 1)])
+    db.appointments.create_index([("assigned_doctor_id", 1)])
+    db.appointments.create_index([("urgency_level", 1)])
+
+    # ML predictions indexes for analysis
+    db.medical_consultations.create_index([("ml_triage_result.symptom_analysis.severity_score", -1)])
+    db.medical_consultations.create_index([("ml_triage_result.urgency_level", 1)])
+
+    # Doctor availability indexes
+    db.doctor_assignments.create_index([("Department_ID", 1), ("End_date", 1)])
+
+    # Capacity monitoring indexes
+    db.department_capacity.create_index([("Department_ID", 1)], unique=True)
+
+    # Nearest-facility search ($geoNear on GeoJSON location)
+    db.facilities.create_index([("location", "2dsphere"), ("has_emergency", 1)])
+    db.departments.create_index([("Facility_ID", 1)])
+
+
+def appointment_listing_indexes(db):
+    # API appointment listing: equality filters first, then the keyset sort
+    db.appointments.create_index([
+        ("department", 1),
+        ("doctorId", 1),
+        ("status", 1),
+        ("dateTime", 1),
+        ("_id", 1)
+    ])
+    db.appointments.create_index([("dateTime", 1), ("_id", 1)])
+
+
+def double_booking_indexes(db):
+    # Overlap range scan per doctor, slot claims by appointment, and slot expiry
+    db.appointments.create_index([("doctorId", 1), ("dateTime", 1)])
+    db.appointment_slots.create_index([("appointmentId", 1)])
+    db.appointment_slots.create_index([("end", 1)], expireAfterSeconds=SLOT_RETENTION_SECONDS)
+
+
+def facility_read_model_indexes(db):
+    # Emergency routing and change attribution on the denormalized read model
+    db.facility_read_model.create_index([("location", "2dsphere"), ("acceptsEmergencies", 1)])
+    db.facility_read_model.create_index([("departmentIds", 1)])
+
+
+def facility_locations(db):
+    # Databases loaded before the uploader derived GeoJSON points have only
+    # latitude/longitude, which the 2dsphere indexes and $geoNear cannot use
+    db.facilities.update_many(
+        {
+            'location': {'$exists': False},
+            'latitude': {'$type': 'number'},
+            'longitude': {'$type': 'number'}
+        },
+        [{'$set': {'location': {
+            'type': 'Point',
+            'coordinates': ['$longitude', '$latitude']  # GeoJSON order is [lng, lat]
+        }}}]
+    )
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'baseline production indexes', baseline_indexes),
+    Migration(2, 'appointment listing indexes', appointment_listing_indexes),
+    Migration(3, 'double-booking indexes', double_booking_indexes),
+    Migration(4, 'facility read model indexes', facility_read_model_indexes),
+    Migration(5, 'facility GeoJSON locations', facility_locations),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def applied_versions(db) -> Dict[int, Dict]:
+    """Recorded migrations of the database, keyed by version"""
+    return {record['_id']: record for record in db.get_collection(MIGRATIONS_COLLECTION).find({})}
+
+
+def schema_version(db) -> int:
+    """Highest version up to which every migration has been applied"""
+    applied = applied_versions(db)
+    version = 0
+    for migration in MIGRATIONS:
+        if migration.version not in applied:
+            break
+        version = migration.version
+    return version
+
+
+def apply_migrations(db, force: bool = False) -> List[Migration]:
+    """Apply (with force, re-apply) every migration not yet recorded; returns those run"""
+    applied = {} if force else applied_versions(db)
+    records = db.get_collection(MIGRATIONS_COLLECTION)
+
+    ran = []
+    for migration in MIGRATIONS:
+        if migration.version in applied:
+            continue
+        print(f"Applying migration {migration.version}: {migration.name}")
+        migration.apply(db.db)
+        records.replace_one(
+            {'_id': migration.version},
+            {'_id': migration.version, 'name': migration.name, 'applied_at': datetime.utcnow()},
+            upsert=True
+        )
+        ran.append(migration)
+    return ran
+
+
+if __name__ == '__main__':
+    from cloud_medroute_db import CloudMedRouteDB
+
+    parser = argparse.ArgumentParser(description='Apply versioned index migrations to medroute_production')
+    parser.add_argument('--status', action='store_true', help='list migrations and whether each is applied')
+    parser.add_argument('--force', action='store_true', help='re-apply every migration (all are idempotent)')
+    args = parser.parse_args()
+
+    database = CloudMedRouteDB()
+    if args.status:
+        applied = applied_versions(database)
+        for migration in MIGRATIONS:
+            record = applied.get(migration.version)
+            state = f"applied {record['applied_at']:%Y-%m-%d %H:%M}" if record else 'pending'
+            print(f"{migration.version:>4}  {migration.name:<32} {state}")
+    else:
+        ran = apply_migrations(database, force=args.force)
+        print(f"✅ Schema at version {schema_version(database)} ({len(ran)} migration(s) applied)")
+    database.close_connection()
@@ -0,0 +1,188 @@
+"""
+Database Round-Trip Budgets and N+1 Detection
+Counts the MongoDB commands issued inside a request or a scheduler call and
+flags query shapes repeated often enough to look like a query in a loop
+
+Commands are attributed through a context variable, so only commands sent
+from the tracked call itself are counted; background threads (snapshot
+refresh, write-behind flushes, capacity polling) are not.
+
+Configuration (environment):
+    QUERY_BUDGET_MODE              off | log | raise (default log)
+    QUERY_BUDGET_MAX_ROUND_TRIPS   commands allowed per tracked call (default 8)
+    QUERY_BUDGET_MAX_REPEATS       times one query shape may run (default 2)
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+DEFAULT_MAX_ROUND_TRIPS = 8
+DEFAULT_MAX_REPEATS = 2
+
+# Connection setup and server monitoring are not issued by application code
+IGNORED_COMMANDS = frozenset({'hello', 'ismaster', 'isMaster', 'saslStart', 'saslContinue',
+                              'endSessions', 'buildinfo', 'buildInfo'})
+
+# getMore continues an existing cursor, so it costs a round trip but is never an N+1
+UNSHAPED_COMMANDS = frozenset({'getMore', 'killCursors'})
+
+# Command fields holding the query, per command name
+SHAPE_FIELDS = {
+    'find': ('filter', 'sort', 'projection'),
+    'aggregate': ('pipeline',),
+    'count': ('query',),
+    'distinct': ('key', 'query'),
+    'findAndModify': ('query', 'sort'),
+    'update': ('updates',),
+    'delete': ('deletes',),
+}
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in QUERY_BUDGET_MODE=raise when a tracked call breaks its budget"""
+
+
+def _shape(value):
+    """Query structure with every literal replaced, so find({'_id': 1}) and find({'_id': 2}) match"""
+    if isinstance(value, dict):
+        return '{' + ','.join(f'{key}:{_shape(item)}' for key, item in value.items()) + '}'
+    if isinstance(value, (list, tuple)):
+        # Only the first element: $in lists of different lengths are the same query
+        return '[' + (_shape(value[0]) if value else '') + ']'
+    return '?'
+
+
+def command_shape(command_name: str, command) -> str:
+    collection = command.get(command_name)
+    parts = [command_name, collection if isinstance(collection, str) else '']
+    for field in SHAPE_FIELDS.get(command_name, ()):
+        if field in command:
+            value = command[field]
+            # update/delete carry their filters inside each statement
+            if field in ('updates', 'deletes'):
+                value = [statement.get('q') for statement in value]
+            parts.append(f'{field}={_shape(value)}')
+    return ' '.join(parts)
+
+
+class QueryBudget:
+    """Round trips and query shapes seen during one tracked call"""
+
+    def __init__(self, name: str, max_round_trips: Optional[int] = None, max_repeats: Optional[int] = None):
+        self.name = name
+        self.max_round_trips = max_round_trips if max_round_trips is not None else int(
+            os.environ.get('QUERY_BUDGET_MAX_ROUND_TRIPS', DEFAULT_MAX_ROUND_TRIPS))
+        self.max_repeats = max_repeats if max_repeats is not None else int(
+            os.environ.get('QUERY_BUDGET_MAX_REPEATS', DEFAULT_MAX_REPEATS))
+        self.round_trips = 0
+        self.shapes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, shape: Optional[str]):
+        with self._lock:
+            self.round_trips += 1
+            if shape is not None:
+                self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def repeated_shapes(self) -> List[Tuple[str, int]]:
+        return sorted(
+            ((shape, count) for shape, count in self.shapes.items() if count > self.max_repeats),
+            key=lambda item: -item[1]
+        )
+
+    def violations(self) -> List[str]:
+        problems = []
+        if self.round_trips > self.max_round_trips:
+            problems.append(f'{self.round_trips} round trips (budget {self.max_round_trips})')
+        for shape, count in self.repeated_shapes():
+            problems.append(f'possible N+1: {count}x {shape}')
+        return problems
+
+    def summary(self) -> Dict:
+        return {
+            'name': self.name,
+            'round_trips': self.round_trips,
+            'max_round_trips': self.max_round_trips,
+            'shapes': dict(self.shapes)
+        }
+
+
+_active_budgets: ContextVar[Tuple[QueryBudget, ...]] = ContextVar('query_budgets', default=())
+
+
+def budget_mode() -> str:
+    return os.environ.get('QUERY_BUDGET_MODE', 'log').lower()
+
+
+def begin_budget(name: str, max_round_trips: Optional[int] = None,
+                 max_repeats: Optional[int] = None) -> Optional[QueryBudget]:
+    """Start tracking the current context (e.g. from a before_request hook); None when disabled"""
+    if budget_mode() == 'off':
+        return None
+    budget = QueryBudget(name, max_round_trips, max_repeats)
+    _active_budgets.set(_active_budgets.get() + (budget,))
+    return budget
+
+
+def discard_budget(budget: Optional[QueryBudget]):
+    """Stop tracking without enforcing (the tracked call failed or was abandoned)"""
+    if budget is None:
+        return
+    _active_budgets.set(tuple(active for active in _active_budgets.get() if active is not budget))
+
+
+def end_budget(budget: Optional[QueryBudget]):
+    """Stop tracking and enforce: print the violations in log mode, raise in raise mode"""
+    if budget is None:
+        return
+    discard_budget(budget)
+
+    problems = budget.violations()
+    if not problems:
+        return
+    message = f"Query budget exceeded in {budget.name}: " + '; '.join(problems)
+    if budget_mode() == 'raise':
+        raise QueryBudgetExceeded(message)
+    print(message)
+
+
+@contextmanager
+def query_budget(name: str, max_round_trips: Optional[int] = None, max_repeats: Optional[int] = None):
+    """Track the enclosed block; also usable as a decorator"""
+    budget = begin_budget(name, max_round_trips, max_repeats)
+    try:
+        yield budget
+    except BaseException:
+        # Let the original error through rather than a budget complaint about a failed call
+        discard_budget(budget)
+        raise
+    end_budget(budget)
+
+
+class QueryBudgetListener(monitoring.CommandListener):
+    """Attributes every command to the budgets active in the issuing context"""
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        budgets = _active_budgets.get()
+        if not budgets:
+            return
+        shape = None if event.command_name in UNSHAPED_COMMANDS else command_shape(event.command_name, event.command)
+        for budget in budgets:
+            budget.record(shape)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# One listener instance for every client in the process
+QUERY_BUDGET_LISTENER = QueryBudgetListener()
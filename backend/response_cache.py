@@ -0,0 +1,183 @@
+"""
+Appointment Listing Response Cache
+Serialized GET /api/appointments pages keyed on the normalized query,
+bounded by total body size with LRU eviction and expired after a short TTL
+
+The appointment write routes invalidate only the cached pages whose
+department/doctor/date filters could include the appointment they wrote.
+The cache is per process: under the prefork profile a write in one worker
+leaves the other workers' copies to expire with the TTL, which bounds how
+stale a page can be.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from api_common import build_appointment_query, parse_appointment_page
+from appointment_slots import utc_naive
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 5.0
+
+
+@dataclass(frozen=True)
+class AppointmentScope:
+    """The department/doctor/date filters of a cached page; None matches anything"""
+    department: Optional[str] = None
+    doctor_id: Optional[str] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+
+    def matches(self, appointment: Dict) -> bool:
+        if self.department is not None and appointment.get('department') != self.department:
+            return False
+        if self.doctor_id is not None and appointment.get('doctorId') != self.doctor_id:
+            return False
+        when = appointment.get('dateTime')
+        if not isinstance(when, datetime):
+            return True  # unknown time: assume it could be on the page
+        when = utc_naive(when)
+        if self.date_from is not None and when < self.date_from:
+            return False
+        if self.date_to is not None and when > self.date_to:
+            return False
+        return True
+
+
+def _key_value(value) -> str:
+    # Mongo compares datetimes in UTC, so 00:00Z and 02:00+02:00 are the same query
+    return utc_naive(value).isoformat() if isinstance(value, datetime) else str(value)
+
+
+def appointment_cache_key(args) -> Tuple[str, AppointmentScope]:
+    """
+    (key, scope) for a GET /api/appointments request. The key is built from
+    the parsed query, so parameter order, 'all' filters, equivalent date
+    spellings and unrelated parameters (e.g. cache busters) do not split it.
+    """
+    query, projection, limit, _ = parse_appointment_page(args)
+    key = json.dumps([query, sorted(projection) if projection else None, limit], sort_keys=True, default=_key_value)
+
+    base = build_appointment_query(args)
+    dates = base.get('dateTime', {})
+    scope = AppointmentScope(
+        department=base.get('department'),
+        doctor_id=base.get('doctorId'),
+        date_from=utc_naive(dates['$gte']) if '$gte' in dates else None,
+        date_to=utc_naive(dates['$lte']) if '$lte' in dates else None
+    )
+    return key, scope
+
+
+@dataclass(frozen=True)
+class CachedPage:
+    body: bytes
+    next_cursor: Optional[str]
+    scope: AppointmentScope
+    expires_at: float
+
+
+class AppointmentResponseCache:
+    """LRU of serialized appointment pages, bounded by the sum of their body sizes"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._pages: 'OrderedDict[str, CachedPage]' = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    @property
+    def generation(self) -> int:
+        """Read before querying and pass to put(), so a page read across a write is not stored"""
+        return self._generation
+
+    def get(self, key: str) -> Optional[CachedPage]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            if page.expires_at <= time.monotonic():
+                self._remove(key)
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, key: str, scope: AppointmentScope, body: bytes, next_cursor: Optional[str], generation: int):
+        if not self.enabled or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return  # an appointment was written while this page was being read
+            if key in self._pages:
+                self._remove(key)
+            self._pages[key] = CachedPage(body, next_cursor, scope, time.monotonic() + self.ttl)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._pages)))
+                self.evictions += 1
+
+    def invalidate(self, appointments: Iterable[Dict]) -> int:
+        """Drop every cached page that could contain any of the appointments (as written or as they were)"""
+        appointments = [appointment for appointment in appointments if appointment]
+        if not appointments:
+            return 0
+        with self._lock:
+            self._generation += 1
+            stale = [
+                key for key, page in self._pages.items()
+                if any(page.scope.matches(appointment) for appointment in appointments)
+            ]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._pages.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._pages),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+    def _remove(self, key: str):
+        page = self._pages.pop(key)
+        self._bytes -= len(page.body)
@@ -0,0 +1,111 @@
+"""
+Single-Flight Request Coalescing
+Concurrent callers asking for the same key share one in-flight computation:
+the first caller (the leader) runs it, everyone arriving while it runs waits
+for and receives the leader's result, or its exception
+
+Nothing is kept once the computation finishes, so a result is never older
+than the request that asked for it; the next caller for the key starts a
+new flight. A shared result is handed to every waiter as the same object
+and must be treated as read-only.
+"""
+
+import asyncio
+import threading
+from typing import Callable, Dict, Hashable, Tuple
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error', 'task')
+
+    def __init__(self, done):
+        self.done = done
+        self.result = None
+        self.error = None
+        self.task = None
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls across the threads of one process"""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.executions = 0
+        self.coalesced = 0
+
+    def _join(self, key: Hashable, new_event) -> Tuple[_Flight, bool]:
+        """(flight, leader) for key, starting a flight when none is in the air"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = _Flight(new_event())
+            self.executions += 1
+            return flight, True
+
+    def _land(self, key: Hashable, flight: _Flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.done.set()
+
+    def do(self, key: Hashable, compute: Callable) -> Tuple[object, bool]:
+        """(result, shared): shared is True when another caller's computation answered"""
+        flight, leader = self._join(key, threading.Event)
+        if not leader:
+            flight.done.wait()
+            return flight.outcome(), True
+
+        try:
+            flight.result = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._land(key, flight)
+        return flight.result, False
+
+    def stats(self) -> Dict:
+        calls = self.executions + self.coalesced
+        return {
+            'in_flight': len(self._flights),
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+            'coalesced_ratio': round(self.coalesced / calls, 4) if calls else 0.0
+        }
+
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    The same coalescing for coroutines on one event loop. The computation
+    runs in its own task that every caller, the leader included, awaits
+    through a shield: a caller whose client disconnects is cancelled alone,
+    and the others still get the result.
+    """
+
+    async def do(self, key: Hashable, compute: Callable) -> Tuple[object, bool]:
+        """compute() returns the awaitable, so only the leader creates one"""
+        flight, leader = self._join(key, asyncio.Event)
+        if leader:
+            try:
+                flight.task = asyncio.ensure_future(compute())
+            except BaseException:
+                self._land(key, flight)
+                raise
+            flight.task.add_done_callback(lambda task: self._land_task(key, flight))
+        return await asyncio.shield(flight.task), not leader
+
+    def _land_task(self, key: Hashable, flight: _Flight):
+        # Retrieve the error so a flight whose callers all left does not log it as unhandled
+        if not flight.task.cancelled():
+            flight.task.exception()
+        self._land(key, flight)
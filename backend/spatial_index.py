@@ -0,0 +1,213 @@
+"""
+In-memory Spatial Index over Facility Coordinates
+Equal-angle grid of lat/lng cells answering radius and k-nearest queries
+with exact haversine distances, so a search only measures the facilities in
+the cells its circle touches instead of every facility in the catalogue
+
+haversine_km() broadcasts over NumPy arrays, and nearest_batch() ranks
+thousands of locations (patients, for planning) at once: on the unit
+sphere the nearest point has the largest dot product, so each block of
+locations is ranked with one matrix product and only the k winners are
+measured. Without NumPy the same queries run on math, one distance at a
+time.
+
+Indexes are immutable: build a new one when the coordinates change, as
+FacilitySnapshotCache does on every rebuild.
+"""
+
+import math
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional speedup
+    np = None
+
+EARTH_RADIUS_KM = 6371.0
+HALF_CIRCUMFERENCE_KM = math.pi * EARTH_RADIUS_KM
+
+# Half a degree is ~55 km of latitude, about one default emergency search radius
+DEFAULT_CELL_DEGREES = 0.5
+
+# Locations per dot-product matrix in nearest_batch (block x points float64 values)
+BATCH_BLOCK_SIZE = 512
+
+# Above this many points a grid lookup per location beats one dot product per point
+BATCH_MATRIX_MAX_POINTS = 4000
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km; array arguments broadcast when NumPy is installed"""
+    if np is None:
+        return great_circle_km(float(lat1), float(lng1), float(lat2), float(lng2))
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(value, dtype=float)) for value in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def great_circle_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _unit_vectors(lats, lngs):
+    """(n, 3) points on the unit sphere; closer points have larger dot products"""
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    return np.column_stack((np.cos(lats) * np.cos(lngs), np.cos(lats) * np.sin(lngs), np.sin(lats)))
+
+
+class SpatialIndex:
+    """
+    Points (key, lat, lng) bucketed by grid cell. A radius query collects
+    the cells overlapping the circle's bounding box (widened in longitude
+    with latitude, and to every longitude near a pole), then keeps the
+    candidates whose exact distance is within the radius. Results are
+    (key, distance_km) pairs, nearest first, ties in insertion order.
+    """
+
+    def __init__(self, points: Iterable[Tuple[Hashable, float, float]],
+                 cell_degrees: float = DEFAULT_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._rows = int(math.ceil(180 / cell_degrees)) + 1
+        self._columns = int(math.ceil(360 / cell_degrees))
+
+        self.keys: List[Hashable] = []
+        lats: List[float] = []
+        lngs: List[float] = []
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        for key, lat, lng in points:
+            cells.setdefault(self._cell(float(lat), float(lng)), []).append(len(self.keys))
+            self.keys.append(key)
+            lats.append(float(lat))
+            lngs.append(float(lng))
+
+        if np is not None:
+            self._lats = np.array(lats, dtype=float)
+            self._lngs = np.array(lngs, dtype=float)
+            self._vectors = _unit_vectors(self._lats, self._lngs)
+            self._cells = {cell: np.array(positions, dtype=np.intp) for cell, positions in cells.items()}
+        else:
+            self._lats = lats
+            self._lngs = lngs
+            self._cells = cells
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def within(self, lat: float, lng: float, radius_km: float) -> List[Tuple[Hashable, float]]:
+        """Every point within radius_km of (lat, lng), nearest first"""
+        lat, lng, radius_km = float(lat), float(lng), float(radius_km)
+        if not self.keys or radius_km < 0:
+            return []
+        positions = self._candidates(lat, lng, radius_km)
+
+        if np is None:
+            measured = sorted(
+                (great_circle_km(lat, lng, self._lats[position], self._lngs[position]), position)
+                for position in positions
+            )
+            return [(self.keys[position], distance) for distance, position in measured if distance <= radius_km]
+
+        distances = haversine_km(lat, lng, self._lats[positions], self._lngs[positions])
+        inside = distances <= radius_km
+        positions, distances = positions[inside], distances[inside]
+        order = np.lexsort((positions, distances))
+        return [(self.keys[position], float(distance))
+                for position, distance in zip(positions[order], distances[order])]
+
+    def nearest(self, lat: float, lng: float, k: int,
+                max_distance_km: Optional[float] = None) -> List[Tuple[Hashable, float]]:
+        """The k points nearest to (lat, lng), optionally no farther than max_distance_km"""
+        if k <= 0 or not self.keys:
+            return []
+        limit = HALF_CIRCUMFERENCE_KM if max_distance_km is None else min(float(max_distance_km), HALF_CIRCUMFERENCE_KM)
+
+        # Every point within r is found, so once k of them are, they are the k nearest
+        radius = min(limit, self.cell_degrees * 111.2)
+        while True:
+            found = self.within(lat, lng, radius)
+            if len(found) >= k or radius >= limit:
+                return found[:k]
+            radius = min(limit, radius * 4)
+
+    def nearest_batch(self, lats: Sequence[float], lngs: Sequence[float],
+                      k: int) -> List[List[Tuple[Hashable, float]]]:
+        """nearest(lat, lng, k) for many locations at once (e.g. every patient for planning)"""
+        if np is None or k <= 0 or not self.keys or len(self.keys) > BATCH_MATRIX_MAX_POINTS:
+            return [self.nearest(lat, lng, k) for lat, lng in zip(lats, lngs)]
+
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        k = min(k, len(self.keys))
+        ranked = []
+        for start in range(0, len(lats), BATCH_BLOCK_SIZE):
+            block = slice(start, start + BATCH_BLOCK_SIZE)
+            if k < len(self.keys):
+                # k largest dot products per row in O(n), then only those k measured and sorted
+                similarity = _unit_vectors(lats[block], lngs[block]) @ self._vectors.T
+                nearest = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.broadcast_to(np.arange(len(self.keys)), (len(lats[block]), k))
+            distances = haversine_km(lats[block, None], lngs[block, None], self._lats[nearest], self._lngs[nearest])
+            order = np.lexsort((nearest, distances))
+            nearest = np.take_along_axis(nearest, order, axis=1)
+            distances = np.take_along_axis(distances, order, axis=1)
+            keys = self.keys
+            ranked.extend(
+                [(keys[position], distance) for position, distance in zip(row_positions, row_distances)]
+                for row_positions, row_distances in zip(nearest.tolist(), distances.tolist())
+            )
+        return ranked
+
+    def stats(self) -> Dict:
+        return {
+            'points': len(self.keys),
+            'cells': len(self._cells),
+            'cell_degrees': self.cell_degrees,
+            'vectorized': np is not None
+        }
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        row = min(self._rows - 1, max(0, int(math.floor((lat + 90) / self.cell_degrees))))
+        return row, int(math.floor((lng + 180) / self.cell_degrees)) % self._columns
+
+    def _candidates(self, lat: float, lng: float, radius_km: float):
+        """Positions of the points in the cells overlapping the circle's bounding box"""
+        angular = radius_km / EARTH_RADIUS_KM
+        delta_lat = math.degrees(angular)
+        if angular >= math.pi or lat - delta_lat <= -90 or lat + delta_lat >= 90:
+            delta_lng = 180.0  # the circle reaches a pole, so spans every longitude
+        else:
+            ratio = math.sin(angular) / math.cos(math.radians(lat))
+            delta_lng = 180.0 if ratio >= 1 else math.degrees(math.asin(ratio))
+
+        # A hair of slack so rounding never drops a point on the circle
+        delta_lat += 1e-9
+        delta_lng += 1e-9
+        first_row, _ = self._cell(lat - delta_lat, 0.0)
+        last_row, _ = self._cell(lat + delta_lat, 0.0)
+        spanned_columns = int(math.floor((lng + delta_lng + 180) / self.cell_degrees)) - \
+            int(math.floor((lng - delta_lng + 180) / self.cell_degrees)) + 1
+
+        # Searching more cells than are occupied costs more than measuring everything
+        if delta_lng >= 180 or spanned_columns >= self._columns or \
+                (last_row - first_row + 1) * spanned_columns >= len(self._cells):
+            return self._all_positions()
+
+        first_column = int(math.floor((lng - delta_lng + 180) / self.cell_degrees))
+        buckets = []
+        for row in range(first_row, last_row + 1):
+            for offset in range(spanned_columns):
+                bucket = self._cells.get((row, (first_column + offset) % self._columns))
+                if bucket is not None:
+                    buckets.append(bucket)
+
+        if np is None:
+            return [position for bucket in buckets for position in bucket]
+        return np.concatenate(buckets) if buckets else np.empty(0, dtype=np.intp)
+
+    def _all_positions(self):
+        if np is None:
+            return range(len(self.keys))
+        return np.arange(len(self.keys))
@@ -0,0 +1,199 @@
+"""
+Admission Control Tests
+Checks the priority order, the reserved critical slots and the shedding
+decisions of the admission controller without starting a server
+
+    python -m pytest test_admission.py
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('pymongo')
+
+from admission import (
+    ANALYTICS, CRITICAL, LISTING, STANDARD, AdmissionClass, AdmissionController, AdmissionRejected,
+    AsyncAdmissionController, admission_classes, route_class
+)
+
+
+def controller(capacity=4, reserved=1, listing_wait=0.5, analytics_wait=0.05):
+    classes = [
+        AdmissionClass(CRITICAL, 0, capacity, critical=True),
+        AdmissionClass(STANDARD, 1, capacity - reserved, 1.0),
+        AdmissionClass(LISTING, 2, 2, listing_wait),
+        AdmissionClass(ANALYTICS, 3, 1, analytics_wait),
+    ]
+    return AdmissionController(classes, capacity, reserved)
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not reached'
+        time.sleep(0.005)
+
+
+# Route classes
+
+@pytest.mark.parametrize('method, rule, expected', [
+    ('POST', '/api/emergency-hospitals', CRITICAL),
+    ('POST', '/api/triage/assess', CRITICAL),
+    ('GET', '/api/stats', ANALYTICS),
+    ('GET', '/api/export/<dataset>', ANALYTICS),
+    ('GET', '/api/facilities', LISTING),
+    ('POST', '/api/appointments', STANDARD),
+    ('GET', '/api/health', None),
+    ('GET', '/api/capacity/stream', None),
+    ('OPTIONS', '/api/triage/assess', None),
+    ('GET', None, None),
+])
+def test_route_classes(method, rule, expected):
+    assert route_class(method, rule) == expected
+
+
+def test_class_limits_leave_the_reserved_slots_free(monkeypatch):
+    monkeypatch.setenv('ADMISSION_LISTING_MAX_WAIT_MS', '40')
+    classes = {admission_class.name: admission_class for admission_class in admission_classes(8, 2)}
+
+    assert classes[CRITICAL].max_concurrency == 8
+    assert classes[STANDARD].max_concurrency == 6
+    assert classes[LISTING].max_wait == pytest.approx(0.04)
+    assert classes[CRITICAL].max_wait is None
+
+
+# Controller
+
+def test_class_limit_sheds_after_the_latency_target():
+    admission = controller(analytics_wait=0.05)
+    ticket = admission.acquire(ANALYTICS)
+
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire(ANALYTICS)
+    assert time.monotonic() - started >= 0.05
+    assert rejected.value.reason == 'timeout'
+    assert rejected.value.retry_after >= 1
+
+    admission.release(ticket)
+    assert admission.stats()['classes'][ANALYTICS]['shed'] == {'timeout': 1}
+
+
+def test_reserved_slot_is_only_for_critical_routes():
+    admission = controller(capacity=4, reserved=1)
+    tickets = [admission.acquire(STANDARD) for _ in range(3)]
+
+    # The shared slots are all running, so nothing sheddable may even wait
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire(LISTING)
+    assert rejected.value.reason == 'queue_full'
+
+    # ...while an emergency lookup is admitted straight away
+    critical = admission.acquire(CRITICAL)
+    for ticket in tickets + [critical]:
+        admission.release(ticket)
+
+
+def test_open_streams_never_take_the_critical_reserve():
+    # 8 gthread threads, 2 reserved: at most 6 may be streams and sheddable requests together
+    admission = AdmissionController(admission_classes(8, 2), 8, 2)
+    streams = 0
+    while admission.hold():
+        streams += 1
+    assert streams == 6
+
+    # Every shared thread is held by a stream, so sheddable traffic is refused rather than queued...
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire(STANDARD)
+    assert rejected.value.reason == 'queue_full'
+
+    # ...and emergency routing and triage still run on the reserved threads straight away
+    started = time.monotonic()
+    critical = [admission.acquire(CRITICAL), admission.acquire(CRITICAL)]
+    assert time.monotonic() - started < 0.05
+    assert admission.stats()['held'] == 6
+
+    for ticket in critical:
+        admission.release(ticket)
+    admission.unhold()
+    admission.release(admission.acquire(LISTING))
+
+
+def test_streams_share_the_budget_with_running_requests():
+    admission = controller(capacity=4, reserved=1)
+    tickets = [admission.acquire(STANDARD), admission.acquire(STANDARD)]
+
+    assert admission.hold()
+    assert not admission.hold()
+    admission.release(admission.acquire(CRITICAL))
+
+    for ticket in tickets:
+        admission.release(ticket)
+    assert admission.hold()
+
+
+def test_freed_slot_goes_to_the_critical_waiter_first():
+    admission = controller(capacity=2, reserved=0, listing_wait=5.0)
+    running = [admission.acquire(CRITICAL), admission.acquire(CRITICAL)]
+    order = []
+
+    def request(name):
+        ticket = admission.acquire(name)
+        order.append(name)
+        admission.release(ticket)
+
+    listing = threading.Thread(target=request, args=(LISTING,))
+    listing.start()
+    wait_until(lambda: admission.stats()['classes'][LISTING]['queued'] == 1)
+    critical = threading.Thread(target=request, args=(CRITICAL,))
+    critical.start()
+    wait_until(lambda: admission.stats()['classes'][CRITICAL]['queued'] == 1)
+
+    admission.release(running.pop())
+    critical.join(2)
+    admission.release(running.pop())
+    listing.join(2)
+
+    assert order == [CRITICAL, LISTING]
+
+
+def test_slow_queue_is_shed_without_waiting():
+    admission = controller(listing_wait=0.05)
+    first = admission.acquire(LISTING)
+    time.sleep(0.1)
+    admission.release(first)  # teaches the controller a listing request takes ~100ms
+
+    held = [admission.acquire(LISTING), admission.acquire(LISTING)]
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire(LISTING)
+    assert rejected.value.reason == 'latency'
+    assert time.monotonic() - started < 0.05
+
+    for ticket in held:
+        admission.release(ticket)
+
+
+def test_async_controller_admits_in_priority_order():
+    async def scenario():
+        admission = AsyncAdmissionController(controller(capacity=2, reserved=0).classes.values(), 2, 0)
+        running = [await admission.acquire(CRITICAL), await admission.acquire(CRITICAL)]
+        order = []
+
+        async def request(name):
+            ticket = await admission.acquire(name)
+            order.append(name)
+            admission.release(ticket)
+
+        waiting = [asyncio.ensure_future(request(STANDARD)), asyncio.ensure_future(request(CRITICAL))]
+        await asyncio.sleep(0.01)
+        for ticket in running:
+            admission.release(ticket)
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*waiting)
+        return order
+
+    assert asyncio.run(scenario()) == [CRITICAL, STANDARD]
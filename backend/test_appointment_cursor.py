@@ -0,0 +1,95 @@
+"""
+Appointment Keyset Cursor Tests
+Paging GET /api/appointments through (dateTime, _id) cursors, including
+legacy documents whose dateTime is missing or stored as a string, checked
+against a stand-in for MongoDB's cross-type sort order and comparisons
+
+    python -m pytest test_appointment_cursor.py
+"""
+
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('bson')
+
+from api_common import decode_appointment_cursor, encode_appointment_cursor, finish_appointment_page
+
+# MongoDB sorts null/missing before strings, and strings before dates
+TYPE_ORDER = {type(None): 0, str: 1, datetime: 2}
+
+
+def sort_key(document):
+    value = document.get('dateTime')
+    return TYPE_ORDER[type(value)], value if value is not None else 0, document['_id']
+
+
+def matches(document, query):
+    """The subset of query semantics the cursor filters use; $gt only compares within a type"""
+    if '$or' in query:
+        return any(matches(document, clause) for clause in query['$or'])
+    for field, condition in query.items():
+        value = document.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+        elif '$gt' in condition:
+            if type(value) is not type(condition['$gt']) or not value > condition['$gt']:
+                return False
+        elif '$ne' in condition:
+            if value == condition['$ne']:
+                return False
+        elif condition.get('$type') == 'date':
+            if not isinstance(value, datetime):
+                return False
+    return True
+
+
+def read_all(documents, limit):
+    """Page through the documents the way the listing route does"""
+    ordered = sorted(documents, key=sort_key)
+    seen, cursor = [], None
+    while True:
+        query = decode_appointment_cursor(cursor) if cursor else {}
+        rows = [document for document in ordered if matches(document, query)][:limit + 1]
+        page, cursor = finish_appointment_page(rows, limit)
+        seen.extend(document['_id'] for document in page)
+        if not cursor:
+            return seen
+
+
+DOCUMENTS = [
+    {'_id': 'a1', 'dateTime': datetime(2030, 1, 2, 9, 0)},
+    {'_id': 'a2', 'dateTime': datetime(2030, 1, 2, 9, 0)},
+    {'_id': 'a3', 'dateTime': datetime(2030, 1, 3, 14, 30)},
+    {'_id': 'b1', 'dateTime': '2030-01-01T08:00:00'},
+    {'_id': 'b2', 'dateTime': '2030-01-01T08:00:00'},
+    {'_id': 'b3', 'dateTime': '2030-01-05T10:00:00'},
+    {'_id': 'c1'},
+    {'_id': 'c2', 'dateTime': None},
+]
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 10])
+def test_pages_cover_every_document_once_in_order(limit):
+    assert read_all(DOCUMENTS, limit) == [document['_id'] for document in sorted(DOCUMENTS, key=sort_key)]
+
+
+def test_cursor_for_a_date_is_unchanged():
+    cursor = encode_appointment_cursor({'_id': 'a1', 'dateTime': datetime(2030, 1, 2, 9, 0)})
+
+    assert decode_appointment_cursor(cursor) == {'$or': [
+        {'dateTime': {'$gt': datetime(2030, 1, 2, 9, 0)}},
+        {'dateTime': datetime(2030, 1, 2, 9, 0), '_id': {'$gt': 'a1'}}
+    ]}
+
+
+@pytest.mark.parametrize('document', [{'_id': 'c1'}, {'_id': 'c2', 'dateTime': None},
+                                      {'_id': 'b1', 'dateTime': '2030-01-01T08:00:00'}])
+def test_legacy_documents_get_a_cursor(document):
+    cursor = encode_appointment_cursor(document)
+
+    after = [other['_id'] for other in DOCUMENTS if matches(other, decode_appointment_cursor(cursor))]
+
+    assert all(sort_key(other) > sort_key(document) for other in DOCUMENTS if other['_id'] in after)
+    assert {'a1', 'a2', 'a3'} <= set(after)
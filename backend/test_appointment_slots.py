@@ -0,0 +1,150 @@
+"""
+Appointment Slot Tests
+The double-booking guard without a database: which appointments hold
+slots, the slot IDs they claim, the overlap boundary, the range-scan query,
+the batch claim bookkeeping and the duration limit that bounds that scan.
+The booking routes end to end need a disposable MongoDB (see conftest.py)
+
+    python -m pytest test_appointment_slots.py
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('bson')
+
+from pymongo.errors import BulkWriteError
+
+from api_common import APPOINTMENT_MAX_DURATION, build_appointment_update, parse_duration
+from appointment_slots import (
+    claim_batch, failed_claims, find_conflicts, holds_slots, overlap_query, overlaps, slot_ids
+)
+
+NINE = datetime(2030, 3, 4, 9, 0)
+
+
+def appointment(id, start=NINE, duration=30, doctor='dr-1', status='pending'):
+    return {'id': id, 'doctorId': doctor, 'dateTime': start, 'duration': duration, 'status': status}
+
+
+def test_holds_slots():
+    assert holds_slots(appointment('a'))
+    assert not holds_slots(appointment('a', status='cancelled'))
+    assert not holds_slots(appointment('a', doctor=''))
+    assert not holds_slots({'id': 'a', 'doctorId': 'dr-1'})
+    assert not holds_slots(appointment('a', start='2030-03-04T09:00:00'))
+
+
+def test_slot_ids_cover_the_interval():
+    assert slot_ids(appointment('a', duration=15)) == {
+        'dr-1|2030-03-04T09:00:00', 'dr-1|2030-03-04T09:05:00', 'dr-1|2030-03-04T09:10:00'
+    }
+    assert slot_ids(appointment('a', status='cancelled')) == set()
+
+
+def test_slot_ids_round_out_to_the_grid():
+    ids = slot_ids(appointment('a', start=NINE + timedelta(minutes=3), duration=5))
+
+    assert ids == {'dr-1|2030-03-04T09:00:00', 'dr-1|2030-03-04T09:05:00'}
+
+
+def test_slot_ids_are_utc():
+    local = datetime(2030, 3, 4, 11, 0, tzinfo=timezone(timedelta(hours=2)))
+
+    assert slot_ids(appointment('a', start=local, duration=5)) == {'dr-1|2030-03-04T09:00:00'}
+
+
+def test_back_to_back_bookings_do_not_overlap():
+    first = appointment('a', duration=30)
+    second = appointment('b', start=NINE + timedelta(minutes=30))
+
+    assert not overlaps(first, second)
+    assert not overlaps(second, first)
+    assert not slot_ids(first) & slot_ids(second)
+    assert overlaps(first, appointment('c', start=NINE + timedelta(minutes=29)))
+    assert not overlaps(first, appointment('d', doctor='dr-2'))
+
+
+def test_find_conflicts_checks_the_batch_against_itself():
+    existing = [appointment('booked', duration=60)]
+    batch = [
+        appointment('clash', start=NINE + timedelta(minutes=45)),
+        appointment('free', start=NINE + timedelta(minutes=60)),
+        appointment('after-free', start=NINE + timedelta(minutes=75)),
+        appointment('cancelled', status='cancelled'),
+    ]
+
+    conflicts = find_conflicts(batch, existing)
+
+    assert set(conflicts) == {0, 2}
+    assert conflicts[0] == [{'id': 'booked', 'dateTime': '2030-03-04T09:00:00', 'duration': 60}]
+    assert [clash['id'] for clash in conflicts[2]] == ['free']
+
+
+def test_overlap_query_is_a_bounded_range_scan():
+    query = overlap_query([appointment('a'), appointment('b', start=NINE + timedelta(hours=2))], exclude_ids=['a'])
+
+    assert query['doctorId'] == {'$in': ['dr-1']}
+    assert query['dateTime'] == {
+        '$gt': NINE - timedelta(minutes=APPOINTMENT_MAX_DURATION),
+        '$lt': NINE + timedelta(hours=2, minutes=30)
+    }
+    assert query['id'] == {'$nin': ['a']}
+
+
+def test_claim_batch_skips_held_slots_and_tracks_owners():
+    first, second = appointment('a', duration=10), appointment('b', start=NINE + timedelta(minutes=10), duration=5)
+
+    documents, owners = claim_batch([first, second], held={'dr-1|2030-03-04T09:00:00'})
+
+    assert [document['_id'] for document in documents] == ['dr-1|2030-03-04T09:05:00', 'dr-1|2030-03-04T09:10:00']
+    assert owners == [0, 1]
+
+
+def test_failed_claims_hand_back_the_losers_other_slots():
+    documents, owners = claim_batch([appointment('a', duration=15), appointment('b', start=NINE + timedelta(hours=1))])
+    error = BulkWriteError({'writeErrors': [{'index': 1, 'code': 11000}]})
+
+    failed, inserted = failed_claims(error, documents, owners)
+
+    assert failed == {0}
+    assert inserted == ['dr-1|2030-03-04T09:00:00', 'dr-1|2030-03-04T09:10:00']
+
+
+def test_parse_duration_is_bounded():
+    assert parse_duration('45') == 45
+    assert parse_duration(1) == 1
+    assert parse_duration(APPOINTMENT_MAX_DURATION) == APPOINTMENT_MAX_DURATION
+
+    for value in (0, -30, APPOINTMENT_MAX_DURATION + 1, 'abc'):
+        with pytest.raises(ValueError):
+            parse_duration(value)
+
+
+def test_updates_reject_durations_past_the_limit():
+    assert build_appointment_update({'duration': '60'})['duration'] == 60
+
+    with pytest.raises(ValueError):
+        build_appointment_update({'duration': APPOINTMENT_MAX_DURATION + 1})
+
+
+# Routes
+
+def test_double_booking_is_refused(api, appointment):
+    client = api.app.test_client()
+    booking = dict(appointment, dateTime='2030-06-01T10:00:00', doctorId='dr_overlap')
+
+    first = client.post('/api/appointments', json=booking)
+    assert first.status_code == 201
+
+    overlapping = client.post('/api/appointments', json=dict(booking, dateTime='2030-06-01T10:15:00'))
+    assert overlapping.status_code == 409
+    assert overlapping.get_json()['conflicts'][0]['id'] == first.get_json()['id']
+
+    adjacent = client.post('/api/appointments', json=dict(booking, dateTime='2030-06-01T10:30:00'))
+    assert adjacent.status_code == 201
+
+    # Cancelling frees the time again
+    client.put(f"/api/appointments/{first.get_json()['id']}", json={'status': 'cancelled'})
+    assert client.post('/api/appointments', json=booking).status_code == 201
@@ -0,0 +1,52 @@
+"""
+Capacity Event Hub Tests
+Subscriber accounting for /api/capacity/stream: the per-process cap and a
+count that stays exact under concurrent connects and disconnects
+
+    python -m pytest test_capacity_events.py
+"""
+
+import threading
+
+import pytest
+
+pytest.importorskip('pymongo')
+
+from capacity_events import CapacityEventHub
+
+
+def test_subscribers_are_capped():
+    hub = CapacityEventHub(db=None, max_subscribers=2)
+
+    assert hub.subscribe()
+    assert hub.subscribe()
+    assert not hub.subscribe()
+
+    hub.unsubscribe()
+    assert hub.subscribe()
+    assert hub.stats()['subscribers'] == 2
+    assert hub.stats()['rejected_subscribers'] == 1
+
+
+def test_unbounded_without_a_cap():
+    hub = CapacityEventHub(db=None)
+
+    assert all(hub.subscribe() for _ in range(100))
+    assert hub.subscribers == 100
+
+
+def test_count_is_exact_across_threads():
+    hub = CapacityEventHub(db=None)
+
+    def churn():
+        for _ in range(2000):
+            hub.subscribe()
+            hub.unsubscribe()
+
+    threads = [threading.Thread(target=churn) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert hub.subscribers == 0
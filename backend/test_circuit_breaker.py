@@ -0,0 +1,100 @@
+"""
+Circuit Breaker Tests
+Opening on consecutive Atlas outage errors, failing fast while open and the
+half-open trial call, for the sync and async breakers
+
+    python -m pytest test_circuit_breaker.py
+"""
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip('pymongo')
+
+from pymongo.errors import DuplicateKeyError, ServerSelectionTimeoutError
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, AsyncCircuitBreaker, CircuitBreaker, CircuitOpenError
+
+
+def unreachable():
+    raise ServerSelectionTimeoutError('no servers')
+
+
+def fail(breaker, times):
+    for _ in range(times):
+        with pytest.raises(ServerSelectionTimeoutError):
+            breaker.call(unreachable)
+
+
+def test_opens_after_consecutive_failures_and_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+
+    called = []
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.call(lambda: called.append(1))
+    assert not called
+    assert 1 <= excinfo.value.retry_after <= 60
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    fail(breaker, 1)
+    assert breaker.call(lambda: 'ok') == 'ok'
+    fail(breaker, 1)
+
+    assert breaker.state == CLOSED
+
+
+def test_errors_atlas_answered_do_not_trip_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+
+    def duplicate():
+        raise DuplicateKeyError('duplicate')
+
+    with pytest.raises(DuplicateKeyError):
+        breaker.call(duplicate)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    fail(breaker, 1)
+    time.sleep(0.02)
+
+    with breaker.guard():
+        assert breaker.state == HALF_OPEN
+        # Everyone else keeps failing fast while the trial runs
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: None)
+    assert breaker.state == CLOSED
+
+
+def test_failed_trial_reopens_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    fail(breaker, 1)
+    time.sleep(0.02)
+    fail(breaker, 1)
+
+    assert breaker.state == OPEN
+    assert breaker.stats()['opened'] == 2
+
+
+def test_async_breaker_times_out_slow_calls():
+    breaker = AsyncCircuitBreaker(failure_threshold=1, reset_timeout=60, call_timeout=0.01)
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await breaker.call(lambda: asyncio.sleep(1))
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(lambda: asyncio.sleep(0))
+
+    asyncio.run(scenario())
+    assert breaker.state == OPEN
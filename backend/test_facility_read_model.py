@@ -0,0 +1,168 @@
+"""
+Facility Read Model Projector Tests
+Routable locations for facilities stored with and without GeoJSON, which
+facilities a facilities/departments change is attributed to (so only those
+are re-projected), and the lease that keeps one projector following changes
+across prefork workers and hosts
+
+    python -m pytest test_facility_read_model.py
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('bson')
+
+from pymongo.errors import DuplicateKeyError
+
+from facility_read_model import (
+    LEASE_COLLECTION, READ_MODEL_COLLECTION, FacilityReadModelProjector, Lease, project_facility
+)
+from facility_snapshot import emergency_spatial_index
+
+
+def matches(document, query):
+    for field, condition in query.items():
+        if field == '$or':
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            if '$lt' in condition and not (field in document and document[field] < condition['$lt']):
+                return False
+        elif isinstance(document.get(field), list):
+            if condition not in document[field]:
+                return False
+        elif document.get(field) != condition:
+            return False
+    return True
+
+
+class FakeCollection:
+    def __init__(self, documents=()):
+        self.documents = {document['_id']: dict(document) for document in documents}
+
+    def find(self, query, projection=None):
+        return [dict(document) for document in self.documents.values() if matches(document, query)]
+
+    def find_one_and_update(self, query, update, upsert=False):
+        for document in self.documents.values():
+            if matches(document, query):
+                document.update(update['$set'])
+                return document
+        if upsert:
+            if query['_id'] in self.documents:
+                raise DuplicateKeyError('E11000 duplicate key error')
+            self.documents[query['_id']] = {'_id': query['_id'], **update['$set']}
+        return None
+
+    def delete_one(self, query):
+        for key, document in list(self.documents.items()):
+            if matches(document, query):
+                del self.documents[key]
+                return
+
+
+class FakeDB:
+    def __init__(self, **collections):
+        self.collections = collections
+
+    def get_collection(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+
+def change(collection, document_id, full_document=None):
+    event = {'ns': {'coll': collection}, 'documentKey': {'_id': document_id}}
+    if full_document is not None:
+        event['fullDocument'] = full_document
+    return event
+
+
+@pytest.fixture
+def projector():
+    read_model = FakeCollection([
+        {'_id': 'fac-1', 'departmentIds': ['dept-a', 'dept-b']},
+        {'_id': 'fac-2', 'departmentIds': ['dept-c']},
+    ])
+    return FacilityReadModelProjector(FakeDB(**{READ_MODEL_COLLECTION: read_model}))
+
+
+def test_facility_loaded_without_geojson_is_routable():
+    # As stored before the uploader derived a location field: latitude/longitude only
+    facility = {'_id': 7, 'Name': 'Helen Joseph Hospital', 'City': 'Johannesburg', 'has_emergency': True,
+                'latitude': -26.1836, 'longitude': 27.9989}
+    emergency = [{'_id': 70, 'Name': 'Emergency Department', 'Facility_ID': 7}]
+
+    read_model = project_facility(facility, emergency)
+
+    assert read_model['location'] == {'type': 'Point', 'coordinates': [27.9989, -26.1836]}
+    assert [key for key, _ in emergency_spatial_index({7: read_model}).within(-26.19, 28.0, 5)] == [7]
+
+
+def test_facility_without_coordinates_is_not_routable():
+    read_model = project_facility({'_id': 8, 'Name': 'Clinic', 'City': 'Durban', 'latitude': None}, [])
+
+    assert 'location' not in read_model
+
+
+def test_facility_changes_touch_that_facility(projector):
+    assert projector._affected_facilities(change('facilities', 'fac-9')) == {'fac-9'}
+
+
+def test_department_changes_touch_its_facility(projector):
+    updated = change('departments', 'dept-a', {'_id': 'dept-a', 'Facility_ID': 'fac-1'})
+    added = change('departments', 'dept-new', {'_id': 'dept-new', 'Facility_ID': 'fac-2'})
+
+    assert projector._affected_facilities(updated) == {'fac-1'}
+    assert projector._affected_facilities(added) == {'fac-2'}
+
+
+def test_moved_department_touches_old_and_new_facility(projector):
+    moved = change('departments', 'dept-b', {'_id': 'dept-b', 'Facility_ID': 'fac-2'})
+
+    assert projector._affected_facilities(moved) == {'fac-1', 'fac-2'}
+
+
+def test_deleted_department_touches_the_facility_that_listed_it(projector):
+    assert projector._affected_facilities(change('departments', 'dept-c')) == {'fac-2'}
+    assert projector._affected_facilities(change('departments', 'dept-unknown')) == set()
+
+
+def test_only_one_process_holds_the_lease():
+    db = FakeDB()
+    first, second = Lease(db, READ_MODEL_COLLECTION, 30), Lease(db, READ_MODEL_COLLECTION, 30)
+
+    assert first.acquire()
+    assert not second.acquire()
+    assert first.acquire()  # renewal
+    assert db.get_collection(LEASE_COLLECTION).documents[READ_MODEL_COLLECTION]['owner'] == first.owner
+
+
+def test_expired_lease_is_taken_over():
+    db = FakeDB()
+    first, second = Lease(db, READ_MODEL_COLLECTION, 30), Lease(db, READ_MODEL_COLLECTION, 30)
+    first.acquire()
+
+    db.get_collection(LEASE_COLLECTION).documents[READ_MODEL_COLLECTION]['expiresAt'] = \
+        datetime.utcnow() - timedelta(seconds=1)
+
+    assert second.acquire()
+    assert not first.acquire()
+
+    first.release()  # not the holder: leaves the lease alone
+    assert db.get_collection(LEASE_COLLECTION).documents[READ_MODEL_COLLECTION]['owner'] == second.owner
+    second.release()
+    assert first.acquire()
+
+
+def test_projector_stands_by_without_the_lease():
+    db = FakeDB()
+    leader = FacilityReadModelProjector(db, lease_seconds=30)
+    follower = FacilityReadModelProjector(db, lease_seconds=30)
+
+    assert leader._holds_lease()
+    assert not follower._holds_lease()
+    assert leader.stats()['leader'] and not follower.stats()['leader']
+
+    leader.stop()
+    assert follower._holds_lease()
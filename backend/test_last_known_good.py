@@ -0,0 +1,152 @@
+"""
+Last-Known-Good Fallback Tests
+Stale serving, background refresh and the in-process emergency routing
+fallback used while Atlas is unavailable
+
+    python -m pytest test_last_known_good.py
+"""
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip('bson')
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+from api_common import emergency_fallback_matches, format_emergency_hospital
+from facility_snapshot import emergency_spatial_index
+from circuit_breaker import AsyncCircuitBreaker, CircuitBreaker, CircuitOpenError
+from last_known_good import AsyncLastKnownGoodCache, LastKnownGoodCache
+
+
+def unreachable():
+    raise ServerSelectionTimeoutError('no servers')
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not reached'
+        time.sleep(0.005)
+
+
+def test_serves_the_last_real_answer_marked_with_its_age():
+    cache = LastKnownGoodCache(CircuitBreaker(failure_threshold=5))
+    assert cache.fetch('capacity', lambda: {'1': 'real'}) == ({'1': 'real'}, None)
+
+    payload, age = cache.fetch('capacity', unreachable)
+    assert payload == {'1': 'real'}
+    assert age is not None and age >= 0
+    assert cache.stats()['stale_served'] == 1
+
+
+def test_nothing_remembered_raises_instead_of_inventing_data():
+    cache = LastKnownGoodCache(CircuitBreaker(failure_threshold=5))
+
+    with pytest.raises(ServerSelectionTimeoutError):
+        cache.fetch('capacity', unreachable)
+    assert cache.stats()['unavailable'] == 1
+
+
+def test_open_circuit_with_nothing_remembered_raises_circuit_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    cache = LastKnownGoodCache(breaker)
+    with pytest.raises(ServerSelectionTimeoutError):
+        breaker.call(unreachable)
+
+    calls = []
+    with pytest.raises(CircuitOpenError) as raised:
+        cache.fetch('capacity', lambda: calls.append(1))
+
+    assert raised.value.retry_after >= 1  # becomes the 503's Retry-After
+    assert not calls
+    assert cache.stats()['unavailable'] == 1
+
+
+def test_open_circuit_serves_stale_without_calling_atlas():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    cache = LastKnownGoodCache(breaker)
+    cache.fetch('capacity', lambda: 'real')
+    with pytest.raises(ServerSelectionTimeoutError):
+        breaker.call(unreachable)
+
+    calls = []
+    payload, age = cache.fetch('capacity', lambda: calls.append(1))
+    assert payload == 'real' and age is not None
+    wait_until(lambda: cache.stats()['refreshing'] == 0)
+    assert not calls
+
+
+def test_background_refresh_replaces_the_stale_answer():
+    cache = LastKnownGoodCache(CircuitBreaker(failure_threshold=5))
+    cache.fetch('capacity', lambda: 'old')
+
+    answers = iter([unreachable, lambda: 'new'])
+    payload, _ = cache.fetch('capacity', lambda: next(answers)())
+    assert payload == 'old'
+
+    wait_until(lambda: cache.stats()['refreshes'] == 1)
+    assert cache.recall('capacity')[0] == 'new'
+
+
+def test_entries_past_max_age_are_not_served():
+    cache = LastKnownGoodCache(CircuitBreaker(), max_age=0.01)
+    cache.remember('capacity', 'old')
+    time.sleep(0.02)
+
+    assert cache.recall('capacity') is None
+
+
+def test_async_cache_falls_back_and_refreshes():
+    cache = AsyncLastKnownGoodCache(AsyncCircuitBreaker(failure_threshold=5))
+
+    async def answer(value):
+        return value
+
+    async def down():
+        raise ServerSelectionTimeoutError('no servers')
+
+    async def scenario():
+        await cache.fetch('appointments', lambda: answer('old'))
+        reads = iter([down, lambda: answer('new')])
+        payload, age = await cache.fetch('appointments', lambda: next(reads)())
+        assert payload == 'old' and age is not None
+        await asyncio.gather(*cache._tasks)
+
+    asyncio.run(scenario())
+    assert cache.recall('appointments')[0] == 'new'
+
+
+def read_model(facility_id, lng, lat, emergency_department_id=None, accepts=True):
+    return {
+        '_id': facility_id, 'name': f'Hospital {facility_id}', 'address': '', 'phone': '',
+        'coordinates': {'lat': lat, 'lng': lng}, 'specialties': ['emergency'],
+        'emergencyLevel': 'Level 2 Trauma', 'isLevel1Trauma': False, 'acceptsEmergencies': accepts,
+        'emergencyDepartmentId': emergency_department_id, 'emergencyDepartmentBeds': 20,
+        'pediatric': False, 'hasAmbulance': True, 'departmentIds': [emergency_department_id],
+        'location': {'type': 'Point', 'coordinates': [lng, lat]}
+    }
+
+
+def test_emergency_fallback_routes_on_last_known_capacity():
+    read_models = {model['_id']: model for model in (
+        read_model(1, 28.05, -26.20, 'ed1'),
+        read_model(2, 28.01, -26.19, 'ed2'),
+        read_model(3, 28.02, -26.19, 'ed3', accepts=False),
+        read_model(4, 31.00, -29.80, 'ed4'),  # Durban, out of range
+    )}
+    known = {'ed1': ({'Current_patients': 4, 'Current_beds_available': 9, 'Current_doctors_on_duty': 2}, 12.0)}
+
+    matches, oldest = emergency_fallback_matches(
+        read_models, emergency_spatial_index(read_models), -26.19, 28.01, 50, False, known.get
+    )
+
+    assert [match['_id'] for match in matches] == [2, 1]
+    assert oldest == 12.0
+
+    nearest, farther = (format_emergency_hospital(match, False) for match in matches)
+    assert nearest['currentCapacity']['emergency']['status'] == 'UNKNOWN'
+    assert nearest['currentCapacity']['emergency']['available'] is None
+    assert farther['currentCapacity']['emergency']['available'] == 9
@@ -0,0 +1,121 @@
+"""
+Schema Migration Tests
+Versions recorded in schema_migrations, re-runs that skip applied
+migrations, and the schema version the readiness probe reports
+
+    python -m pytest test_migrations.py
+"""
+
+import pytest
+
+pytest.importorskip('pymongo')
+
+import migrations
+from migrations import LATEST_VERSION, MIGRATIONS, Migration, apply_migrations, schema_version
+
+
+class FakeCollection:
+    def __init__(self):
+        self.documents = {}
+        self.indexes = []
+        self.updates = []
+
+    def find(self, query):
+        return list(self.documents.values())
+
+    def replace_one(self, query, document, upsert=False):
+        self.documents[query['_id']] = document
+
+    def create_index(self, keys, **options):
+        self.indexes.append((tuple(keys), options))
+
+    def update_many(self, query, update):
+        self.updates.append((query, update))
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def __getattr__(self, name):
+        return self.get_collection(name)
+
+    def get_collection(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+
+class FakeMedRouteDB:
+    """CloudMedRouteDB stand-in: migration records and indexes on one database"""
+
+    def __init__(self):
+        self.db = FakeDatabase()
+
+    def get_collection(self, name):
+        return self.db.get_collection(name)
+
+
+def test_versions_are_consecutive():
+    assert [migration.version for migration in MIGRATIONS] == list(range(1, LATEST_VERSION + 1))
+
+
+def test_apply_records_every_migration():
+    db = FakeMedRouteDB()
+
+    ran = apply_migrations(db)
+
+    assert ran == MIGRATIONS
+    assert schema_version(db) == LATEST_VERSION
+    assert db.db.facilities.indexes
+    assert db.db.facility_read_model.indexes
+
+
+def test_second_run_applies_nothing():
+    db = FakeMedRouteDB()
+    apply_migrations(db)
+    index_count = len(db.db.appointments.indexes)
+
+    assert apply_migrations(db) == []
+    assert len(db.db.appointments.indexes) == index_count
+
+
+def test_force_reapplies_everything():
+    db = FakeMedRouteDB()
+    apply_migrations(db)
+
+    assert apply_migrations(db, force=True) == MIGRATIONS
+    assert schema_version(db) == LATEST_VERSION
+
+
+def test_only_new_migrations_run(monkeypatch):
+    db = FakeMedRouteDB()
+    apply_migrations(db)
+
+    applied = []
+    extra = Migration(LATEST_VERSION + 1, 'extra', lambda database: applied.append(database))
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS + [extra])
+
+    assert apply_migrations(db) == [extra]
+    assert applied == [db.db]
+    assert schema_version(db) == LATEST_VERSION + 1
+
+
+def test_schema_version_stops_at_the_first_gap():
+    db = FakeMedRouteDB()
+    records = db.get_collection(migrations.MIGRATIONS_COLLECTION)
+    for version in (1, 3):
+        records.replace_one({'_id': version}, {'_id': version}, upsert=True)
+
+    assert schema_version(db) == 1
+
+
+def test_facilities_without_geojson_get_a_location():
+    db = FakeMedRouteDB()
+    apply_migrations(db)
+
+    [(query, pipeline)] = db.db.facilities.updates
+    assert query['location'] == {'$exists': False}
+    assert pipeline == [{'$set': {'location': {'type': 'Point', 'coordinates': ['$longitude', '$latitude']}}}]
+
+
+def test_empty_database_is_at_version_zero():
+    assert schema_version(FakeMedRouteDB()) == 0
@@ -0,0 +1,172 @@
+"""
+Database Round-Trip Budget Tests
+Pins the number of MongoDB commands each API route and scheduler call issues,
+so a query added inside a loop fails here instead of in production
+
+The route tests need a disposable MongoDB (they seed medroute_production on it):
+    MEDROUTE_TEST_MONGO_URI=mongodb://localhost:27017 python -m pytest test_query_budget.py
+Without it only the detector's own unit tests run.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('pymongo')
+
+from query_budget import QUERY_BUDGET_LISTENER, QueryBudgetExceeded, command_shape, query_budget
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def command_started(command_name, command):
+    QUERY_BUDGET_LISTENER.started(SimpleNamespace(command_name=command_name, command=command))
+
+
+# Detector
+
+def test_shape_ignores_literal_values():
+    first = command_shape('find', {'find': 'doctors', 'filter': {'_id': 1}})
+    second = command_shape('find', {'find': 'doctors', 'filter': {'_id': 2}})
+    other = command_shape('find', {'find': 'doctors', 'filter': {'Name': 'x'}})
+
+    assert first == second
+    assert first != other
+
+
+def test_shape_treats_in_lists_of_any_length_alike():
+    short = command_shape('find', {'find': 'doctors', 'filter': {'_id': {'$in': [1]}}})
+    long = command_shape('find', {'find': 'doctors', 'filter': {'_id': {'$in': [1, 2, 3]}}})
+
+    assert short == long
+
+
+def test_repeated_shape_is_flagged_as_n_plus_one(monkeypatch):
+    monkeypatch.setenv('QUERY_BUDGET_MODE', 'raise')
+
+    with pytest.raises(QueryBudgetExceeded, match='possible N\\+1: 3x find doctors'):
+        with query_budget('loop', max_repeats=2):
+            for doctor_id in range(3):
+                command_started('find', {'find': 'doctors', 'filter': {'_id': doctor_id}})
+
+
+def test_round_trip_budget(monkeypatch):
+    monkeypatch.setenv('QUERY_BUDGET_MODE', 'raise')
+
+    with query_budget('within', max_round_trips=2) as budget:
+        command_started('find', {'find': 'a', 'filter': {}})
+        command_started('find', {'find': 'b', 'filter': {}})
+    assert budget.round_trips == 2
+
+    with pytest.raises(QueryBudgetExceeded, match='3 round trips'):
+        with query_budget('over', max_round_trips=2):
+            for name in ('a', 'b', 'c'):
+                command_started('find', {'find': name, 'filter': {}})
+
+
+def test_get_more_counts_but_is_not_a_repeat(monkeypatch):
+    monkeypatch.setenv('QUERY_BUDGET_MODE', 'raise')
+
+    with query_budget('cursor', max_repeats=1) as budget:
+        command_started('find', {'find': 'appointments', 'filter': {}})
+        for _ in range(3):
+            command_started('getMore', {'getMore': 1, 'collection': 'appointments'})
+
+    assert budget.round_trips == 4
+
+
+def test_log_mode_does_not_raise(monkeypatch, capsys):
+    monkeypatch.setenv('QUERY_BUDGET_MODE', 'log')
+
+    with query_budget('logged', max_round_trips=0):
+        command_started('find', {'find': 'a', 'filter': {}})
+
+    assert 'Query budget exceeded in logged' in capsys.readouterr().out
+
+
+def test_handshake_commands_are_ignored():
+    with query_budget('handshake') as budget:
+        command_started('hello', {'hello': 1})
+        command_started('saslStart', {'saslStart': 1})
+
+    assert budget.round_trips == 0
+
+
+# Routes
+
+@pytest.mark.parametrize('method, path, kwargs, expected', [
+    ('GET', '/api/appointments?limit=5', {}, 1),
+    ('GET', '/api/facilities', {}, 0),
+    ('GET', '/api/capacity?facility_ids=1,2,3', {}, 1),
+    ('GET', '/api/capacity', {}, 1),
+    ('GET', '/api/facilities/1/capacity', {}, 1),
+    ('POST', '/api/emergency-hospitals', {'json': {'latitude': -26.19, 'longitude': 28.01}}, 1),
+    ('POST', '/api/triage/assess', {'json': {'symptoms': 'headache', 'severity': 'mild', 'age': 30, 'gender': 'female'}}, 0),
+    ('GET', '/api/departments', {}, 0),
+    ('GET', '/api/doctors', {}, 0),
+    ('GET', '/api/health', {}, 1),
+    ('GET', '/api/stats', {}, 3),
+    ('GET', '/api/cache/stats', {}, 0),
+])
+def test_route_round_trips(round_trips, method, path, kwargs, expected):
+    assert round_trips(method, path, **kwargs) == expected
+
+
+def test_appointment_write_round_trips(api, round_trips, appointment):
+    # Overlap check, slot claim, write, then one $inc on the maintained counters
+    assert round_trips('POST', '/api/appointments', json=appointment) == 4
+
+    appointment_id = api.db.get_collection('appointments').find_one({'patientName': 'Budget Patient'})['id']
+    # Current booking, write, counters (the slots do not move)
+    assert round_trips('PUT', f'/api/appointments/{appointment_id}', json={'status': 'confirmed'}) == 3
+    # Write, counters, slot release
+    assert round_trips('DELETE', f'/api/appointments/{appointment_id}') == 3
+
+
+def test_bulk_appointment_round_trips_do_not_grow_with_batch_size(api, round_trips, appointment):
+    start = datetime(2031, 1, 1, 8, 0)
+    batch = [
+        dict(appointment, patientName=f'Bulk Patient {i}', dateTime=(start + timedelta(minutes=30 * i)).isoformat())
+        for i in range(150)
+    ]
+    # Overlap check, slot claims, insert and counters; insert_many only splits
+    # past the server's message size, far above a clinic day
+    assert round_trips('POST', '/api/appointments/bulk', json=batch) == 4
+
+    ids = [doc['id'] for doc in api.db.get_collection('appointments').find({'patientName': {'$regex': '^Bulk '}})]
+    updates = [{'id': appointment_id, 'status': 'confirmed'} for appointment_id in ids]
+    # Status read, bulk write, counters
+    assert round_trips('PATCH', '/api/appointments/bulk', json=updates) == 3
+
+
+# Scheduler
+
+@pytest.fixture(scope='module')
+def scheduler(api):
+    sys.path.insert(0, REPO_ROOT)
+    wait = pytest.importorskip('wait')
+
+    # Only the database side of the scheduler is under test; skip loading the ML models
+    scheduler = wait.MedRouteScheduler.__new__(wait.MedRouteScheduler)
+    scheduler.db = api.db
+    return scheduler
+
+
+def test_available_doctors_is_independent_of_doctor_count(scheduler):
+    with query_budget('available doctors') as budget:
+        doctors = scheduler._get_available_doctors(100, None, None)
+
+    assert len(doctors) == 3
+    # Assignments, doctors, specializations and workloads: one query each
+    assert budget.round_trips == 4
+
+
+def test_capacity_report_round_trips(scheduler):
+    with query_budget('capacity report') as budget:
+        report = scheduler.get_department_capacity_report()
+
+    assert len(report) == 9
+    assert budget.round_trips == 2
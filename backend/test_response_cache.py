@@ -0,0 +1,126 @@
+"""
+Appointment Response Cache Tests
+Key normalization, LRU/TTL bounds and selective invalidation of the
+GET /api/appointments page cache, plus ETag revalidation of
+GET /api/facilities; the route tests need a disposable MongoDB (see conftest.py)
+
+    python -m pytest test_response_cache.py
+"""
+
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('bson')
+
+from response_cache import AppointmentResponseCache, AppointmentScope, appointment_cache_key
+
+
+def cache_page(cache, args, body=b'[]'):
+    key, scope = appointment_cache_key(args)
+    cache.put(key, scope, body, None, cache.generation)
+    return key
+
+
+def test_equivalent_queries_share_a_key():
+    first, _ = appointment_cache_key({'department': 'general', 'date_from': '2030-01-01T00:00:00Z', 'limit': '20'})
+    second, _ = appointment_cache_key({'limit': '20', 'date_from': '2030-01-01T02:00:00+02:00',
+                                       'department': 'general', 'doctor': 'all', '_': '1700000000'})
+    other, _ = appointment_cache_key({'department': 'cardiology', 'date_from': '2030-01-01T00:00:00Z', 'limit': '20'})
+
+    assert first == second
+    assert first != other
+
+
+def test_scope_matches_only_appointments_the_page_could_hold():
+    scope = AppointmentScope(department='general', date_from=datetime(2030, 1, 1), date_to=datetime(2030, 1, 31))
+
+    assert scope.matches({'department': 'general', 'doctorId': 'dr_smith', 'dateTime': datetime(2030, 1, 10)})
+    assert not scope.matches({'department': 'cardiology', 'dateTime': datetime(2030, 1, 10)})
+    assert not scope.matches({'department': 'general', 'dateTime': datetime(2030, 2, 10)})
+
+
+def test_least_recently_used_page_is_evicted_past_max_bytes():
+    cache = AppointmentResponseCache(max_bytes=10, ttl=60)
+    first = cache_page(cache, {'department': 'a'}, b'12345')
+    second = cache_page(cache, {'department': 'b'}, b'12345')
+    cache.get(first)
+    cache_page(cache, {'department': 'c'}, b'12345')
+
+    assert cache.get(first) is not None
+    assert cache.get(second) is None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_pages_expire_after_the_ttl():
+    cache = AppointmentResponseCache(ttl=0.01)
+    key = cache_page(cache, {'department': 'a'})
+    time.sleep(0.02)
+
+    assert cache.get(key) is None
+    assert cache.stats()['expired'] == 1
+
+
+def test_writes_invalidate_selectively():
+    cache = AppointmentResponseCache(ttl=60)
+    general = cache_page(cache, {'department': 'general'})
+    smith = cache_page(cache, {'doctor': 'dr_smith'})
+    everything = cache_page(cache, {})
+
+    cache.invalidate([{'department': 'cardiology', 'doctorId': 'dr_jones', 'dateTime': datetime(2030, 1, 1)}])
+
+    assert cache.get(general) is not None
+    assert cache.get(smith) is not None
+    assert cache.get(everything) is None
+
+
+def test_page_read_across_a_write_is_not_stored():
+    cache = AppointmentResponseCache(ttl=60)
+    key, scope = appointment_cache_key({'department': 'general'})
+    generation = cache.generation
+
+    cache.invalidate([{'department': 'general'}])
+    cache.put(key, scope, b'[]', None, generation)
+
+    assert cache.get(key) is None
+
+
+# Routes
+
+def test_repeated_appointment_query_is_served_from_cache(api, round_trips, appointment):
+    path = '/api/appointments?department=general&date_from=2032-01-01T00:00:00&limit=20'
+    api.appointment_cache.clear()
+
+    assert round_trips('GET', path) == 1
+    # Same query, parameters reordered and an ignored cache buster
+    assert round_trips('GET', '/api/appointments?limit=20&date_from=2032-01-01T00:00:00&department=general&_=1') == 0
+
+    # A booking in another department leaves the page cached...
+    api.app.test_client().post('/api/appointments', json=dict(
+        appointment, department='cardiology', doctorId='dr_cache', dateTime='2032-02-01T09:00:00'))
+    assert round_trips('GET', path) == 0
+
+    # ...one it could appear on does not
+    api.app.test_client().post('/api/appointments', json=dict(
+        appointment, doctorId='dr_cache', dateTime='2032-02-01T10:00:00'))
+    assert round_trips('GET', path) == 1
+
+
+@pytest.mark.parametrize('validator', ['{}', 'W/{}', '"facilities-other", {}'])
+def test_facilities_revalidate_against_strong_and_weak_etags(api, validator):
+    client = api.app.test_client()
+    etag = client.get('/api/facilities').headers['ETag']
+
+    # Proxies and CDNs that compress the body hand the ETag back weakened
+    response = client.get('/api/facilities', headers={'If-None-Match': validator.format(etag)})
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_facilities_with_a_stale_etag_are_sent_in_full(api):
+    response = api.app.test_client().get('/api/facilities', headers={'If-None-Match': 'W/"facilities-stale"'})
+
+    assert response.status_code == 200
+    assert response.get_json()
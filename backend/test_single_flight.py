@@ -0,0 +1,189 @@
+"""
+Single-Flight Tests
+Concurrent identical calls share one computation and its result or error;
+sequential calls and different keys never do
+
+    python -m pytest test_single_flight.py
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from single_flight import AsyncSingleFlight, SingleFlight
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not reached'
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_computation():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(2)
+        return {'total': 42}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('stats', compute))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    # Every follower has joined the leader's flight before it lands
+    wait_until(lambda: flights.stats()['coalesced'] == 7)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert [result for result, _ in results] == [{'total': 42}] * 8
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_the_leaders_error_reaches_every_waiter():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        started.set()
+        release.wait(2)
+        raise RuntimeError('atlas down')
+
+    errors = []
+
+    def call():
+        try:
+            flights.do('stats', compute)
+        except RuntimeError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(2)
+    follower = threading.Thread(target=call)
+    follower.start()
+    wait_until(lambda: flights.stats()['coalesced'] == 1)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(errors) == 2
+
+
+def test_finished_flights_are_not_reused():
+    flights = SingleFlight()
+    values = iter([1, 2])
+
+    assert flights.do('stats', lambda: next(values)) == (1, False)
+    assert flights.do('stats', lambda: next(values)) == (2, False)
+    assert flights.do('other', lambda: 3) == (3, False)
+
+
+def test_async_callers_share_one_awaitable():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'capacity'
+
+    async def scenario():
+        return await asyncio.gather(*(flights.do(('capacity', None), compute) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ['capacity'] * 5
+
+
+def test_async_errors_propagate():
+    flights = AsyncSingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise RuntimeError('atlas down')
+
+    async def scenario():
+        return await asyncio.gather(*(flights.do('stats', compute) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_cancelling_the_leader_does_not_cancel_the_followers():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return 'appointments'
+
+    async def scenario():
+        leader = asyncio.ensure_future(flights.do('appointments', compute))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flights.do('appointments', compute)) for _ in range(3)]
+        await asyncio.sleep(0)
+
+        leader.cancel()  # the leader's client disconnected
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return results
+
+    results = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert results == [('appointments', True)] * 3
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_flight_finishes_when_every_caller_leaves():
+    flights = AsyncSingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        return 'stats'
+
+    async def scenario():
+        caller = asyncio.ensure_future(flights.do('stats', compute))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.sleep(0.03)
+        return await flights.do('stats', compute)
+
+    assert asyncio.run(scenario()) == ('stats', False)
+    assert flights.stats()['executions'] == 2
+
+
+@pytest.mark.parametrize('workers', [2, 16])
+def test_stats_count_executions_and_coalesced(workers):
+    flights = SingleFlight()
+    barrier = threading.Barrier(workers)
+    release = threading.Event()
+
+    def call():
+        barrier.wait()
+        flights.do('stats', lambda: release.wait(2))
+
+    threads = [threading.Thread(target=call) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: flights.stats()['executions'] + flights.stats()['coalesced'] == workers)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    stats = flights.stats()
+    assert stats['executions'] == 1
+    assert stats['coalesced'] == workers - 1
@@ -0,0 +1,114 @@
+"""
+Spatial Index Tests
+Radius and k-nearest queries checked against a brute-force haversine scan,
+including searches across the antimeridian and over a pole, on both the
+NumPy and the math code paths
+
+    python -m pytest test_spatial_index.py
+"""
+
+import math
+import random
+
+import pytest
+
+import spatial_index
+from spatial_index import SpatialIndex, haversine_km
+
+
+@pytest.fixture(params=['math', 'numpy'])
+def backend(request, monkeypatch):
+    if request.param == 'math':
+        monkeypatch.setattr(spatial_index, 'np', None)
+    elif spatial_index.np is None:
+        pytest.skip('numpy not installed')
+    return request.param
+
+
+def random_points(count, seed=3):
+    rng = random.Random(seed)
+    return [(f'f{i}', rng.uniform(-89.9, 89.9), rng.uniform(-180, 180)) for i in range(count)]
+
+
+def gauteng_points(count, seed=5):
+    rng = random.Random(seed)
+    return [(i, rng.uniform(-26.9, -25.4), rng.uniform(27.4, 28.9)) for i in range(count)]
+
+
+def brute_force(points, lat, lng):
+    measured = [(spatial_index.great_circle_km(lat, lng, p_lat, p_lng), position)
+                for position, (_, p_lat, p_lng) in enumerate(points)]
+    return [(points[position][0], distance) for distance, position in sorted(measured)]
+
+
+def assert_same(found, expected):
+    assert [key for key, _ in found] == [key for key, _ in expected]
+    assert all(math.isclose(a, b, abs_tol=1e-6) for (_, a), (_, b) in zip(found, expected))
+
+
+def test_haversine_known_distance(backend):
+    # Johannesburg to Cape Town is about 1260 km
+    assert float(haversine_km(-26.2041, 28.0473, -33.9249, 18.4241)) == pytest.approx(1261, abs=5)
+    assert float(haversine_km(10, 20, 10, 20)) == 0
+
+
+def test_within_matches_brute_force(backend):
+    points = gauteng_points(500)
+    index = SpatialIndex(points, cell_degrees=0.1)
+
+    for lat, lng, radius in [(-26.19, 28.01, 5), (-26.19, 28.01, 50), (-25.5, 28.8, 20), (-30.0, 25.0, 10)]:
+        expected = [(key, d) for key, d in brute_force(points, lat, lng) if d <= radius]
+        assert_same(index.within(lat, lng, radius), expected)
+
+
+def test_nearest_matches_brute_force(backend):
+    points = random_points(2000)
+    index = SpatialIndex(points)
+    rng = random.Random(11)
+
+    for _ in range(25):
+        lat, lng = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        assert_same(index.nearest(lat, lng, 7), brute_force(points, lat, lng)[:7])
+
+
+def test_nearest_respects_max_distance(backend):
+    points = gauteng_points(200)
+    index = SpatialIndex(points)
+
+    found = index.nearest(-26.19, 28.01, 50, max_distance_km=10)
+
+    assert found and all(distance <= 10 for _, distance in found)
+    assert_same(found, [(key, d) for key, d in brute_force(points, -26.19, 28.01) if d <= 10][:50])
+
+
+def test_search_wraps_the_antimeridian(backend):
+    points = [('east', 0.0, 179.9), ('west', 0.0, -179.9), ('far', 0.0, 170.0)]
+    index = SpatialIndex(points)
+
+    assert [key for key, _ in index.within(0.0, 179.95, 30)] == ['east', 'west']
+
+
+def test_search_over_a_pole(backend):
+    points = [('a', 89.5, 0.0), ('b', 89.5, 180.0), ('c', 80.0, 90.0)]
+    index = SpatialIndex(points)
+
+    assert sorted(key for key, _ in index.within(89.9, 90.0, 200)) == ['a', 'b']
+
+
+def test_nearest_on_small_and_empty_indexes(backend):
+    assert SpatialIndex([]).nearest(0, 0, 3) == []
+    assert [key for key, _ in SpatialIndex([('only', 10.0, 10.0)]).nearest(-40, -170, 3)] == ['only']
+
+
+def test_nearest_batch_matches_single_queries(backend):
+    points = gauteng_points(300)
+    index = SpatialIndex(points)
+    locations = gauteng_points(600, seed=9)
+    lats = [lat for _, lat, _ in locations]
+    lngs = [lng for _, _, lng in locations]
+
+    ranked = index.nearest_batch(lats, lngs, 4)
+
+    assert len(ranked) == len(locations)
+    for found, lat, lng in zip(ranked, lats, lngs):
+        assert_same(found, index.nearest(lat, lng, 4))
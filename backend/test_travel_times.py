@@ -0,0 +1,144 @@
+"""
+Travel-Time Matrix Tests
+Builds a matrix from a small synthetic road network and checks the drive
+times read back through the memory-mapped files: road speeds, one-way
+streets, hour-of-day bands, cells off the grid and rebuilds picked up by
+a running server
+
+    python -m pytest test_travel_times.py
+"""
+
+import json
+import math
+from datetime import datetime
+
+import pytest
+
+import travel_times
+from travel_times import RoadNetwork, TravelTimeMatrix, TravelTimes, build_matrix, parse_maxspeed
+
+LAT = -26.20
+
+# UTC times whose local (UTC+2) hour falls in the night and evening peak bands
+NIGHT = datetime(2030, 1, 1, 1, 0)
+EVENING_PEAK = datetime(2030, 1, 1, 15, 30)
+
+
+def road(points, **properties):
+    return {'type': 'Feature', 'properties': properties,
+            'geometry': {'type': 'LineString', 'coordinates': [[lng, lat] for lat, lng in points]}}
+
+
+def write_roads(path, features):
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}))
+    return str(path)
+
+
+@pytest.fixture
+def matrix_dir(tmp_path):
+    # A residential street from 27.95 to 28.15 east, vertices every ~1 km
+    street = [(LAT, 27.95 + i * 0.01) for i in range(21)]
+    roads = write_roads(tmp_path / 'roads.geojson', [road(street, highway='residential')])
+    facilities = [(1, LAT, 28.00), (2, LAT, 28.10)]
+
+    out = tmp_path / 'travel_times'
+    build_matrix(RoadNetwork.from_geojson(roads), facilities, str(out), cell_km=1, margin_km=10)
+    return str(out)
+
+
+def test_parse_maxspeed():
+    assert parse_maxspeed('60') == 60
+    assert parse_maxspeed('80 km/h') == 80
+    assert parse_maxspeed('40 mph') == pytest.approx(64.36)
+    assert parse_maxspeed('ZA:urban') is None
+    assert parse_maxspeed(None) is None
+
+
+def test_drive_times_follow_the_road(matrix_dir):
+    matrix = TravelTimeMatrix(matrix_dir)
+    cell = matrix.cell(LAT, 28.001)
+    band = matrix.band(NIGHT)
+
+    near = matrix.seconds(cell, 1, band)
+    far = matrix.seconds(cell, 2, band)
+
+    assert near < far
+    # ~10 km of residential street at its free-flow 40 km/h
+    assert far - near == pytest.approx(10.0 / 40 * 3600, rel=0.1)
+
+
+def test_peak_band_is_slower(matrix_dir):
+    etas = TravelTimes(matrix_dir)
+
+    night = etas.eta_minutes(LAT, 28.001, [2], NIGHT)[2]
+    peak = etas.eta_minutes(LAT, 28.001, [2], EVENING_PEAK)[2]
+
+    assert peak > night
+    assert peak == pytest.approx(night / travel_times.CONGESTION['local'][3], abs=2)
+
+
+def test_no_answer_off_the_grid_or_for_unknown_facilities(matrix_dir):
+    etas = TravelTimes(matrix_dir)
+
+    assert etas.eta_minutes(-33.92, 18.42, [1, 2], NIGHT) == {}
+    assert set(etas.eta_minutes(LAT, 28.001, [1, 2, 99], NIGHT)) == {1, 2}
+    assert etas.stats()['misses'] == 3
+
+
+def test_missing_matrix_is_unavailable(tmp_path):
+    etas = TravelTimes(str(tmp_path / 'absent'))
+
+    assert not etas.available
+    assert etas.eta_minutes(LAT, 28.0, [1]) == {}
+
+
+def test_one_way_streets_are_driven_one_way(tmp_path):
+    network = RoadNetwork()
+    network.add_road([[28.00, LAT], [28.01, LAT]], {'highway': 'residential', 'oneway': 'yes'})
+    west, east = network.node(28.00, LAT), network.node(28.01, LAT)
+
+    assert math.isinf(network.seconds_to(west, 0, 0)[east])
+    assert network.seconds_to(east, 0, 0)[west] > 0
+
+
+def test_footways_are_not_roads():
+    network = RoadNetwork()
+    network.add_road([[28.00, LAT], [28.01, LAT]], {'highway': 'footway'})
+
+    assert network.edges == 0
+
+
+def test_rebuild_is_picked_up(matrix_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(travel_times, 'RELOAD_CHECK_SECONDS', 0)
+    etas = TravelTimes(matrix_dir)
+    assert set(etas.eta_minutes(LAT, 28.001, [1, 2], NIGHT)) == {1, 2}
+
+    roads = write_roads(tmp_path / 'motorway.geojson',
+                        [road([(LAT, 27.95 + i * 0.01) for i in range(21)], highway='motorway', oneway='no')])
+    build_matrix(RoadNetwork.from_geojson(roads), [(3, LAT, 28.05)], matrix_dir, cell_km=1, margin_km=10)
+
+    assert set(etas.eta_minutes(LAT, 28.001, [1, 2, 3], NIGHT)) == {3}
+    assert etas.stats()['loads'] == 2
+
+
+def test_ranking_prefers_the_quicker_drive():
+    pytest.importorskip('bson')
+    from api_common import format_emergency_hospital, rank_emergency_hospitals
+
+    def match(facility_id, distance_km):
+        return {
+            '_id': facility_id, 'name': f'Hospital {facility_id}', 'address': '', 'phone': '',
+            'coordinates': {'lat': LAT, 'lng': 28.0}, 'specialties': ['emergency'],
+            'emergencyLevel': 'Level 2 Trauma', 'isLevel1Trauma': False, 'emergencyDepartmentId': None,
+            'emergencyDepartmentBeds': 20, 'pediatric': False, 'hasAmbulance': True,
+            'distance_m': distance_km * 1000
+        }
+
+    ranked = rank_emergency_hospitals([
+        format_emergency_hospital(match(1, 8), False, eta_minutes=35),
+        format_emergency_hospital(match(2, 12), False, eta_minutes=18),
+        format_emergency_hospital(match(3, 20), False),  # not in the matrix: 2.5 min/km estimate
+    ], False)
+
+    assert [hospital['id'] for hospital in ranked] == ['2', '1', '3']
+    assert ranked[2]['estimatedArrival'] == 50
@@ -0,0 +1,149 @@
+"""
+Triage Rules Engine Tests
+The compiled rule table against the hand-written rules it replaced in
+submit_triage_assessment: the same urgency, priority, wait and department
+for representative symptoms, overlapping phrases, case and punctuation,
+and the pediatric and elderly age thresholds
+
+    python -m pytest test_triage_rules.py
+"""
+
+import pytest
+
+from triage_rules import PhraseAutomaton, TriageRulesEngine
+
+
+def legacy_assess(symptoms, severity, age):
+    """The triage logic as it stood in medroute_api_server.py before the rule table"""
+    symptoms = symptoms.lower()
+
+    urgency = 'Low'
+    priority_score = 3
+    department = {'id': 'general', 'name': 'General Medicine', 'color': 'blue'}
+    estimated_wait = '45-60 minutes'
+
+    critical_symptoms = [
+        'chest pain', 'difficulty breathing', 'severe bleeding', 'unconscious',
+        'stroke', 'heart attack', 'severe head injury', 'severe burns'
+    ]
+    high_symptoms = [
+        'broken bone', 'severe pain', 'high fever', 'allergic reaction',
+        'vomiting blood', 'severe nausea'
+    ]
+
+    if severity == 'critical' or any(symptom in symptoms for symptom in critical_symptoms):
+        urgency = 'Critical'
+        priority_score = 9
+        department = {'id': 'emergency', 'name': 'Emergency', 'color': 'red'}
+        estimated_wait = 'Immediate'
+    elif severity == 'severe' or any(symptom in symptoms for symptom in high_symptoms) or age > 65:
+        urgency = 'High'
+        priority_score = 7
+        estimated_wait = '15-30 minutes'
+    elif severity == 'moderate':
+        urgency = 'Medium'
+        priority_score = 5
+        estimated_wait = '30-45 minutes'
+
+    if 'heart' in symptoms or 'chest' in symptoms:
+        department = {'id': 'cardiology', 'name': 'Cardiology', 'color': 'purple'}
+    elif 'bone' in symptoms or 'joint' in symptoms or 'fracture' in symptoms:
+        department = {'id': 'orthopedics', 'name': 'Orthopedics', 'color': 'orange'}
+    elif age < 18:
+        department = {'id': 'pediatrics', 'name': 'Pediatrics', 'color': 'green'}
+
+    return urgency, priority_score, estimated_wait, department
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return TriageRulesEngine.from_file()
+
+
+CASES = [
+    # Representative symptoms across the severities
+    ('mild headache', 'mild', 30),
+    ('sore throat and cough', 'moderate', 40),
+    ('severe pain in my lower back', 'mild', 30),
+    ('high fever since yesterday', 'moderate', 25),
+    ('allergic reaction to peanuts', 'severe', 22),
+    ('difficulty breathing after exercise', 'mild', 50),
+    ('feeling dizzy', 'critical', 45),
+    ('feeling dizzy', 'severe', 45),
+    ('feeling dizzy', None, 45),
+    ('', 'unknown-severity', 40),
+
+    # Urgency and department phrases in the same text
+    ('chest pain radiating to the arm', 'moderate', 55),
+    ('heart attack symptoms', 'mild', 60),
+    ('broken bone in my wrist', 'moderate', 35),
+    ('stroke, and a painful joint', 'mild', 70),
+    ('twisted knee joint', 'mild', 30),
+    ('possible fracture of the ankle', 'severe', 19),
+
+    # Overlapping phrases: 'chest pain'/'chest', 'heart attack'/'heart', 'broken bone'/'bone'
+    ('chest', 'mild', 40),
+    ('heartburn', 'mild', 40),
+    ('heart racing and chest tightness', 'mild', 40),
+    ('broken bones and swollen joints', 'mild', 40),
+    ('heart and bone pain', 'moderate', 40),
+    ('severe head injury with severe bleeding', 'mild', 40),
+    ('severe burnsevere pain', 'mild', 40),
+
+    # Case and punctuation
+    ('CHEST PAIN', 'mild', 40),
+    ('Chest-pain', 'mild', 40),
+    ('chest  pain', 'mild', 40),
+    ('Vomiting Blood!!', 'moderate', 40),
+    ('unconscious.', 'mild', 40),
+    ('Heart, chest; BONE', 'mild', 40),
+    ('high-fever', 'moderate', 40),
+
+    # Pediatric threshold (< 18) and its interplay with emergencies and departments
+    ('rash', 'mild', 17),
+    ('rash', 'mild', 18),
+    ('rash', 'mild', 0),
+    ('unconscious', 'mild', 5),
+    ('chest pain', 'critical', 10),
+    ('sprained joint', 'moderate', 12),
+
+    # Elderly threshold (> 65)
+    ('rash', 'mild', 65),
+    ('rash', 'mild', 66),
+    ('rash', 'moderate', 80),
+    ('heart palpitations', 'mild', 90),
+    ('stroke', 'mild', 90),
+]
+
+
+@pytest.mark.parametrize('symptoms,severity,age', CASES)
+def test_matches_the_hand_written_rules(engine, symptoms, severity, age):
+    urgency, priority_score, estimated_wait, department = legacy_assess(symptoms, severity, age)
+
+    decision = engine.assess(symptoms, severity, age)
+
+    assert decision.urgency == urgency
+    assert decision.priority_score == priority_score
+    assert decision.estimated_wait == estimated_wait
+    assert decision.department == department
+
+
+def test_overlapping_phrases_are_all_reported():
+    automaton = PhraseAutomaton(['chest pain', 'chest', 'pain', 'st p'])
+
+    found = {automaton.phrases[index] for index in automaton.find('sharp chest pain')}
+
+    assert found == {'chest pain', 'chest', 'pain', 'st p'}
+
+
+def test_unknown_rule_targets_are_rejected():
+    table = {
+        'urgency_levels': {'Low': {'rank': 0, 'priority_score': 3, 'estimated_wait': 'soon'}},
+        'default_urgency': 'Low',
+        'departments': {'general': {'name': 'General Medicine', 'color': 'blue'}},
+        'default_department': 'general',
+        'rules': [{'phrase': 'cough', 'urgency': 'Urgent'}]
+    }
+
+    with pytest.raises(ValueError):
+        TriageRulesEngine(table)
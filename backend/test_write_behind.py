@@ -0,0 +1,202 @@
+"""
+Write-behind Buffer Tests
+Flushing, overflow to the spill file, and replay of spilled documents once
+the database is back, against an in-memory stand-in for a collection that
+enforces unique _ids the way MongoDB does
+
+    python -m pytest test_write_behind.py
+"""
+
+import os
+
+import pytest
+
+pytest.importorskip('bson')
+
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+
+from write_behind import DUPLICATE_KEY, WriteBehindBuffer
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+
+class FakeCollection:
+    """insert_many(ordered=False) with unique _ids; raises while down"""
+
+    def __init__(self):
+        self.documents = {}
+        self.down = False
+        self.calls = 0
+
+    def insert_many(self, documents, ordered=True):
+        self.calls += 1
+        if self.down:
+            raise ServerSelectionTimeoutError('no servers')
+
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            if document['_id'] in self.documents:
+                errors.append({'index': index, 'code': DUPLICATE_KEY, 'errmsg': 'E11000 duplicate key error'})
+                continue
+            self.documents[document['_id']] = dict(document)
+            inserted.append(document['_id'])
+
+        if errors:
+            raise BulkWriteError({'writeErrors': errors, 'nInserted': len(inserted)})
+        return InsertManyResult(inserted)
+
+
+class FakeDB:
+    def __init__(self):
+        self.collection = FakeCollection()
+
+    def get_collection(self, name):
+        return self.collection
+
+
+def spilled_lines(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return sum(1 for line in f if line.strip())
+
+
+@pytest.fixture
+def db():
+    return FakeDB()
+
+
+@pytest.fixture
+def spill_path(tmp_path):
+    return str(tmp_path / 'triage_assessments.spill.jsonl')
+
+
+def test_flush_writes_queued_documents_in_batches(db):
+    buffer = WriteBehindBuffer(db, 'triage_assessments', max_batch_size=3)
+
+    for n in range(7):
+        assert buffer.put({'n': n})
+    buffer.flush()
+
+    assert sorted(doc['n'] for doc in db.collection.documents.values()) == list(range(7))
+    assert db.collection.calls == 3
+    stats = buffer.stats()
+    assert stats['enqueued'] == stats['written'] == 7
+    assert stats['queue_depth'] == 0
+
+
+def test_full_queue_spills_to_file(db, spill_path):
+    buffer = WriteBehindBuffer(db, 'triage_assessments', max_queue_size=1,
+                               enqueue_timeout=0, spill_path=spill_path)
+
+    assert buffer.put({'n': 1})
+    assert not buffer.put({'n': 2})
+
+    assert spilled_lines(spill_path) == 1
+    assert buffer.stats()['spilled'] == 1
+    assert buffer.stats()['backpressure_waits'] == 1
+
+
+def test_put_nowait_never_waits_or_spills(db, spill_path):
+    buffer = WriteBehindBuffer(db, 'triage_assessments', max_queue_size=1,
+                               enqueue_timeout=5, spill_path=spill_path)
+
+    first, second = {'n': 1}, {'n': 2}
+    assert buffer.put_nowait(first)
+    assert not buffer.put_nowait(second)
+
+    assert '_id' in second  # kept when the caller falls back to put()
+    assert spilled_lines(spill_path) == 0
+    assert buffer.stats()['enqueued'] == 1
+
+
+def test_full_queue_without_spill_file_drops(db):
+    buffer = WriteBehindBuffer(db, 'triage_assessments', max_queue_size=1, enqueue_timeout=0)
+
+    buffer.put({'n': 1})
+    assert not buffer.put({'n': 2})
+
+    assert buffer.stats()['dropped'] == 1
+
+
+def test_failed_flush_is_replayed_after_the_next_success(db, spill_path):
+    buffer = WriteBehindBuffer(db, 'triage_assessments', spill_path=spill_path)
+
+    db.collection.down = True
+    for n in range(5):
+        buffer.put({'n': n})
+    buffer.flush()
+
+    assert db.collection.documents == {}
+    assert spilled_lines(spill_path) == 5
+    assert buffer.stats()['flush_errors'] == 1
+
+    db.collection.down = False
+    buffer.put({'n': 5})
+    buffer.flush()
+
+    assert sorted(doc['n'] for doc in db.collection.documents.values()) == list(range(6))
+    assert buffer.stats()['replayed'] == 5
+    assert not os.path.exists(spill_path)
+    assert not os.path.exists(spill_path + '.replaying')
+
+
+def test_replay_skips_documents_that_already_landed(db, spill_path):
+    buffer = WriteBehindBuffer(db, 'triage_assessments', spill_path=spill_path)
+    documents = [{'n': n} for n in range(4)]
+    for document in documents:
+        buffer.put(document)
+
+    # The insert reached the server but the reply was lost, so the batch was spilled too
+    for document in documents[:2]:
+        db.collection.documents[document['_id']] = dict(document)
+    db.collection.down = True
+    buffer.flush()
+    db.collection.down = False
+
+    buffer.put({'n': 4})
+    buffer.flush()
+
+    assert len(db.collection.documents) == 5
+    assert sorted(doc['n'] for doc in db.collection.documents.values()) == list(range(5))
+    assert buffer.stats()['replayed'] == 4
+    assert not os.path.exists(spill_path)
+
+
+def test_duplicates_in_a_live_batch_count_as_written(db):
+    buffer = WriteBehindBuffer(db, 'triage_assessments')
+    document = {'n': 1}
+    buffer.put(document)
+    db.collection.documents[document['_id']] = dict(document)
+
+    buffer.flush()
+
+    assert buffer.stats()['written'] == 1
+    assert buffer.stats()['flush_errors'] == 0
+    assert buffer.stats()['dropped'] == 0
+
+
+def test_interrupted_replay_is_finished_first(db, spill_path):
+    buffer = WriteBehindBuffer(db, 'triage_assessments', spill_path=spill_path)
+
+    db.collection.down = True
+    buffer.put({'n': 0})
+    buffer.flush()
+    os.replace(spill_path, spill_path + '.replaying')
+    buffer.put({'n': 1})
+    buffer.flush()
+    db.collection.down = False
+
+    buffer.put({'n': 2})
+    buffer.flush()
+
+    assert sorted(doc['n'] for doc in db.collection.documents.values()) == [0, 2]
+    assert spilled_lines(spill_path) == 1
+
+    buffer.put({'n': 3})
+    buffer.flush()
+
+    assert sorted(doc['n'] for doc in db.collection.documents.values()) == [0, 1, 2, 3]
@@ -0,0 +1,504 @@
+"""
+Precomputed Travel-Time Matrix for Emergency ETAs
+Drive times from a grid of origin cells to every facility, one matrix per
+hour-of-day band, built offline from a local road-network file and
+memory-mapped by the API servers, so a request's ETA for a facility is one
+array read instead of the `distance * 2.5` guess
+
+    python travel_times.py --roads gauteng_roads.geojson [--facilities ../gauteng_hospitals_data.json]
+                           [--out travel_times] [--cell-km 2] [--margin-km 50]
+
+The road network is GeoJSON (an OSM extract converted with osmtogeojson or
+ogr2ogr, say): LineString and MultiLineString features with the OSM
+highway, maxspeed, oneway and junction tags as properties. A road drives at
+its maxspeed, else at the default speed of its highway class, scaled in each
+band by the congestion factor of its class; measured band speeds can be
+given per feature as speed_kmh_<band> properties instead. Building makes no
+network calls.
+
+Each origin cell and facility is joined to its nearest road (within
+MAX_SNAP_KM) at ACCESS_SPEED_KMH, and one reverse Dijkstra per facility and
+band fills that facility's column. The output directory holds
+manifest.json and one eta_<band>.bin per band: uint16 seconds, row-major
+[cell][facility] in the builder's byte order, 65535 where the facility
+cannot be reached. Rebuilding swaps the whole directory, and running
+servers pick the new matrix up within RELOAD_CHECK_SECONDS.
+
+Configuration (environment):
+    TRAVEL_TIME_MATRIX_DIR  matrix directory the servers read (default travel_times beside this file);
+                            without one, ETAs fall back to the straight-line estimate
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from spatial_index import SpatialIndex, great_circle_km
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+DEFAULT_MATRIX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'travel_times')
+
+# Hour-of-day bands (local time, start inclusive, end exclusive)
+BANDS = (
+    ('night', 0, 6),
+    ('morning_peak', 6, 9),
+    ('daytime', 9, 15),
+    ('evening_peak', 15, 19),
+    ('evening', 19, 24),
+)
+BAND_NAMES = tuple(name for name, _, _ in BANDS)
+
+# South Africa Standard Time; hours are banded in local time
+DEFAULT_UTC_OFFSET_MINUTES = 120
+
+# Free-flow speed (km/h) by OSM highway class, for roads without a usable maxspeed
+DEFAULT_SPEEDS_KMH = {
+    'motorway': 120, 'motorway_link': 60,
+    'trunk': 100, 'trunk_link': 50,
+    'primary': 80, 'primary_link': 40,
+    'secondary': 60, 'secondary_link': 40,
+    'tertiary': 60, 'tertiary_link': 30,
+    'unclassified': 40, 'residential': 40,
+    'service': 20, 'living_street': 10
+}
+FALLBACK_SPEED_KMH = 40
+
+NOT_DRIVABLE = {'footway', 'path', 'cycleway', 'pedestrian', 'steps', 'bridleway', 'corridor',
+                'construction', 'proposed', 'platform', 'elevator', 'raceway', 'bus_guideway'}
+
+# Share of free-flow speed reached in each band of BANDS, by road class
+CONGESTION = {
+    'highway': (1.0, 0.55, 0.85, 0.5, 0.9),
+    'arterial': (1.0, 0.6, 0.8, 0.55, 0.9),
+    'local': (1.0, 0.75, 0.85, 0.7, 0.95)
+}
+ROAD_CLASSES = {
+    'motorway': 'highway', 'motorway_link': 'highway', 'trunk': 'highway', 'trunk_link': 'highway',
+    'primary': 'arterial', 'primary_link': 'arterial', 'secondary': 'arterial', 'secondary_link': 'arterial'
+}
+
+# Off-network leg between an origin (or facility) and its nearest road
+ACCESS_SPEED_KMH = 20.0
+MAX_SNAP_KM = 5.0
+
+DEFAULT_CELL_KM = 2.0
+DEFAULT_MARGIN_KM = 50.0
+KM_PER_DEGREE = 111.2
+
+UNREACHABLE = 0xFFFF
+MAX_SECONDS = UNREACHABLE - 1
+
+RELOAD_CHECK_SECONDS = 60.0
+
+
+def parse_maxspeed(value) -> Optional[float]:
+    """km/h from an OSM maxspeed tag ('60', '60 km/h', '40 mph'); None for 'ZA:urban', 'none' and the like"""
+    match = re.match(r'\s*(\d+(?:\.\d+)?)\s*(mph)?', str(value or ''))
+    if not match:
+        return None
+    speed = float(match.group(1))
+    return speed * 1.609 if match.group(2) else speed or None
+
+
+class RoadNetwork:
+    """
+    Directed road graph stored by incoming edge, so one Dijkstra from a
+    facility gives every node's drive time to it. Each edge carries its
+    travel time in seconds for every band.
+    """
+
+    def __init__(self):
+        self.lats: List[float] = []
+        self.lngs: List[float] = []
+        self.incoming: List[List[Tuple[int, Tuple[float, ...]]]] = []
+        self.edges = 0
+        self._node_ids: Dict[Tuple[float, float], int] = {}
+        self._parents: List[int] = []
+
+    @classmethod
+    def from_geojson(cls, path: str) -> 'RoadNetwork':
+        with open(path, 'r', encoding='utf-8') as f:
+            collection = json.load(f)
+        network = cls()
+        for feature in collection.get('features', []):
+            geometry = feature.get('geometry') or {}
+            properties = feature.get('properties') or {}
+            if geometry.get('type') == 'LineString':
+                network.add_road(geometry['coordinates'], properties)
+            elif geometry.get('type') == 'MultiLineString':
+                for line in geometry['coordinates']:
+                    network.add_road(line, properties)
+        return network
+
+    def node(self, lng: float, lat: float) -> int:
+        # Ways share a junction when they share a vertex (to ~10 cm)
+        key = (round(lat, 6), round(lng, 6))
+        node = self._node_ids.get(key)
+        if node is None:
+            node = self._node_ids[key] = len(self.lats)
+            self.lats.append(float(lat))
+            self.lngs.append(float(lng))
+            self.incoming.append([])
+            self._parents.append(node)
+        return node
+
+    def add_road(self, coordinates: Sequence[Sequence[float]], properties: Dict):
+        highway = properties.get('highway')
+        if highway in NOT_DRIVABLE:
+            return
+
+        speed = parse_maxspeed(properties.get('maxspeed')) or DEFAULT_SPEEDS_KMH.get(highway, FALLBACK_SPEED_KMH)
+        factors = CONGESTION[ROAD_CLASSES.get(highway, 'local')]
+        band_speeds = [
+            float(properties.get(f'speed_kmh_{name}') or speed * factor)
+            for name, factor in zip(BAND_NAMES, factors)
+        ]
+
+        # Motorways and roundabouts are one-way unless tagged otherwise
+        oneway = str(properties.get('oneway', '')).lower()
+        if oneway in ('-1', 'reverse'):
+            forward, backward = False, True
+        elif oneway in ('yes', 'true', '1') or (
+                oneway != 'no' and (highway == 'motorway' or properties.get('junction') == 'roundabout')):
+            forward, backward = True, False
+        else:
+            forward, backward = True, True
+
+        nodes = [self.node(point[0], point[1]) for point in coordinates]
+        for start, end in zip(nodes, nodes[1:]):
+            if start == end:
+                continue
+            km = great_circle_km(self.lats[start], self.lngs[start], self.lats[end], self.lngs[end])
+            seconds = tuple(km / band_speed * 3600 for band_speed in band_speeds)
+            if forward:
+                self.incoming[end].append((start, seconds))
+                self.edges += 1
+            if backward:
+                self.incoming[start].append((end, seconds))
+                self.edges += 1
+            self._union(start, end)
+
+    def largest_component(self) -> List[int]:
+        """Nodes of the largest weakly connected component, the only ones worth snapping to"""
+        members: Dict[int, List[int]] = {}
+        for node in range(len(self.lats)):
+            members.setdefault(self._find(node), []).append(node)
+        return max(members.values(), key=len) if members else []
+
+    def seconds_to(self, target: int, start_seconds: float, band: int) -> List[float]:
+        """Drive time in band from every node to target (math.inf where it cannot be reached)"""
+        times = [math.inf] * len(self.lats)
+        times[target] = start_seconds
+        heap = [(start_seconds, target)]
+        incoming = self.incoming
+        while heap:
+            elapsed, node = heapq.heappop(heap)
+            if elapsed > times[node]:
+                continue
+            for source, seconds in incoming[node]:
+                arrival = elapsed + seconds[band]
+                if arrival < times[source]:
+                    times[source] = arrival
+                    heapq.heappush(heap, (arrival, source))
+        return times
+
+    def _find(self, node: int) -> int:
+        parents = self._parents
+        while parents[node] != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+
+    def _union(self, a: int, b: int):
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a != root_b:
+            self._parents[root_b] = root_a
+
+
+def load_facilities(path: str) -> List[Tuple[Hashable, float, float]]:
+    """(facility _id, lat, lng) from a seed file like gauteng_hospitals_data.json, or a plain list"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    facilities = data['facilities'] if isinstance(data, dict) else data
+    return [
+        (facility['_id'], float(facility['latitude']), float(facility['longitude']))
+        for facility in facilities
+        if facility.get('latitude') is not None and facility.get('longitude') is not None
+    ]
+
+
+def build_matrix(network: RoadNetwork, facilities: Sequence[Tuple[Hashable, float, float]], out_dir: str,
+                 cell_km: float = DEFAULT_CELL_KM, margin_km: float = DEFAULT_MARGIN_KM,
+                 utc_offset_minutes: int = DEFAULT_UTC_OFFSET_MINUTES, source: Optional[Dict] = None) -> Dict:
+    """Write the matrix for facilities into out_dir (replacing it); returns the manifest"""
+    if not facilities:
+        raise ValueError('no facilities with coordinates')
+
+    # Origin grid: the facilities' bounding box widened by margin_km on every side
+    cell_degrees = cell_km / KM_PER_DEGREE
+    lats = [lat for _, lat, _ in facilities]
+    lngs = [lng for _, _, lng in facilities]
+    lat_margin = margin_km / KM_PER_DEGREE
+    lng_margin = lat_margin / max(0.01, math.cos(math.radians((min(lats) + max(lats)) / 2)))
+    south, west = min(lats) - lat_margin, min(lngs) - lng_margin
+    rows = int(math.ceil((max(lats) + lat_margin - south) / cell_degrees))
+    columns = int(math.ceil((max(lngs) + lng_margin - west) / cell_degrees))
+
+    roads = SpatialIndex(
+        ((node, network.lats[node], network.lngs[node]) for node in network.largest_component()),
+        cell_degrees=0.05
+    )
+
+    def snap(lat, lng):
+        nearest = roads.nearest(lat, lng, 1, MAX_SNAP_KM)
+        if not nearest:
+            return None
+        node, km = nearest[0]
+        return node, km / ACCESS_SPEED_KMH * 3600
+
+    origins = [
+        (cell, snap(south + (row + 0.5) * cell_degrees, west + (column + 0.5) * cell_degrees))
+        for cell, (row, column) in enumerate((row, column) for row in range(rows) for column in range(columns))
+    ]
+    origins = [(cell, snapped) for cell, snapped in origins if snapped is not None]
+    destinations = [snap(lat, lng) for _, lat, lng in facilities]
+    print(f"Grid {rows}x{columns} cells of {cell_km:g} km, {len(origins)} within {MAX_SNAP_KM:g} km of a road; "
+          f"{sum(d is not None for d in destinations)}/{len(facilities)} facilities on the network")
+
+    building = out_dir.rstrip(os.sep) + '.building'
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+
+    width = len(facilities)
+    bands = []
+    for band, (name, start_hour, end_hour) in enumerate(BANDS):
+        started = time.time()
+        matrix = array('H', [UNREACHABLE]) * (rows * columns * width)
+        for column, destination in enumerate(destinations):
+            if destination is None:
+                continue
+            node, access_seconds = destination
+            times = network.seconds_to(node, access_seconds, band)
+            for cell, (origin_node, origin_seconds) in origins:
+                seconds = times[origin_node] + origin_seconds
+                if seconds != math.inf:
+                    matrix[cell * width + column] = min(MAX_SECONDS, int(math.ceil(seconds)))
+
+        filename = f'eta_{name}.bin'
+        with open(os.path.join(building, filename), 'wb') as f:
+            matrix.tofile(f)
+        bands.append({'name': name, 'start_hour': start_hour, 'end_hour': end_hour, 'file': filename})
+        print(f"Band {name}: {time.time() - started:.1f}s")
+
+    manifest = {
+        'format': FORMAT_VERSION,
+        'built_at': datetime.utcnow().isoformat(),
+        'source': source or {},
+        'grid': {'south': south, 'west': west, 'cell_degrees': cell_degrees, 'rows': rows, 'columns': columns},
+        'facility_ids': [facility_id for facility_id, _, _ in facilities],
+        'bands': bands,
+        'utc_offset_minutes': utc_offset_minutes,
+        'unit': 'seconds',
+        'unreachable': UNREACHABLE,
+        'byteorder': sys.byteorder,
+        'network': {'nodes': len(network.lats), 'edges': network.edges}
+    }
+    with open(os.path.join(building, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap the finished directory in; servers keep reading the old files they have mapped
+    previous = out_dir.rstrip(os.sep) + '.previous'
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, previous)
+    os.replace(building, out_dir)
+    shutil.rmtree(previous, ignore_errors=True)
+    return manifest
+
+
+class TravelTimeMatrix:
+    """Read-only view of one built matrix directory, its band files memory-mapped"""
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, MANIFEST), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != FORMAT_VERSION:
+            raise ValueError(f"unsupported travel-time matrix format {manifest.get('format')}")
+        if manifest['byteorder'] != sys.byteorder:
+            raise ValueError(f"matrix built {manifest['byteorder']}-endian, this host is {sys.byteorder}-endian")
+
+        grid = manifest['grid']
+        self.south = grid['south']
+        self.west = grid['west']
+        self.cell_degrees = grid['cell_degrees']
+        self.rows = grid['rows']
+        self.columns = grid['columns']
+        self.built_at = manifest['built_at']
+        self.utc_offset = timedelta(minutes=manifest.get('utc_offset_minutes', DEFAULT_UTC_OFFSET_MINUTES))
+        self.facility_columns = {facility_id: column for column, facility_id in enumerate(manifest['facility_ids'])}
+        self.width = len(manifest['facility_ids'])
+
+        self.band_names = []
+        self._band_by_hour = [None] * 24
+        self._views = []
+        for band in manifest['bands']:
+            with open(os.path.join(directory, band['file']), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mapped).cast('H')
+            if len(view) != self.rows * self.columns * self.width:
+                raise ValueError(f"{band['file']} does not match the grid in {MANIFEST}")
+            for hour in range(band['start_hour'], band['end_hour']):
+                self._band_by_hour[hour] = len(self._views)
+            self.band_names.append(band['name'])
+            self._views.append(view)
+
+    def band(self, when: datetime) -> Optional[int]:
+        """Band index for a UTC time"""
+        return self._band_by_hour[(when + self.utc_offset).hour]
+
+    def cell(self, lat: float, lng: float) -> Optional[int]:
+        row = int(math.floor((float(lat) - self.south) / self.cell_degrees))
+        column = int(math.floor((float(lng) - self.west) / self.cell_degrees))
+        if 0 <= row < self.rows and 0 <= column < self.columns:
+            return row * self.columns + column
+        return None
+
+    def seconds(self, cell: int, facility_id, band: int) -> Optional[int]:
+        """Drive seconds from cell to the facility, or None when the matrix has no answer"""
+        column = self.facility_columns.get(facility_id)
+        if column is None:
+            return None
+        value = self._views[band][cell * self.width + column]
+        return None if value == UNREACHABLE else value
+
+
+class TravelTimes:
+    """
+    The servers' handle on the matrix directory: opened on first use,
+    re-opened when a rebuild replaces it (checked at most every
+    RELOAD_CHECK_SECONDS), and empty when there is no matrix, in which case
+    callers keep the straight-line estimate.
+    """
+
+    def __init__(self, directory: str = DEFAULT_MATRIX_DIR):
+        self.directory = directory
+        self._matrix: Optional[TravelTimeMatrix] = None
+        self._manifest_signature = None
+        self._checked_at = -math.inf
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.lookups = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_errors = 0
+        self.last_error = None
+
+    @property
+    def matrix(self) -> Optional[TravelTimeMatrix]:
+        if time.monotonic() - self._checked_at >= RELOAD_CHECK_SECONDS:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= RELOAD_CHECK_SECONDS:
+                    self._reload_if_changed()
+                    self._checked_at = time.monotonic()
+        return self._matrix
+
+    @property
+    def available(self) -> bool:
+        return self.matrix is not None
+
+    def eta_minutes(self, lat: float, lng: float, facility_ids: Iterable,
+                    when: Optional[datetime] = None) -> Dict:
+        """{facility_id: minutes} for the facilities the matrix can answer for, at when (UTC, default now)"""
+        matrix = self.matrix
+        if matrix is None:
+            return {}
+        facility_ids = list(facility_ids)
+        cell = matrix.cell(lat, lng)
+        band = matrix.band(when or datetime.utcnow())
+
+        etas = {}
+        for facility_id in facility_ids:
+            seconds = matrix.seconds(cell, facility_id, band) if cell is not None and band is not None else None
+            if seconds is not None:
+                etas[facility_id] = max(1, int(math.ceil(seconds / 60)))
+        self.lookups += len(facility_ids)
+        self.misses += len(facility_ids) - len(etas)
+        return etas
+
+    def stats(self) -> Dict:
+        matrix = self._matrix
+        return {
+            'loaded': matrix is not None,
+            'directory': self.directory,
+            'built_at': matrix.built_at if matrix else None,
+            'bands': matrix.band_names if matrix else [],
+            'cells': matrix.rows * matrix.columns if matrix else 0,
+            'facilities': matrix.width if matrix else 0,
+            'lookups': self.lookups,
+            'misses': self.misses,
+            'loads': self.loads,
+            'load_errors': self.load_errors,
+            'last_error': self.last_error
+        }
+
+    def _reload_if_changed(self):
+        try:
+            stat = os.stat(os.path.join(self.directory, MANIFEST))
+        except OSError:
+            return  # no matrix built, or a rebuild is mid-swap; keep what is loaded
+        # A rebuild writes a new manifest file, so its inode changes even within one mtime tick
+        signature = (stat.st_ino, stat.st_mtime_ns)
+        if signature == self._manifest_signature:
+            return
+        try:
+            self._matrix = TravelTimeMatrix(self.directory)
+        except (OSError, ValueError, KeyError) as e:
+            self.load_errors += 1
+            self.last_error = str(e)
+            print(f"Travel-time matrix not loaded from {self.directory}: {e}")
+        else:
+            self.loads += 1
+            print(f"Travel-time matrix loaded: {self._matrix.rows * self._matrix.columns} cells, "
+                  f"{self._matrix.width} facilities, built {self._matrix.built_at}")
+        self._manifest_signature = signature
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the emergency travel-time matrix from a local road network')
+    parser.add_argument('--roads', required=True, help='GeoJSON road network (e.g. an OSM extract)')
+    parser.add_argument('--facilities', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                              '..', 'gauteng_hospitals_data.json'),
+                        help='facility seed file with _id, latitude and longitude')
+    parser.add_argument('--out', default=DEFAULT_MATRIX_DIR)
+    parser.add_argument('--cell-km', type=float, default=DEFAULT_CELL_KM)
+    parser.add_argument('--margin-km', type=float, default=DEFAULT_MARGIN_KM)
+    parser.add_argument('--utc-offset-minutes', type=int, default=DEFAULT_UTC_OFFSET_MINUTES)
+    args = parser.parse_args()
+
+    digest = hashlib.sha1()
+    with open(args.roads, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+
+    road_network = RoadNetwork.from_geojson(args.roads)
+    print(f"Road network: {len(road_network.lats)} nodes, {road_network.edges} directed edges")
+    built = build_matrix(
+        road_network, load_facilities(args.facilities), args.out, args.cell_km, args.margin_km,
+        args.utc_offset_minutes, source={'roads': os.path.basename(args.roads), 'sha1': digest.hexdigest()}
+    )
+    print(f"✅ Travel-time matrix written to {args.out} "
+          f"({built['grid']['rows'] * built['grid']['columns']} cells x {len(built['facility_ids'])} facilities)")
@@ -0,0 +1,158 @@
+"""
+Compiled Triage Rules Engine
+Matches free-text symptoms against a clinical phrase table in a single pass
+and derives urgency, priority and department for the triage endpoint
+"""
+
+import json
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'triage_rules.json')
+
+
+class PhraseAutomaton:
+    """
+    Aho-Corasick automaton over lowercase phrases.
+    Reports every phrase occurring in the text, overlapping ones included
+    (e.g. both 'chest pain' and 'chest'), in time linear in the text length
+    regardless of how many phrases the table holds.
+    """
+
+    def __init__(self, phrases: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+        self.phrases: List[str] = []
+
+        for phrase in phrases:
+            self._add(phrase.lower())
+        self._link()
+
+    def _add(self, phrase: str):
+        state = 0
+        for char in phrase:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state] = self._output[state] + (len(self.phrases),)
+        self.phrases.append(phrase)
+
+    def _link(self):
+        """Breadth-first pass setting failure links and merging outputs"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> set:
+        """Indices of every phrase that occurs in text"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        matched = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                matched.update(output[state])
+        return matched
+
+
+@dataclass(frozen=True)
+class TriageDecision:
+    urgency: str
+    priority_score: int
+    estimated_wait: str
+    department: Dict
+    matched_phrases: Tuple[str, ...]
+
+
+class TriageRulesEngine:
+    """Rule table compiled once into a PhraseAutomaton; assess() is one pass over the text"""
+
+    def __init__(self, rules_table: Dict):
+        self.version = rules_table.get('version')
+        self.urgency_levels = rules_table['urgency_levels']
+        self.default_urgency = rules_table['default_urgency']
+        self.severity_urgency = rules_table.get('severity_urgency', {})
+        self.elderly_age = rules_table.get('elderly_age')
+        self.elderly_urgency = rules_table.get('elderly_urgency')
+        self.pediatric_age = rules_table.get('pediatric_age')
+        self.pediatric_department = rules_table.get('pediatric_department')
+        self.departments = rules_table['departments']
+        self.default_department = rules_table['default_department']
+
+        # Lower number wins when several department rules match
+        precedence = rules_table.get('department_precedence', [])
+        self.department_rank = {dept_id: rank for rank, dept_id in enumerate(precedence)}
+
+        rules = rules_table['rules']
+        for rule in rules:
+            if rule.get('urgency') and rule['urgency'] not in self.urgency_levels:
+                raise ValueError(f"Unknown urgency '{rule['urgency']}' for phrase '{rule['phrase']}'")
+            if rule.get('department') and rule['department'] not in self.departments:
+                raise ValueError(f"Unknown department '{rule['department']}' for phrase '{rule['phrase']}'")
+
+        self.rules = rules
+        self.automaton = PhraseAutomaton(rule['phrase'] for rule in rules)
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_RULES_PATH) -> 'TriageRulesEngine':
+        with open(path, 'r') as f:
+            return cls(json.load(f))
+
+    def _rank(self, urgency: str) -> int:
+        return self.urgency_levels[urgency]['rank']
+
+    def _department(self, dept_id: str) -> Dict:
+        return {'id': dept_id, **self.departments[dept_id]}
+
+    def assess(self, symptoms: str, severity: Optional[str], age: int) -> TriageDecision:
+        matched = sorted(self.automaton.find(symptoms.lower()))
+        matched_rules = [self.rules[index] for index in matched]
+
+        # Urgency: the highest level reached by severity, matched phrases or age
+        candidates = [self.default_urgency]
+        if severity in self.severity_urgency:
+            candidates.append(self.severity_urgency[severity])
+        candidates.extend(rule['urgency'] for rule in matched_rules if rule.get('urgency'))
+        if self.elderly_age is not None and age > self.elderly_age:
+            candidates.append(self.elderly_urgency)
+        urgency = max(candidates, key=self._rank)
+        level = self.urgency_levels[urgency]
+
+        # Department: symptom-specific rules, then pediatrics, then the urgency default
+        matched_departments = [rule['department'] for rule in matched_rules if rule.get('department')]
+        if matched_departments:
+            dept_id = min(matched_departments, key=lambda d: self.department_rank.get(d, len(self.department_rank)))
+        elif self.pediatric_age is not None and age < self.pediatric_age:
+            dept_id = self.pediatric_department
+        else:
+            dept_id = level.get('department', self.default_department)
+
+        return TriageDecision(
+            urgency=urgency,
+            priority_score=level['priority_score'],
+            estimated_wait=level['estimated_wait'],
+            department=self._department(dept_id),
+            matched_phrases=tuple(self.automaton.phrases[index] for index in matched)
+        )
@@ -0,0 +1,256 @@
+"""
+Write-behind Buffer for MedRoute Append-only Collections
+Queues documents in process and flushes them to MongoDB with
+insert_many(ordered=False), spilling to a local file when Atlas is unreachable
+"""
+
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, one server process per spill file
+    fcntl = None
+
+DUPLICATE_KEY = 11000
+
+
+@contextmanager
+def _file_lock(path: str, blocking: bool = True):
+    """
+    Advisory lock shared by every process using the same spill file, since
+    prefork workers inherit one spill_path. Yields False if non-blocking
+    and another process holds it.
+    """
+    if fcntl is None:
+        yield True
+        return
+
+    with open(path, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class WriteBehindBuffer:
+    """
+    Bounded queue of documents for one collection.
+    A background thread flushes when max_batch_size documents are waiting or
+    flush_interval seconds have passed, whichever comes first. When the queue
+    is full, put() waits up to enqueue_timeout before spilling (or dropping);
+    on an event loop, try put_nowait() and only hand put() to a thread if
+    that fails.
+    """
+
+    def __init__(self, db, collection_name: str, max_batch_size: int = 100,
+                 flush_interval: float = 1.0, max_queue_size: int = 10000,
+                 enqueue_timeout: float = 0.05, spill_path: Optional[str] = None):
+        self.db = db
+        self.collection_name = collection_name
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.spill_path = spill_path
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._thread = None
+
+        # Metrics
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.flush_errors = 0
+        self.backpressure_waits = 0
+        self.last_flush_at = None
+        self.last_error = None
+
+    def start(self):
+        """Start the background flusher (safe to call more than once)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f'write-behind-{self.collection_name}', daemon=True
+        )
+        self._thread.start()
+
+    def put_nowait(self, document: Dict) -> bool:
+        """Queue a document if there is room right now; never blocks (for event loops)"""
+        # Assign the _id up front so retries and spill replays stay idempotent
+        document.setdefault('_id', ObjectId())
+
+        try:
+            self._queue.put_nowait(document)
+        except queue.Full:
+            return False
+        self.enqueued += 1
+        return True
+
+    def put(self, document: Dict) -> bool:
+        """Queue a document for insertion; returns False if it had to be spilled or dropped"""
+        if self.put_nowait(document):
+            return True
+
+        self.backpressure_waits += 1
+        try:
+            self._queue.put(document, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._overflow([document])
+            return False
+
+        self.enqueued += 1
+        return True
+
+    def flush(self):
+        """Write everything currently queued"""
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self, timeout: float = 10.0):
+        """Stop the flusher and write out whatever is still queued"""
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            'collection': self.collection_name,
+            'queue_depth': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'spilled': self.spilled,
+            'replayed': self.replayed,
+            'flush_errors': self.flush_errors,
+            'backpressure_waits': self.backpressure_waits,
+            'last_flush_at': self.last_flush_at,
+            'last_error': self.last_error
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._drain(block=True)
+            if batch:
+                self._write(batch)
+
+    def _drain(self, block: bool) -> List[Dict]:
+        """Collect up to max_batch_size documents, waiting at most flush_interval"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if block and remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _write(self, batch: List[Dict]):
+        with self._write_lock:
+            try:
+                result = self.db.get_collection(self.collection_name).insert_many(batch, ordered=False)
+                self.written += len(result.inserted_ids)
+            except BulkWriteError as e:
+                # Duplicate keys mean an earlier attempt already landed
+                errors = e.details.get('writeErrors', [])
+                failed = [batch[error['index']] for error in errors if error.get('code') != DUPLICATE_KEY]
+                self.written += len(batch) - len(failed)
+                if failed:
+                    self.flush_errors += 1
+                    self.last_error = str(errors[0].get('errmsg'))
+                    print(f"Error writing {len(failed)} {self.collection_name} documents: {self.last_error}")
+                    self._overflow(failed)
+            except PyMongoError as e:
+                self.flush_errors += 1
+                self.last_error = str(e)
+                print(f"Error flushing {self.collection_name} write-behind buffer: {e}")
+                self._overflow(batch)
+                return
+
+            self.last_flush_at = time.time()
+            self._replay_spill()
+
+    def _overflow(self, documents: List[Dict]):
+        """Spill documents to the local append-only file, or count them as dropped"""
+        if not documents:
+            return
+        if not self.spill_path:
+            self.dropped += len(documents)
+            return
+
+        try:
+            with self._spill_lock, _file_lock(self.spill_path + '.lock'), open(self.spill_path, 'a') as f:
+                for document in documents:
+                    f.write(json_util.dumps(document) + '\n')
+            self.spilled += len(documents)
+        except OSError as e:
+            print(f"Error spilling {self.collection_name} documents to {self.spill_path}: {e}")
+            self.dropped += len(documents)
+
+    def _replay_spill(self):
+        """After a successful flush, push anything spilled while Atlas was unreachable"""
+        if not self.spill_path:
+            return
+
+        # Only one process replays at a time; the others keep appending to the spill file
+        with _file_lock(self.spill_path + '.replay.lock', blocking=False) as acquired:
+            if acquired:
+                self._replay_spill_file()
+
+    def _replay_spill_file(self):
+        # A leftover .replaying file means a previous replay was interrupted; finish it first
+        replay_path = self.spill_path + '.replaying'
+        with self._spill_lock, _file_lock(self.spill_path + '.lock'):
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, replay_path)
+
+        with open(replay_path, 'r') as f:
+            documents = [json_util.loads(line) for line in f if line.strip()]
+
+        collection = self.db.get_collection(self.collection_name)
+        for start in range(0, len(documents), self.max_batch_size):
+            batch = documents[start:start + self.max_batch_size]
+            try:
+                collection.insert_many(batch, ordered=False)
+                self.replayed += len(batch)
+            except BulkWriteError as e:
+                errors = e.details.get('writeErrors', [])
+                failed = [batch[error['index']] for error in errors if error.get('code') != DUPLICATE_KEY]
+                self.replayed += len(batch) - len(failed)
+                self._overflow(failed)
+            except PyMongoError as e:
+                print(f"Error replaying {self.collection_name} spill file: {e}")
+                self._overflow(documents[start:])
+                break
+
+        os.remove(replay_path)
@@ -367,6 +367,7 @@ class GautengHospitalsGenerator:
                 'established_date': self._generate_establishment_date(),
                 'latitude': hospital['lat'],
                 'longitude': hospital['lng'],
+                'location': {'type': 'Point', 'coordinates': [hospital['lng'], hospital['lat']]},  # GeoJSON for 2dsphere
                 'specialties': hospital['specialties'],
                 'rating': round(3.5 + random.random() * 1.5, 1),  # 3.5-5.0 rating
                 'emergency_level': self._determine_emergency_level(hospital['type'], hospital['level']),
@@ -21,8 +21,8 @@ def initialize_database():
     
     print("✅ Collections dropped, creating fresh database...")
     
-    # Create indexes
-    db.create_indexes()
+    # Create indexes (the collections were just dropped, so re-apply every migration)
+    db.create_indexes(force=True)
     
     print("✅ Database initialization complete")
     return True
@@ -19,6 +19,7 @@ export const CapacityReport = ({ capacityData }) => {
   };
 
   const getUtilizationBarColor = (rate) => {
+    if (rate == null) return 'bg-gray-400';
     if (rate >= 90) return 'bg-red-500';
     if (rate >= 75) return 'bg-orange-500';
     if (rate >= 50) return 'bg-yellow-500';
@@ -26,6 +27,7 @@ export const CapacityReport = ({ capacityData }) => {
   };
 
   const getSlotsColor = (slots) => {
+    if (slots == null) return 'text-gray-500';
     if (slots <= 2) return 'text-red-600';
     if (slots <= 5) return 'text-orange-600';
     if (slots <= 10) return 'text-yellow-600';
@@ -51,6 +53,7 @@ export const CapacityReport = ({ capacityData }) => {
                 info.status === 'CRITICAL' ? 'bg-red-100 text-red-700' :
                 info.status === 'HIGH' ? 'bg-orange-100 text-orange-700' :
                 info.status === 'MODERATE' ? 'bg-yellow-100 text-yellow-700' :
+                info.status === 'UNKNOWN' ? 'bg-gray-100 text-gray-700' :
                 'bg-green-100 text-green-700'
               }`}>
                 {info.status}
@@ -61,12 +64,14 @@ export const CapacityReport = ({ capacityData }) => {
             <div className="mb-3">
               <div className="flex justify-between items-center mb-1">
                 <span className="text-sm text-gray-600">Utilization</span>
-                <span className="text-sm font-medium">{info.utilization_rate}%</span>
+                <span className="text-sm font-medium">
+                  {info.utilization_rate == null ? 'Unknown' : `${info.utilization_rate}%`}
+                </span>
               </div>
               <div className="w-full bg-gray-200 rounded-full h-3 overflow-hidden">
                 <div 
                   className={`h-3 rounded-full transition-all duration-1000 ${getUtilizationBarColor(info.utilization_rate)}`}
-                  style={{ width: `${info.utilization_rate}%` }}
+                  style={{ width: `${info.utilization_rate || 0}%` }}
                 ></div>
               </div>
             </div>
@@ -75,7 +80,7 @@ export const CapacityReport = ({ capacityData }) => {
             <div className="flex justify-between items-center text-sm">
               <span className="text-gray-600">Available slots</span>
               <span className={`font-semibold ${getSlotsColor(info.available_slots)}`}>
-                {info.available_slots}
+                {info.available_slots == null ? 'Unknown' : info.available_slots}
               </span>
             </div>
             
@@ -84,10 +89,10 @@ export const CapacityReport = ({ capacityData }) => {
               {info.utilization_rate >= 90 && (
                 <div className="text-red-600 font-medium">⚠️ Near capacity - consider overflow protocols</div>
               )}
-              {info.utilization_rate < 30 && (
+              {info.utilization_rate != null && info.utilization_rate < 30 && (
                 <div className="text-blue-600">💡 Low utilization - capacity available</div>
               )}
-              {info.available_slots <= 2 && info.status !== 'CRITICAL' && (
+              {info.available_slots != null && info.available_slots <= 2 && info.status !== 'CRITICAL' && (
                 <div className="text-orange-600 font-medium">Limited slots remaining</div>
               )}
             </div>
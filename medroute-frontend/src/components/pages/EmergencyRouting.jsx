@@ -93,10 +93,10 @@ export const EmergencyRouting = ({ onNavigate }) => {
 
   const getCapacityStatus = (hospital) => {
     const emergencyCapacity = hospital.currentCapacity?.emergency;
-    if (!emergencyCapacity) return { status: 'Unknown', color: 'gray' };
+    if (!emergencyCapacity || emergencyCapacity.status === 'UNKNOWN') return { status: 'Unknown', color: 'gray' };
     
-    const available = emergencyCapacity.available || 0;
-    const total = emergencyCapacity.total || 1;
+    const available = emergencyCapacity.available;
+    const total = emergencyCapacity.total;
     const utilizationRate = ((total - available) / total) * 100;
     
     if (utilizationRate >= 95) return { status: 'Critical', color: 'red' };
@@ -272,13 +272,15 @@ export const EmergencyRouting = ({ onNavigate }) => {
                   <div>
                     <div className="text-sm text-gray-600">Current Wait</div>
                     <div className="font-semibold">
-                      {hospital.currentCapacity?.emergency?.waitTime || 'Unknown'} minutes
+                      {hospital.currentCapacity?.emergency?.waitTime != null
+                        ? `${hospital.currentCapacity.emergency.waitTime} minutes`
+                        : 'Unknown'}
                     </div>
                   </div>
                   <div>
                     <div className="text-sm text-gray-600">Available Beds</div>
                     <div className="font-semibold flex items-center space-x-1">
-                      <span>{hospital.currentCapacity?.emergency?.available || 0}</span>
+                      <span>{hospital.currentCapacity?.emergency?.available ?? 'Unknown'}</span>
                       <Users className="w-4 h-4 text-gray-400" />
                     </div>
                   </div>
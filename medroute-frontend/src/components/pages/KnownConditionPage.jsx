@@ -152,7 +152,7 @@ export const KnownConditionPage = ({ onNavigate }) => {
     if (!capacity) return 'N/A';
     
     const relevantDept = capacity.general || capacity.emergency || Object.values(capacity)[0];
-    return relevantDept?.available !== undefined ? `${relevantDept.available} slots` : 'N/A';
+    return relevantDept?.available != null ? `${relevantDept.available} slots` : 'N/A';
   };
 
   const getStatus = (hospital) => {
@@ -1,8 +1,47 @@
 // src/context/DashboardContext.jsx
-import React, { createContext, useContext, useState, useEffect } from 'react';
+import React, { createContext, useContext, useState, useEffect, useRef } from 'react';
+import { hospitalRouter } from '../services/hospitalRoutingService';
 
 const DashboardContext = createContext();
 
+// Specialties shown in the capacity report
+const REPORTED_SPECIALTIES = new Set(['emergency', 'cardiology', 'general', 'pediatrics']);
+
+// Same thresholds the API uses for a department's Status
+const capacityStatus = (utilization) => {
+  if (utilization >= 95) return 'CRITICAL';
+  if (utilization >= 85) return 'HIGH';
+  if (utilization >= 65) return 'MODERATE';
+  return 'LOW';
+};
+
+// System-wide figures for one specialty, summed over every facility's
+// departments whose bed counts are actually known
+const aggregateSpecialty = (facilityRows, specialty) => {
+  let available = 0;
+  let total = 0;
+  Object.values(facilityRows).forEach(rows => {
+    Object.values(rows).forEach(row => {
+      if (row.Specialty !== specialty || row.Status === 'UNKNOWN' ||
+          row.Current_beds_available == null || !row.Total_beds) {
+        return;
+      }
+      available += row.Current_beds_available;
+      total += row.Total_beds;
+    });
+  });
+
+  if (total === 0) {
+    return { utilization_rate: null, status: 'UNKNOWN', available_slots: null };
+  }
+  const utilization = Math.round(((total - available) / total) * 1000) / 10;
+  return {
+    utilization_rate: utilization,
+    status: capacityStatus(utilization),
+    available_slots: available
+  };
+};
+
 export const useDashboard = () => {
   const context = useContext(DashboardContext);
   if (!context) {
@@ -66,6 +105,10 @@ export const DashboardProvider = ({ children }) => {
 
   const [loading, setLoading] = useState(false);
 
+  // Latest department rows per facility from the capacity stream:
+  // { facilityId: { Department_name: row } }
+  const facilityRowsRef = useRef({});
+
   // Function to refresh dashboard data (simulate real-time updates)
   const refreshDashboard = async () => {
     setLoading(true);
@@ -103,14 +146,36 @@ export const DashboardProvider = ({ children }) => {
     }));
   };
 
-  // Auto-refresh every 5 minutes (simulated)
+  // Live department capacity pushed by the API instead of periodic refreshes
   useEffect(() => {
-    const interval = setInterval(() => {
-      // In a real app, you might want to refresh data periodically
-      // refreshDashboard();
-    }, 5 * 60 * 1000); // 5 minutes
+    const unsubscribe = hospitalRouter.subscribeToCapacity(null, (facilityId, capacity, department, rows) => {
+      const facilityRows = facilityRowsRef.current;
+      const changed = new Set();
+
+      if (rows) {
+        // A snapshot replaces everything held for the facility
+        Object.values(facilityRows[facilityId] || {}).forEach(row => changed.add(row.Specialty));
+        facilityRows[facilityId] = {};
+        rows.forEach(row => {
+          facilityRows[facilityId][row.Department_name] = row;
+          changed.add(row.Specialty);
+        });
+      } else if (department) {
+        facilityRows[facilityId] = {
+          ...facilityRows[facilityId],
+          [department.Department_name]: department
+        };
+        changed.add(department.Specialty);
+      }
+
+      changed.forEach(specialty => {
+        if (REPORTED_SPECIALTIES.has(specialty)) {
+          updateDepartmentCapacity(specialty, aggregateSpecialty(facilityRows, specialty));
+        }
+      });
+    });
 
-    return () => clearInterval(interval);
+    return unsubscribe;
   }, []);
 
   const value = {
@@ -74,6 +74,41 @@ export const appointmentService = {
     }
   },
 
+  // Get one page of appointments; pass nextCursor back to fetch the following page
+  getAppointmentsPage: async (filters = {}, { cursor = null, limit = 200, fields = null } = {}) => {
+    try {
+      const params = new URLSearchParams();
+      
+      ['department', 'doctor', 'status'].forEach(key => {
+        if (filters[key] && filters[key] !== 'all') {
+          params.append(key, filters[key]);
+        }
+      });
+      if (filters.dateFrom) {
+        params.append('date_from', filters.dateFrom);
+      }
+      if (filters.dateTo) {
+        params.append('date_to', filters.dateTo);
+      }
+      params.append('limit', limit);
+      if (cursor) {
+        params.append('cursor', cursor);
+      }
+      if (fields) {
+        params.append('fields', fields.join(','));
+      }
+      
+      const response = await api.get(`/appointments?${params.toString()}`);
+      return {
+        appointments: response.data,
+        nextCursor: response.headers['x-next-cursor'] || null
+      };
+    } catch (error) {
+      console.error('Error fetching appointments page:', error);
+      throw error;
+    }
+  },
+
   // Create new appointment
   createAppointment: async (appointmentData) => {
     try {
@@ -202,6 +237,18 @@ export const emergencyService = {
       console.error('Error fetching facility capacity:', error);
       throw error;
     }
+  },
+
+  // Get capacity for many facilities in one request, keyed by facility ID
+  getBulkCapacity: async (facilityIds = null) => {
+    try {
+      const params = facilityIds ? { facility_ids: facilityIds.join(',') } : {};
+      const response = await api.get('/capacity', { params });
+      return response.data;
+    } catch (error) {
+      console.error('Error fetching bulk capacity:', error);
+      throw error;
+    }
   }
 };
 
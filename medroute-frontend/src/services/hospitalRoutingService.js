@@ -134,7 +134,7 @@ export class HospitalRoutingService {
     }
   }
 
-  // Batched capacity fetching to reduce API calls
+  // Bulk capacity fetching - one request for all uncached facilities
   async fetchMultipleCapacities(facilityIds) {
     const capacityData = {};
     const uncachedIds = [];
@@ -151,79 +151,36 @@ export class HospitalRoutingService {
       }
     });
     
-    // Fetch uncached data in controlled batches
     if (uncachedIds.length > 0) {
-      const batchSize = 5;
-      const batches = [];
-      
-      for (let i = 0; i < uncachedIds.length; i += batchSize) {
-        batches.push(uncachedIds.slice(i, i + batchSize));
-      }
-      
-      // Process batches concurrently but with limit
-      const batchPromises = batches.map(batch => this.fetchCapacityBatch(batch));
-      const batchResults = await Promise.allSettled(batchPromises);
-      
-      // Merge results
-      batchResults.forEach((result, index) => {
-        if (result.status === 'fulfilled') {
-          Object.assign(capacityData, result.value);
-        } else {
-          // Add default capacity for failed batch
-          batches[index].forEach(id => {
-            capacityData[id] = this.getDefaultCapacity();
+      try {
+        const ids = uncachedIds.map(id => encodeURIComponent(id)).join(',');
+        const bulkData = await this.makeRequest(`${this.apiBaseUrl}/capacity?facility_ids=${ids}`);
+        
+        uncachedIds.forEach(id => {
+          const formattedCapacity = this.formatCapacityRows(bulkData[id]);
+          this.capacityCache.set(this.getCacheKey('capacity', id), {
+            data: formattedCapacity,
+            timestamp: Date.now()
           });
-        }
-      });
+          capacityData[id] = formattedCapacity;
+        });
+      } catch (error) {
+        console.error('Error fetching bulk capacity:', error);
+        uncachedIds.forEach(id => {
+          capacityData[id] = this.getDefaultCapacity();
+        });
+      }
     }
     
     return capacityData;
   }
 
-  async fetchCapacityBatch(facilityIds) {
-    const promises = facilityIds.map(id => this.fetchSingleCapacity(id));
-    const results = await Promise.allSettled(promises);
-    
-    const batchData = {};
-    results.forEach((result, index) => {
-      const facilityId = facilityIds[index];
-      if (result.status === 'fulfilled') {
-        batchData[facilityId] = result.value;
-      } else {
-        batchData[facilityId] = this.getDefaultCapacity();
-      }
-    });
-    
-    return batchData;
-  }
-
   async fetchSingleCapacity(facilityId) {
     const cacheKey = this.getCacheKey('capacity', facilityId);
     
     try {
       const capacityData = await this.makeRequest(`${this.apiBaseUrl}/facilities/${facilityId}/capacity`);
-      
-      // Transform the response
-      const formattedCapacity = {};
-      if (Array.isArray(capacityData)) {
-        capacityData.forEach(dept => {
-          const specialtyName = this.mapDepartmentToSpecialty(dept.Department_name || dept.Specialty);
-          formattedCapacity[specialtyName] = {
-            available: dept.Current_beds_available || 0,
-            total: dept.Total_beds || dept.Capacity_beds || 20,
-            waitTime: dept.Wait_time_minutes || this.calculateWaitTime(dept.Current_patients, dept.Current_doctors_on_duty),
-            status: dept.Status || this.getCapacityStatus(dept.Current_beds_available, dept.Total_beds)
-          };
-        });
-      }
-      
-      // Ensure we have at least emergency and general
-      if (!formattedCapacity.emergency) {
-        formattedCapacity.emergency = { available: 5, total: 15, waitTime: 45, status: 'MODERATE' };
-      }
-      if (!formattedCapacity.general) {
-        formattedCapacity.general = { available: 10, total: 25, waitTime: 90, status: 'MODERATE' };
-      }
+      const formattedCapacity = this.formatCapacityRows(capacityData);
       
       // Cache the result
       this.capacityCache.set(cacheKey, {
@@ -238,6 +195,117 @@ export class HospitalRoutingService {
     }
   }
 
+  // Transform department capacity rows into a specialty keyed map. Departments
+  // the API has no numbers for (Status 'UNKNOWN', null counts) stay unknown
+  // rather than being read as zero, and missing departments stay missing.
+  formatCapacityRows(capacityRows) {
+    const formattedCapacity = {};
+    if (Array.isArray(capacityRows)) {
+      capacityRows.forEach(dept => {
+        const specialtyName = this.mapDepartmentToSpecialty(dept.Department_name || dept.Specialty);
+        formattedCapacity[specialtyName] = this.formatDepartmentCapacity(dept);
+      });
+    }
+    
+    return formattedCapacity;
+  }
+
+  formatDepartmentCapacity(dept) {
+    const available = dept.Current_beds_available;
+    const total = dept.Total_beds ?? dept.Capacity_beds;
+    if (dept.Status === 'UNKNOWN' || available == null || !total) {
+      return { available: null, total: null, waitTime: null, status: 'UNKNOWN' };
+    }
+    
+    let waitTime = dept.Wait_time_minutes;
+    if (waitTime == null && dept.Current_patients != null && dept.Current_doctors_on_duty != null) {
+      waitTime = this.calculateWaitTime(dept.Current_patients, dept.Current_doctors_on_duty);
+    }
+    
+    return {
+      available,
+      total,
+      waitTime: waitTime ?? null,
+      status: dept.Status || this.getCapacityStatus(available, total)
+    };
+  }
+
+  // Live capacity over Server-Sent Events; keeps the capacity cache warm.
+  // onUpdate(facilityId, capacity, department, rows) fires for the initial
+  // snapshot (department null, rows holding every department of the facility)
+  // and for every changed department (rows null). Returns a function that
+  // closes the stream.
+  subscribeToCapacity(facilityIds, onUpdate) {
+    if (typeof EventSource === 'undefined') {
+      return () => {};
+    }
+    
+    const params = facilityIds && facilityIds.length > 0
+      ? [`facility_ids=${facilityIds.map(id => encodeURIComponent(id)).join(',')}`]
+      : [];
+    let source = null;
+    let lastEventId = null;
+    let retryTimer = null;
+    let closed = false;
+    
+    const connect = () => {
+      const query = lastEventId ? [...params, `lastEventId=${encodeURIComponent(lastEventId)}`] : params;
+      source = new EventSource(`${this.apiBaseUrl}/capacity/stream${query.length ? `?${query.join('&')}` : ''}`);
+      source.addEventListener('snapshot', onSnapshot);
+      source.addEventListener('capacity', onCapacity);
+      source.onerror = onError;
+    };
+    
+    const onSnapshot = (event) => {
+      lastEventId = event.lastEventId || lastEventId;
+      const snapshot = JSON.parse(event.data);
+      Object.keys(snapshot).forEach(facilityId => {
+        const formattedCapacity = this.formatCapacityRows(snapshot[facilityId]);
+        this.capacityCache.set(this.getCacheKey('capacity', facilityId), {
+          data: formattedCapacity,
+          timestamp: Date.now()
+        });
+        onUpdate(facilityId, formattedCapacity, null, snapshot[facilityId]);
+      });
+    };
+    
+    const onCapacity = (event) => {
+      lastEventId = event.lastEventId || lastEventId;
+      const { facility_id: facilityId, department } = JSON.parse(event.data);
+      const cacheKey = this.getCacheKey('capacity', facilityId);
+      const cached = this.capacityCache.get(cacheKey);
+      
+      // Merge only the changed department into what we already hold for the facility
+      const specialty = this.mapDepartmentToSpecialty(department.Department_name || department.Specialty);
+      const formattedCapacity = {
+        ...(cached ? cached.data : {}),
+        [specialty]: this.formatDepartmentCapacity(department)
+      };
+      
+      this.capacityCache.set(cacheKey, { data: formattedCapacity, timestamp: Date.now() });
+      onUpdate(facilityId, formattedCapacity, department);
+    };
+    
+    const onError = () => {
+      // EventSource reconnects on its own after a dropped connection and resumes
+      // from the last event ID, but gives up on an error response (503 when the
+      // server is at its stream limit), so retry that one ourselves
+      if (source.readyState === EventSource.CLOSED && !closed) {
+        console.warn('Capacity stream refused, retrying in 5s...');
+        retryTimer = setTimeout(connect, 5000);
+      } else {
+        console.warn('Capacity stream interrupted, reconnecting...');
+      }
+    };
+    
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      source.close();
+    };
+  }
+
   // Optimized nearby hospitals with distance calculation and caching
   async fetchNearbyHospitals(userLocation, maxDistance = 50) {
     const locationKey = this.getCacheKey('location', userLocation.lat.toFixed(3), userLocation.lng.toFixed(3), maxDistance);
@@ -463,10 +531,12 @@ export class HospitalRoutingService {
 
     // Capacity factor
     const specialtyCapacity = hospital.currentCapacity[requiredSpecialty] || hospital.currentCapacity.general;
-    if (specialtyCapacity) {
+    if (specialtyCapacity && specialtyCapacity.status !== 'UNKNOWN') {
       const availabilityRatio = specialtyCapacity.available / specialtyCapacity.total;
       score += availabilityRatio * 20;
-      score -= Math.min(specialtyCapacity.waitTime / 5, 20);
+      if (specialtyCapacity.waitTime != null) {
+        score -= Math.min(specialtyCapacity.waitTime / 5, 20);
+      }
       
       const statusBonus = { 'LOW': 0, 'MODERATE': -5, 'HIGH': -15, 'CRITICAL': -30 };
       score += statusBonus[specialtyCapacity.status] || 0;
@@ -26,7 +26,8 @@ export const getCapacityColor = (status) => {
     'CRITICAL': 'text-red-600 bg-red-100 border-red-200',
     'HIGH': 'text-orange-600 bg-orange-100 border-orange-200',
     'MODERATE': 'text-yellow-600 bg-yellow-100 border-yellow-200',
-    'LOW': 'text-green-600 bg-green-100 border-green-200'
+    'LOW': 'text-green-600 bg-green-100 border-green-200',
+    'UNKNOWN': 'text-gray-600 bg-gray-100 border-gray-200'
   };
   return colors[status] || colors.MODERATE;
 };
@@ -103,6 +103,7 @@ class MinimalGautengHospitalsGenerator:
                 'Phone': hospital['phone'],
                 'latitude': hospital['lat'],
                 'longitude': hospital['lng'],
+                'location': {'type': 'Point', 'coordinates': [hospital['lng'], hospital['lat']]},  # GeoJSON for 2dsphere
                 'specialties': hospital['specialties'],
                 'has_emergency': 'Emergency' in hospital['specialties'],
                 'rating': round(3.5 + random.random() * 1.5, 1)
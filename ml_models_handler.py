@@ -7,9 +7,22 @@ import os
 import json
 import pickle
 import numpy as np
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
+try:
+    from metrics import ML_INFERENCE_DURATION
+except ImportError:
+    # Inference timings are only exported when running alongside the API server's metrics module
+    ML_INFERENCE_DURATION = None
+
+def inference_timer(model_name: str):
+    """Time a model call into medroute_ml_inference_seconds when metrics are available"""
+    if ML_INFERENCE_DURATION is None:
+        return nullcontext()
+    return ML_INFERENCE_DURATION.time(model=model_name)
+
 class MLModelsHandler:
     def __init__(self):
         self.symptom_model = None
@@ -161,8 +174,9 @@ class MLModelsHandler:
         final_features = list(continuous_features) + features[4:]
         
         # Make prediction
-        prediction = self.symptom_model.predict([final_features])[0]
-        prediction_proba = self.symptom_model.predict_proba([final_features])[0]
+        with inference_timer('symptom'):
+            prediction = self.symptom_model.predict([final_features])[0]
+            prediction_proba = self.symptom_model.predict_proba([final_features])[0]
         
         return {
             'condition_positive': bool(prediction),
@@ -227,7 +241,8 @@ class MLModelsHandler:
         stay_features = self._prepare_stay_length_features(patient_data, symptom_analysis)
         
         if self.stay_length_model:
-            predicted_hours = self.stay_length_model.predict([stay_features])[0]
+            with inference_timer('stay_length'):
+                predicted_hours = self.stay_length_model.predict([stay_features])[0]
             
             return {
                 'predicted_stay_hours': float(predicted_hours),
@@ -107,5 +107,5 @@ class MedRouteMLMongoDB:
         """Update department capacity"""
         self.db.get_collection('department_capacity').update_one(
             {"Department_ID": department_id},
-            {"$set": capacity_updates}
+            {"$set": {**capacity_updates, "Last_updated": datetime.utcnow()}}
         )
\ No newline at end of file
@@ -4,11 +4,13 @@ Uses MongoDB Atlas with production-scale data
 """
 
 from cloud_medroute_db import CloudMedRouteDB as MedRouteDB
+from write_behind import WriteBehindBuffer
 from ml_models_handler import MLModelsHandler
 from complete_medroute_scheduler import MedRouteScheduler, SchedulingRequest, UrgencyLevel, AppointmentType
 from datetime import datetime, timedelta
 import json
 import random
+import atexit
 
 class ProductionMedRouteSystem:
     """
@@ -19,6 +21,12 @@ class ProductionMedRouteSystem:
         self.db = MedRouteDB()
         self.ml_handler = MLModelsHandler()
         self.scheduler = MedRouteScheduler()
+        
+        # Triage results are analytics data; batch them instead of one majority write per patient
+        self.triage_writer = WriteBehindBuffer(self.db, 'triage_results', spill_path='triage_results.spill.ndjson')
+        self.triage_writer.start()
+        atexit.register(self.triage_writer.close)
+        
         self._verify_data_availability()
         print("Production MedRoute System initialized")
     
@@ -179,8 +187,8 @@ class ProductionMedRouteSystem:
                 'processed_by': 'automated_triage_system'
             }
             
-            # Store in a triage_results collection for analytics
-            self.db.get_collection('triage_results').insert_one(triage_record)
+            # Queue for the triage_results collection (flushed in batches)
+            self.triage_writer.put(triage_record)
             
         except Exception as e:
             print(f"Error storing triage result: {e}")
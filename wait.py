@@ -10,6 +10,8 @@ from typing import List, Dict, Optional, Tuple
 import heapq
 from collections import defaultdict
 from cloud_medroute_db import CloudMedRouteDB as MedRouteDB
+from query_budget import query_budget
+from single_flight import SingleFlight
 from ml_models_handler import MLModelsHandler
 import json
 
@@ -61,6 +63,9 @@ class ResourceConstraints:
     equipment_available: bool = True
     current_doctors_on_duty: int = 0
 
+# Dashboards ask for the capacity report all at once; concurrent requests share one build
+capacity_report_flights = SingleFlight()
+
 class MedRouteScheduler:
     def __init__(self):
         self.db = MedRouteDB()
@@ -95,6 +100,7 @@ class MedRouteScheduler:
                 'resource_needs': self._calculate_basic_resource_needs(request)
             }
     
+    @query_budget('MedRouteScheduler.schedule_appointment')
     def schedule_appointment(self, request: SchedulingRequest) -> Dict:
         """Main scheduling algorithm"""
         analysis = self.analyze_scheduling_request(request)
@@ -267,30 +273,36 @@ class MedRouteScheduler:
                 'Department_ID': dept_id,
                 'End_date': None  # Active assignments only
             }))
+            assigned_ids = list(dict.fromkeys(assignment['Doctor_ID'] for assignment in assignments))
+            if not assigned_ids:
+                return []
+            
+            # Doctor records, specializations and workloads for all assigned doctors at once
+            existing_ids = {
+                doctor['_id'] for doctor in
+                self.db.get_collection('doctors').find({'_id': {'$in': assigned_ids}}, {'_id': 1})
+            }
+            
+            specializations = defaultdict(list)
+            for spec in self.db.get_collection('doctor_specializations').find({'Doctor_ID': {'$in': assigned_ids}}):
+                specializations[spec['Doctor_ID']].append(spec['Specialization_ID'])
+            
+            workloads = self._get_current_workloads(assigned_ids)
             
             doctors = []
             for assignment in assignments:
                 doctor_id = assignment['Doctor_ID']
-                
-                # Get doctor details
-                doctor = self.db.get_collection('doctors').find_one({'_id': doctor_id})
-                if not doctor:
+                if doctor_id not in existing_ids:
                     continue
                 
-                # Get specializations
-                specializations = list(self.db.get_collection('doctor_specializations').find({
-                    'Doctor_ID': doctor_id
-                }))
-                spec_ids = [spec['Specialization_ID'] for spec in specializations]
-                
                 # Generate available slots (simplified - in production this would be more complex)
                 available_slots = self._generate_available_slots(doctor_id)
                 
                 doctors.append(DoctorAvailability(
                     doctor_id=doctor_id,
                     available_slots=available_slots,
-                    current_workload=self._get_current_workload(doctor_id),
-                    specializations=spec_ids,
+                    current_workload=workloads.get(doctor_id, 0),
+                    specializations=specializations[doctor_id],
                     department_id=dept_id
                 ))
             
@@ -362,19 +374,25 @@ class MedRouteScheduler:
     
     def _get_current_workload(self, doctor_id: int) -> int:
         """Get current workload for doctor"""
-        # Count active appointments for today
+        return self._get_current_workloads([doctor_id]).get(doctor_id, 0)
+    
+    def _get_current_workloads(self, doctor_ids: List[int]) -> Dict[int, int]:
+        """Today's consultation count per doctor, in one aggregation"""
         today = datetime.now().date()
         tomorrow = today + timedelta(days=1)
         
-        count = self.db.get_collection('medical_consultations').count_documents({
-            'Doctor_ID': doctor_id,
-            'Consultation_Date': {
-                '$gte': datetime.combine(today, datetime.min.time()),
-                '$lt': datetime.combine(tomorrow, datetime.min.time())
-            }
-        })
+        counts = self.db.get_collection('medical_consultations').aggregate([
+            {'$match': {
+                'Doctor_ID': {'$in': doctor_ids},
+                'Consultation_Date': {
+                    '$gte': datetime.combine(today, datetime.min.time()),
+                    '$lt': datetime.combine(tomorrow, datetime.min.time())
+                }
+            }},
+            {'$group': {'_id': '$Doctor_ID', 'count': {'$sum': 1}}}
+        ])
         
-        return count
+        return {row['_id']: row['count'] for row in counts}
     
     def _get_emergency_resources(self, dept_id: int) -> List[Dict]:
         """Get immediately available emergency resources"""
@@ -452,7 +470,7 @@ class MedRouteScheduler:
             # Update department capacity
             self.db.get_collection('department_capacity').update_one(
                 {'Department_ID': slot['department_id']},
-                {'$inc': {'Current_patients': 1}}
+                {'$inc': {'Current_patients': 1}, '$set': {'Last_updated': datetime.utcnow()}}
             )
             
             # Could also update doctor workload, bed allocation, etc.
@@ -561,19 +579,27 @@ class MedRouteScheduler:
         }
         return mapping.get(urgency_string, UrgencyLevel.STANDARD)
     
+    @query_budget('MedRouteScheduler.get_department_capacity_report')
     def get_department_capacity_report(self) -> Dict:
         """Generate real-time capacity report"""
+        report, _ = capacity_report_flights.do(id(self.db), self._build_department_capacity_report)
+        return report
+    
+    def _build_department_capacity_report(self) -> Dict:
         try:
             departments = list(self.db.get_collection('departments').find())
             report = {}
             
+            # Capacity rows for every department in one query
+            capacity_by_department = {}
+            for capacity in self.db.get_collection('department_capacity').find():
+                capacity_by_department.setdefault(capacity['Department_ID'], capacity)
+            
             for dept in departments:
                 dept_id = dept['_id']
                 
                 # Get capacity info
-                capacity = self.db.get_collection('department_capacity').find_one({
-                    'Department_ID': dept_id
-                })
+                capacity = capacity_by_department.get(dept_id)
                 
                 if capacity:
                     utilization_rate = capacity['Current_patients'] / dept['Capacity_beds'] if dept['Capacity_beds'] > 0 else 0